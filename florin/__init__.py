@@ -2,6 +2,8 @@
 
 Classes
 -------
+Async
+    Asynchronous computation overlapping I/O-bound operations.
 Balsam
     Distributed computation using the Balsam job submission database.
 MPI
@@ -10,6 +12,8 @@ Multiprocessing
     Multiprocessing using the standard fork/join model.
 Multithreading
     Multithreading using the Python multithreading library.
+Profiler
+    Collector of per-node and per-pipeline profiling metrics.
 Serial
     Single-core serial deferred computation.
 WorkQueue
@@ -17,40 +21,86 @@ WorkQueue
 
 Functions
 ---------
+batched
+    Mark a function as operating on a whole batch of items.
 bounds_classifier
     Classify connected components based on boundary conditions.
 classify
     Classify connected components into multiple classes.
+classify_batch
+    Classify a batch of connected components at once.
 florinate
     Prepare a function for use in the FLoRIN pipeline.
 join
     Join one or more tiles into a single array.
 load
     Load image data into FLoRIN.
+mpi_join
+    Join tiles computed across MPI ranks into a single array.
 reconstruct
     Create a label array from connected component classification labels.
 save
     Save image data from FLoRIN.
 tile
     Split a single array into sub-arrays.
+
+Notes
+-----
+Names are imported from their submodules the first time they are used, so
+that ``import florin`` stays fast (e.g. for short worker tasks) and pipelines
+or optional dependencies that are not used are never imported. Submodules,
+e.g. ``florin.thresholding``, are also imported on first access.
 """
 
+import importlib
+
+
+# Maps each lazily imported name to the module and attribute it comes from.
+_LAZY = {
+    'Async': ('florin.pipelines.asynchronous', 'AsyncPipeline'),
+    'Balsam': ('florin.pipelines.balsam', 'BalsamPipeline'),
+    'FlorinClassifier': ('florin.classification', 'FlorinClassifier'),
+    'MPI': ('florin.pipelines.mpi', 'MPIPipeline'),
+    'MPITaskQueue': ('florin.pipelines.mpi', 'MPITaskQueuePipeline'),
+    'Multiprocess': ('florin.pipelines.multiprocess',
+                     'MultiprocessingPipeline'),
+    'Multithread': ('florin.pipelines.multithread', 'MultithreadingPipeline'),
+    'PipelineInput': ('florin.pipelines.pipeline', 'PipelineInput'),
+    'Profiler': ('florin.profiling', 'Profiler'),
+    'Serial': ('florin.pipelines.serial', 'SerialPipeline'),
+    'WorkQueue': ('florin.pipelines.workqueue', 'WorkQueuePipeline'),
+    'batched': ('florin.batching', 'batched'),
+    'bounds_classifier': ('florin.classification', 'FlorinClassifier'),
+    'classify': ('florin.classification', 'classify'),
+    'classify_batch': ('florin.classification', 'classify_batch'),
+    'florinate': ('florin.closure', 'florinate'),
+    'join': ('florin.tiling', 'join'),
+    'load': ('florin.io', 'load'),
+    'logger': ('florin.log_utils', 'logger'),
+    'mpi_join': ('florin.pipelines.mpi', 'mpi_join'),
+    'reconstruct': ('florin.reconstruction', 'reconstruct'),
+    'save': ('florin.io', 'save'),
+    'tile': ('florin.tiling', 'tile'),
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module, attr = _LAZY[name]
+        value = getattr(importlib.import_module(module), attr)
+    elif name == 'pipeline_input':
+        value = __getattr__('PipelineInput')()
+    else:
+        try:
+            value = importlib.import_module('{}.{}'.format(__name__, name))
+        except ModuleNotFoundError as e:
+            if e.name != '{}.{}'.format(__name__, name):
+                raise
+            raise AttributeError(
+                'module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
 
-from .log_utils import logger
-
-from .closure import florinate
-from .classification import classify, FlorinClassifier
-from .io import load, save
-from .tiling import tile, join
-from .pipelines.pipeline import PipelineInput
-from .pipelines import BalsamPipeline as Balsam
-from .pipelines import MPIPipeline as MPI
-from .pipelines import MPITaskQueuePipeline as MPITaskQueue
-from .pipelines import MultiprocessingPipeline as Multiprocess
-from .pipelines import MultithreadingPipeline as Multithread
-from .pipelines import SerialPipeline as Serial
-from .pipelines import WorkQueuePipeline as WorkQueue
-from .reconstruction import reconstruct
-
-bounds_classifier = FlorinClassifier
-pipeline_input = PipelineInput()
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | {'pipeline_input'})
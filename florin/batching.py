@@ -0,0 +1,132 @@
+"""Batched execution of operations over many data items.
+
+When a pipeline runs many small items (e.g. tiles or connected components),
+it can group them into batches to cut per-item overhead. Operations marked
+with ``batched`` run once per batch on every item at once. All other
+operations still run once per item.
+
+Classes
+-------
+BatchSizeError
+    Raised when a batched operation returns the wrong number of results.
+
+Functions
+---------
+auto_batch_size
+    Choose a batch size for a number of items and workers.
+batched
+    Mark a function as operating on a whole batch of items.
+batches
+    Group data items into lists.
+"""
+
+import functools
+from itertools import islice
+
+
+class BatchSizeError(ValueError):
+    """Raised when a batched operation returns the wrong number of results."""
+    def __init__(self, name, expected, actual):
+        msg = 'Batched operation {} returned {} results for a batch of {} '
+        msg += 'items.'
+        super(BatchSizeError, self).__init__(
+            msg.format(name, actual, expected))
+
+
+def batched(func=None, stack=False):
+    """Mark a function as operating on a whole batch of items.
+
+    Parameters
+    ----------
+    func : callable
+        The function to mark. It receives a list of values (one per item in
+        the batch) in place of each input produced by the pipeline and must
+        return a sequence with one result per item. Other arguments are
+        passed through unchanged.
+    stack : bool
+        If True, pass each input as a single array, stacking the items along
+        a new first axis, and split the result along its first axis. Items
+        must have the same shape. Default: False.
+
+    Returns
+    -------
+    wrapper : callable
+        A wrapper around ``func`` marked for batch execution. ``func`` itself
+        is left unmarked, so it still runs once per item elsewhere. If
+        ``func`` is florinated, the nodes created by the wrapper are marked
+        instead.
+
+    Examples
+    --------
+    >>> @florinate
+    ... @batched(stack=True)
+    ... def normalize(tiles):
+    ...     return tiles / tiles.max(axis=(1, 2, 3), keepdims=True)
+    """
+    if func is None:
+        return lambda f: batched(f, stack=stack)
+
+    from florin.graph import FlorinNode
+
+    mode = 'stack' if stack else 'list'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if isinstance(result, FlorinNode) and result.operation is \
+                getattr(func, '__wrapped__', None):
+            # Mark the node created by an already florinated wrapper.
+            result.batch = mode
+        return result
+
+    wrapper._florin_batch = mode
+    return wrapper
+
+
+def batches(data, size):
+    """Group data items into lists.
+
+    Parameters
+    ----------
+    data : iterable
+        The items to group.
+    size : int
+        The number of items in each batch. The last batch may be smaller.
+
+    Yields
+    ------
+    batch : list
+    """
+    data = iter(data)
+    while True:
+        batch = list(islice(data, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def auto_batch_size(n=None, workers=1, min_batches=4, max_size=256):
+    """Choose a batch size for a number of items and workers.
+
+    Parameters
+    ----------
+    n : int, optional
+        The number of items, if known.
+    workers : int
+        The number of workers that batches are spread over.
+    min_batches : int
+        The fewest batches to give each worker, so that work stays balanced
+        when items take different amounts of time. Default: 4.
+    max_size : int
+        The largest batch size, to bound the memory held by one batch.
+        Default: 256.
+
+    Returns
+    -------
+    size : int
+        The largest batch size up to ``max_size`` that still gives every
+        worker ``min_batches`` batches, or 32 if ``n`` is unknown.
+    """
+    if n is None:
+        return min(32, max_size)
+    return max(1, min(max_size, n // (max(1, workers) * min_batches)))
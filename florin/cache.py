@@ -0,0 +1,308 @@
+"""Content-addressed caches for the results of pipeline operations.
+
+Results are keyed by the operation that produced them, its arguments, and
+the keys of its inputs, so a result can be reused by any pipeline that runs
+the same operation on the same data, and changing one operation only misses
+the cache for that operation and the ones that depend on it.
+
+Classes
+-------
+DiskCache
+    Cache of results stored as files in a directory.
+MemoryCache
+    In-memory LRU cache of results with a byte budget.
+
+Functions
+---------
+operation_key
+    Compute a key identifying an operation.
+"""
+
+from collections import OrderedDict
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+
+import dill
+import numpy as np
+
+from florin.checkpoint import digest
+
+
+class MemoryCache(object):
+    """In-memory LRU cache of results with a byte budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The most memory, estimated with ``florin.graph.florin_plan.nbytes``,
+        that cached results may hold. The least recently used results are
+        dropped to make room for new ones, and results larger than the budget
+        are not cached. Default: 1 GiB.
+
+    Notes
+    -----
+    The cache is local to a process. Copies sent to other processes (e.g.
+    with the graph of a multiprocessing pipeline) start out empty.
+    """
+
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._results
+
+    def __len__(self):
+        return len(self._results)
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, key):
+        """Look up a cached result.
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        hit : bool
+            True if ``key`` was found.
+        result
+            The cached result, or None if it was not found.
+        """
+        with self._lock:
+            if key not in self._results:
+                return False, None
+            self._results.move_to_end(key)
+            return True, self._results[key][0]
+
+    def put(self, key, result):
+        """Cache a result.
+
+        Parameters
+        ----------
+        key : str
+        result
+        """
+        from florin.graph.florin_plan import nbytes
+
+        size = nbytes(result)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._results:
+                self.nbytes -= self._results.pop(key)[1]
+            self._results[key] = (result, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._results.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        """Remove every cached result."""
+        with self._lock:
+            self._results.clear()
+            self.nbytes = 0
+
+
+class DiskCache(object):
+    """Cache of results stored as files in a directory.
+
+    Arrays are stored in ``.npy`` format, and other results are serialized
+    with dill. Files are written atomically, so processes on the same machine
+    or a shared filesystem can use the same directory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store results in. Created if it does not exist.
+
+    Notes
+    -----
+    Results outlive the code that computed them. Keys cover each operation's
+    own code but not the globals or other functions it uses (see
+    ``operation_key``), so clear the directory after changing a helper that
+    cached operations call.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return len([f for f in os.listdir(self.directory)
+                    if f.endswith(('.npy', '.pkl'))])
+
+    def get(self, key):
+        """Look up a cached result.
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        hit : bool
+            True if ``key`` was found.
+        result
+            The cached result, or None if it was not found.
+        """
+        path = self._find(key)
+        if path is None:
+            return False, None
+        if path.endswith('.npy'):
+            return True, np.load(path)
+        with open(path, 'rb') as f:
+            return True, dill.load(f)
+
+    def put(self, key, result):
+        """Cache a result.
+
+        Parameters
+        ----------
+        key : str
+        result
+        """
+        is_array = type(result) is np.ndarray and not result.dtype.hasobject
+        ext = '.npy' if is_array else '.pkl'
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if is_array:
+                    np.save(f, result)
+                else:
+                    dill.dump(result, f)
+            os.replace(tmp, os.path.join(self.directory, key + ext))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def clear(self):
+        """Remove every cached result."""
+        for f in os.listdir(self.directory):
+            if f.endswith(('.npy', '.pkl')):
+                os.remove(os.path.join(self.directory, f))
+
+    def _find(self, key):
+        for ext in ['.npy', '.pkl']:
+            path = os.path.join(self.directory, key + ext)
+            if os.path.isfile(path):
+                return path
+        return None
+
+
+def operation_key(operation):
+    """Compute a key identifying an operation.
+
+    Parameters
+    ----------
+    operation : callable
+        A function, partial function, method, callable object, or pipeline.
+
+    Returns
+    -------
+    key : str or None
+        Digest of the operation's qualified name, code, defaults, and closure
+        for functions, its function and bound arguments for partial functions
+        and methods, its class and attributes for callable objects, or the
+        structure of its graph for pipelines. None if the operation holds
+        values that cannot be hashed by content (e.g. locks or open files), in
+        which case its results should not be cached.
+
+    Notes
+    -----
+    Only the operation itself is hashed. Globals it reads and functions it
+    calls by name (other than through its closure, defaults, or bound
+    arguments) are not, so the key does not change when they are edited.
+    """
+    h = hashlib.sha1()
+    try:
+        _update_operation(h, operation, set())
+    except _NoKey:
+        return None
+    return h.hexdigest()
+
+
+class _NoKey(Exception):
+    """Raised when an operation cannot be keyed by its content."""
+    pass
+
+
+def _update_operation(h, operation, seen):
+    # Recursive closures refer back to functions already being hashed.
+    if id(operation) in seen:
+        h.update(b'recursive')
+        return
+    seen.add(id(operation))
+
+    graph = getattr(operation, 'operations', None)
+    if graph is not None and hasattr(graph, 'compile'):
+        key = graph.compile().structure_key()
+        if key is None:
+            raise _NoKey()
+        h.update(type(operation).__name__.encode())
+        h.update(key.encode())
+    elif isinstance(operation, functools.partial):
+        h.update(b'partial')
+        _update_operation(h, operation.func, seen)
+        _update_value(h, operation.args, seen)
+        _update_value(h, operation.keywords, seen)
+    elif inspect.ismethod(operation):
+        _update_operation(h, operation.__func__, seen)
+        _update_value(h, operation.__self__, seen)
+    elif inspect.isfunction(operation):
+        func = inspect.unwrap(operation)
+        h.update('{}.{}'.format(func.__module__, func.__qualname__).encode())
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            h.update(code.co_code)
+            _update_value(h, code.co_consts, seen)
+        _update_value(h, getattr(func, '__defaults__', None), seen)
+        _update_value(h, getattr(func, '__kwdefaults__', None), seen)
+        for cell in getattr(func, '__closure__', None) or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                h.update(b'empty')
+                continue
+            _update_value(h, contents, seen)
+    else:
+        cls = type(operation)
+        h.update('{}.{}'.format(cls.__module__, cls.__qualname__).encode())
+        _update_value(h, getattr(operation, '__dict__', operation), seen)
+
+
+def _update_value(h, obj, seen):
+    if isinstance(obj, functools.partial) or inspect.isfunction(obj) or \
+       inspect.ismethod(obj):
+        _update_operation(h, obj, seen)
+    elif type(obj) in (tuple, list):
+        h.update('{}{}'.format(type(obj).__name__, len(obj)).encode())
+        for o in obj:
+            _update_value(h, o, seen)
+    elif type(obj) is dict:
+        h.update('dict{}'.format(len(obj)).encode())
+        for k in sorted(obj, key=repr):
+            _update_value(h, k, seen)
+            _update_value(h, obj[k], seen)
+    else:
+        try:
+            h.update(digest(obj).encode())
+        except Exception:
+            raise _NoKey()
@@ -0,0 +1,178 @@
+"""Checkpointing of completed work for resuming pipeline runs.
+
+Classes
+-------
+Checkpoint
+    Record of completed data items and, optionally, their results.
+
+Functions
+---------
+digest
+    Compute a hash of the content of an object.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import dill
+import numpy as np
+
+from florin.context import is_metadata
+
+
+class Checkpoint(object):
+    """Record of completed data items and, optionally, their results.
+
+    Each completed item is stored as a file in ``directory`` named by the
+    item's key, which is written atomically once the item's result has been
+    computed. Separate threads, processes, and MPI ranks may record items in
+    the same checkpoint, provided the directory is on a shared filesystem.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store the checkpoint in. Created if it does not
+        exist.
+    results : bool
+        If True, store the result of each item so that it can be reused when
+        resuming. If False, only record which items are complete, e.g. when
+        results are saved by the pipeline itself. Default: True.
+
+    Notes
+    -----
+    Tiles (data ending in metadata with an 'origin') are keyed by their
+    origin, shape, and a hash of their content. Other data items are keyed by
+    a hash of their content. Graphs also key items by the structure of their
+    operations and arguments (see ``FlorinExecutionPlan.structure_key``), so
+    running a checkpoint again with different parameters or input data does
+    not reuse stale results. Graphs with operations that cannot be hashed by
+    content share one set of keys.
+    """
+
+    def __init__(self, directory, results=True):
+        self.directory = os.path.abspath(directory)
+        self.results = results
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def __len__(self):
+        return len(self.completed())
+
+    def completed(self):
+        """Get the keys of all completed items.
+
+        Returns
+        -------
+        keys : set of str
+        """
+        return set([os.path.splitext(f)[0]
+                    for f in os.listdir(self.directory)
+                    if f.endswith('.ckpt')])
+
+    def key(self, data, namespace=None):
+        """Get the key of a data item.
+
+        Parameters
+        ----------
+        data
+            The data item, optionally a tuple ending with metadata.
+        namespace : str, optional
+            Identifier of the operations run on the item, so that items run
+            through other operations have other keys.
+
+        Returns
+        -------
+        key : str
+        """
+        if isinstance(data, tuple) and is_metadata(data[-1]) \
+           and 'origin' in data[-1]:
+            origin = '-'.join([str(o) for o in data[-1]['origin']])
+            shape = '-'.join([str(s) for s in getattr(data[0], 'shape', ())])
+            return 'tile_{}_{}_{}'.format(origin, shape,
+                                          digest([namespace, data[:-1]]))
+        if namespace is None:
+            return 'item_{}'.format(digest(data))
+        return 'item_{}'.format(digest([namespace, data]))
+
+    def load(self, key):
+        """Load the stored result of a completed item.
+
+        Parameters
+        ----------
+        key : str
+            The key of the item.
+
+        Returns
+        -------
+        result
+            The stored result, or None if results are not stored.
+        """
+        with open(self._path(key), 'rb') as f:
+            return dill.load(f)
+
+    def save(self, key, result=None):
+        """Record an item as complete.
+
+        Parameters
+        ----------
+        key : str
+            The key of the item.
+        result
+            The result of the item, stored only if ``results`` is True.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dill.dump(result if self.results else None, f)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def clear(self):
+        """Forget all completed items."""
+        for key in self.completed():
+            os.remove(self._path(key))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.ckpt')
+
+
+def digest(obj):
+    """Compute a hash of the content of an object.
+
+    Parameters
+    ----------
+    obj
+        The object to hash. Arrays are hashed by their shape, dtype, and
+        data; tuples, lists, and dicts by their contents; and anything else
+        by its serialized form.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal SHA-1 digest.
+    """
+    h = hashlib.sha1()
+    _update(h, obj)
+    return h.hexdigest()
+
+
+def _update(h, obj):
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        h.update('ndarray{}{}'.format(obj.shape, obj.dtype.str).encode())
+        h.update(memoryview(np.ascontiguousarray(obj)).cast('B'))
+    elif isinstance(obj, (tuple, list)):
+        h.update('{}{}'.format(type(obj).__name__, len(obj)).encode())
+        for o in obj:
+            _update(h, o)
+    elif isinstance(obj, dict):
+        h.update('dict{}'.format(len(obj)).encode())
+        for k in sorted(obj, key=repr):
+            _update(h, k)
+            _update(h, obj[k])
+    else:
+        h.update(dill.dumps(obj))
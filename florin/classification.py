@@ -9,6 +9,8 @@ Functions
 ---------
 classify
     Classify a segmented object.
+classify_batch
+    Classify a batch of segmented objects at once.
 """
 
 import collections
@@ -16,6 +18,7 @@ import numbers
 
 import numpy as np
 
+from florin.batching import batched
 from florin.closure import florinate
 
 
@@ -48,6 +51,44 @@ def classify(obj, *classes):
     return obj
 
 
+def classify_batch(objs, *classes):
+    """Classify a batch of segmented objects at once.
+
+    Equivalent to calling ``classify`` on each object, but the boundaries of
+    each class are checked against every object in one vectorized pass.
+
+    Parameters
+    ----------
+    objs : list of skimage.measure._regionprops.RegionProperties
+        The objects to classify.
+    classes : florin.classify.FlorinClassifiers
+        The classes to select from.
+
+    Returns
+    -------
+    objs : list
+        ``objs``, each updated with a class label (``obj.class_label``).
+    """
+    objs = list(objs)
+    labels = [None for _ in objs]
+    unassigned = np.ones(len(objs), dtype=bool)
+    values = {}
+
+    for c in classes:
+        mask = unassigned.copy()
+        for key, (lo, hi) in c.bounds.items():
+            if key not in values:
+                values[key] = np.asarray([getattr(obj, key) for obj in objs])
+            mask &= (lo <= values[key]) & (values[key] <= hi)
+        for i in np.flatnonzero(mask):
+            labels[i] = c.label
+        unassigned &= ~mask
+
+    for obj, label in zip(objs, labels):
+        obj.class_label = label
+    return objs
+
+
 class FlorinClassifier(object):
     """Classify connected components based on boundary conditions.
 
@@ -99,3 +140,4 @@ class FlorinClassifier(object):
 
 
 classify = florinate(classify)
+classify_batch = florinate(batched(classify_batch))
@@ -7,7 +7,7 @@ florinate
 
 """
 
-from collections import Sequence
+from collections.abc import Sequence
 from itertools import count
 import functools
 
@@ -17,7 +17,7 @@ from florin.closure import florinate
 @florinate
 def label(image, *args, **kwargs):
     """Wrapper that casts arrays to integers before labeling"""
-    if image.dtype == np.bool:
+    if image.dtype == np.bool_:
         image = image.astype(np.uint8)
     return skimage.measure.label(image, *args, **kwargs)
 
@@ -4,6 +4,13 @@ Classes
 -------
 FlorinMetadata
     Metadata for data flowing through a pipeline.
+TileMetadata
+    Compact metadata locating a tile in the array it was split from.
+
+Functions
+---------
+is_metadata
+    Check if an object is pipeline metadata.
 """
 
 
@@ -31,3 +38,81 @@ class FlorinMetadata(dict):
     def update(self, other):
         super(FlorinMetadata, self).update(other)
         return self
+
+
+class TileMetadata(object):
+    """Compact metadata locating a tile in the array it was split from.
+
+    Parameters
+    ----------
+    origin : tuple of int
+        Index of the first element of the tile in the original array.
+    original_shape : tuple of int
+        Shape of the original array.
+
+    Notes
+    -----
+    One of these is created for every tile, so it only holds the two fields
+    needed to join tiles. Fields may be read as attributes or, like
+    ``FlorinMetadata``, as keys, e.g. ``metadata['origin']``.
+    """
+
+    __slots__ = ('origin', 'original_shape')
+
+    def __init__(self, origin, original_shape):
+        self.origin = origin
+        self.original_shape = original_shape
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, (TileMetadata, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.origin, self.original_shape))
+
+    def __reduce__(self):
+        return (TileMetadata, (self.origin, self.original_shape))
+
+    def __repr__(self):
+        return 'TileMetadata(origin={}, original_shape={})'.format(
+            self.origin, self.original_shape)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+
+def is_metadata(obj):
+    """Check if an object is pipeline metadata.
+
+    Parameters
+    ----------
+    obj
+        The object to check.
+
+    Returns
+    -------
+    bool
+        True if ``obj`` is a ``FlorinMetadata`` or ``TileMetadata``.
+    """
+    return isinstance(obj, (FlorinMetadata, TileMetadata))
@@ -38,7 +38,7 @@ def conv_ndnt(data, shape, threshold):
             np.meshgrid(*map(np.arange, data.shape), indexing='ij', sparse=True),
             shape)))
 
-    out = np.ones(data.ravel().shape, dtype=np.bool)
+    out = np.ones(data.ravel().shape, dtype=bool)
     out[data.ravel() * counts.ravel() <= sums.ravel() * threshold] = False
     return out.astype(np.uint8).reshape(data.shape)
 
@@ -1,2 +1,3 @@
 from .florin_graph import FlorinOrderedMultiDiGraph
 from .florin_node import FlorinNode
+from .florin_plan import FlorinExecutionPlan
@@ -6,22 +6,49 @@ FlorinOrderedDiGraph
     Ordered directed graph of a FLoRIN pipeline.
 """
 
-import copy
-import uuid
+import time
 
 import networkx as nx
 
-from florin.context import FlorinMetadata
+from florin import profiling
+from florin.context import is_metadata
 from florin.graph.florin_node import FlorinNode
+from florin.graph.florin_plan import FlorinExecutionPlan
 
 
 class FlorinOrderedMultiDiGraph(nx.OrderedMultiDiGraph):
+    """Ordered directed graph of a FLoRIN pipeline.
 
-    def __init__(self, incoming_graph_data=None, **attrs):
+    Nodes are operations and edges are data dependencies between them. The
+    graph is compiled into a ``FlorinExecutionPlan`` the first time it is
+    called, and recompiled only if nodes are added afterward.
+
+    Attributes
+    ----------
+    threads : int, optional
+        If greater than 1, independent branches of the graph run concurrently
+        on up to this many threads. Default: None, to run nodes one at a time.
+    checkpoint : florin.checkpoint.Checkpoint, optional
+        If supplied, each data item's result is recorded in the checkpoint
+        when it is computed, and items already in the checkpoint are not run
+        again. Their stored result is returned instead, or None if results
+        are not stored.
+    cache : florin.cache.MemoryCache or florin.cache.DiskCache, optional
+        If supplied, the result of each node is cached by the node's
+        operation, arguments, and inputs, and reused whenever the node runs
+        on the same inputs, in this or any other graph using the cache.
+    """
+
+    def __init__(self, incoming_graph_data=None, threads=None,
+                 checkpoint=None, cache=None, **attrs):
         super(FlorinOrderedMultiDiGraph, self).__init__(
             incoming_graph_data=incoming_graph_data, **attrs)
 
         self.last = None
+        self.threads = threads
+        self.checkpoint = checkpoint
+        self.cache = cache
+        self._plan = None
 
     def add(self, node, **kwargs):
         self.add_node(node, **kwargs)
@@ -34,32 +61,124 @@ class FlorinOrderedMultiDiGraph(nx.OrderedMultiDiGraph):
                 self.add_edge(dep, node, **attrs)
         node.graph = self
         self.last = node
+        self._plan = None
 
-    def __call__(self, data):
-        # Pull any metadata and generate a unique key for the multigraph.
-        metadata = None
-        data_key = str(uuid.uuid4())
+    def compile(self):
+        """Compile the graph into a flat execution plan.
 
-        if isinstance(data, tuple) and isinstance(data[-1], FlorinMetadata):
-            metadata = data[-1]
-            data = data[:-1]
+        Returns
+        -------
+        plan : florin.graph.FlorinExecutionPlan
+        """
+        if self._plan is None:
+            self._plan = FlorinExecutionPlan(self)
+        return self._plan
 
-        data_edges = []
+    def __call__(self, data, report=None):
+        """Run the graph on one data item.
 
-        # Run the data through the graph and collect the used multigraph edges
-        # to delete once processing is done.
-        for i, node in enumerate(self.nodes):
-            data_edges.append(node)
-            if i > 0:
-                result = node(data_key=data_key)
-            else:
-                result = node(data=data, data_key=data_key)
+        Parameters
+        ----------
+        data
+            The input to the graph, optionally a tuple ending with metadata.
+        report : dict, optional
+            If supplied, filled with the peak and total bytes of intermediate
+            results. See ``florin.graph.FlorinExecutionPlan``.
+        """
+        plan = self.compile()
+        if plan.batched:
+            return self.run_batch([data])[0]
+
+        key, data, metadata = self._split(data)
 
-        # Remove multigraph edges associated with this particular data flow to
-        # limit memory consumption.
-        self.remove_edges_from([(data_edges[i], data_edges[i + 1], data_key)
-                                for i in range(len(data_edges) - 1)])
+        profiler = profiling._ACTIVE
+        if profiler is not None:
+            start = time.time()
+            begin = time.perf_counter()
+
+        if key is not None and key in self.checkpoint:
+            result = self.checkpoint.load(key)
+        else:
+            result = plan(data, report=report, threads=self.threads,
+                          cache=self.cache)
+            if key is not None:
+                self.checkpoint.save(key, result)
+
+        if profiler is not None:
+            profiler.record('pipeline', self.name or 'graph', id(self), start,
+                            time.perf_counter() - begin, bytes_in=data,
+                            bytes_out=result)
 
         if metadata is not None:
             return result, metadata
         return result
+
+    def run_batch(self, items):
+        """Run the graph on a batch of data items.
+
+        Operations marked with ``florin.batching.batched`` run once on the
+        whole batch. If there are none, each item is run separately.
+
+        Parameters
+        ----------
+        items : list
+            The inputs to the graph, each optionally a tuple ending with
+            metadata.
+
+        Returns
+        -------
+        results : list
+            The result for each item, with its metadata reattached.
+        """
+        plan = self.compile()
+        if not plan.batched:
+            return [self(item) for item in items]
+
+        split = [self._split(item) for item in items]
+        results = [None for _ in split]
+        todo = []
+        for j, (key, _, _) in enumerate(split):
+            if key is not None and key in self.checkpoint:
+                results[j] = self.checkpoint.load(key)
+            else:
+                todo.append(j)
+
+        profiler = profiling._ACTIVE
+        if profiler is not None:
+            start = time.time()
+            begin = time.perf_counter()
+
+        if len(todo) > 0:
+            computed = plan.run_batch([split[j][1] for j in todo])
+            for j, result in zip(todo, computed):
+                results[j] = result
+                if split[j][0] is not None:
+                    self.checkpoint.save(split[j][0], result)
+
+        if profiler is not None:
+            profiler.record('pipeline', self.name or 'graph', id(self), start,
+                            time.perf_counter() - begin,
+                            bytes_in=[data for _, data, _ in split],
+                            bytes_out=results)
+
+        return [(result, metadata) if metadata is not None else result
+                for result, (_, _, metadata) in zip(results, split)]
+
+    def _split(self, data):
+        """Get the checkpoint key of an item and pull off its metadata."""
+        key = None
+        if self.checkpoint is not None:
+            key = self.checkpoint.key(data,
+                                      namespace=self.compile().structure_key())
+
+        # Pull any metadata off of the data to reattach to the result.
+        metadata = None
+
+        if isinstance(data, tuple) and is_metadata(data[-1]):
+            metadata = data[-1]
+            data = data[:-1]
+
+        if not isinstance(data, tuple):
+            data = (data,)
+
+        return key, data, metadata
@@ -8,10 +8,8 @@ FlorinNode
 
 from itertools import count
 import time
-import weakref
-
-import networkx as nx
 
+from .. import profiling
 from ..log_utils import logger
 
 
@@ -50,10 +48,27 @@ class FlorinNode(object, metaclass=MetaFlorinNode):
     keyword_dependencies : dict of FlorinNode
         Nodes that must be run before this node can be run referenced by a
         given name.
+    cache : florin.cache.MemoryCache or florin.cache.DiskCache, optional
+        Cache to reuse the results of this node from when it runs in a graph
+        on the same inputs. If None, use the graph's cache, if any; if False,
+        never cache this node.
+    batch : {None, 'list', 'stack'}
+        How the operation receives a batch of items, if it was marked with
+        ``florin.batching.batched``.
+
+    Notes
+    -----
+    Nodes are looked up in dictionaries and sets for every item that runs
+    through a graph, so their attributes are slotted and their hash is
+    computed once, from ``id``.
     """
 
+    __slots__ = ('id', '__name__', 'operation', 'graph', 'args', 'kwargs',
+                 'cache', 'batch', '_hash')
+
     def __init__(self, operation, *args, graph=None, **kwargs):
         self.id = next(self._counter)
+        self._hash = hash(self.id)
         try:
             self.__name__ = operation.__name__
         except AttributeError:
@@ -62,64 +77,89 @@ class FlorinNode(object, metaclass=MetaFlorinNode):
         self.graph = graph
         self.args = args
         self.kwargs = kwargs
+        self.cache = None
+        self.batch = getattr(operation, '_florin_batch', None)
 
-    def __call__(self, data=None, data_key=None):
-        """Add dependencies to this node.
+    def __call__(self, *data, **kwargs):
+        """Run this node's operation directly on data.
 
         Parameters
         ----------
-        *operations : FlorinNodes
-            Operations for which direct output should be used as a dependency.
-            Maintained in the same order as they are added.
-        **keyword_operations : FlorinNodes
-            Named dependencies. The output of these operations will be stored
-            using the provided keyword.
+        *data
+            Inputs to pass to ``operation`` ahead of the stored arguments.
+        **kwargs
+            Keyword arguments that override the stored keyword arguments.
+
+        Returns
+        -------
+        result
+            The output of ``operation``.
+
+        Notes
+        -----
+        Dependencies on other nodes are only resolved when the node is run as
+        part of a graph. See ``florin.graph.FlorinExecutionPlan``.
         """
-        graph = self.graph
+        if len(kwargs) > 0:
+            kwargs = dict(self.kwargs, **kwargs)
+        else:
+            kwargs = self.kwargs
+        return self.run(*(data + self.args), **kwargs)
+
+    def run(self, *args, **kwargs):
+        """Run the operation on fully resolved arguments.
+
+        Parameters
+        ----------
+        *args
+        **kwargs
+            The arguments to pass to ``operation``.
 
-        # Process any data passed into the node as the input. If no data was
-        # passed in, grab any dependencies and use those as input.
+        Returns
+        -------
+        result
+            The output of ``operation``.
+        """
         start = time.time()
-        if data is not None:
-            if not isinstance(data, tuple):
-                data = (data,)
-            result = self.operation(*data, *self.args, **self.kwargs)
-        else:
-            args = tuple([dep if not isinstance(dep, FlorinNode)
-                          else graph[dep][self][data_key]['result']
-                          for dep in self.args])
-            kwargs = {key: dep if not isinstance(dep, FlorinNode)
-                      else graph[dep][self][data_key][key]
-                      for key, dep in self.kwargs.items()}
+        profiler = profiling._ACTIVE
+        if profiler is None:
             result = self.operation(*args, **kwargs)
+        else:
+            result = profiler.profile(self, args, kwargs)
         end = time.time()
-        logger.info('Function {0}: running time {1:0.3f}s'.format(
-                           self.__name__, end - start))
-
-        # Place the result of this operation in the output edges.
-        outedges = []
-        for _, out, key, e in graph.out_edges(self, keys=True, data=True):
-            if key is 0:
-                outedges.append((out, e))
-
-        # This implementation uses a multigraph to avoid overwriting
-        # dependencies.
-        for out, e in outedges:
-            if 'result' in e:
-                graph.add_edge(self, out, key=data_key, result=result)
-            else:
-                edge_attrs = {list(e.keys())[0]: result}
-                graph.add_edge(self, out, key=data_key, **edge_attrs)
-
+        if logger.enabled:
+            logger.timing(self.__name__, end - start)
         return result
 
-    def __setattr__(self, key, val):
-        if isinstance(val, nx.DiGraph):
-            super(FlorinNode, self).__setattr__(key, weakref.ref(val))
-        super(FlorinNode, self).__setattr__(key, val)
+    async def run_async(self, *args, **kwargs):
+        """Await a coroutine operation on fully resolved arguments.
+
+        Parameters
+        ----------
+        *args
+        **kwargs
+            The arguments to pass to ``operation``.
+
+        Returns
+        -------
+        result
+            The output of ``operation``.
+        """
+        start = time.time()
+        begin = time.perf_counter()
+        result = await self.operation(*args, **kwargs)
+        duration = time.perf_counter() - begin
+
+        profiler = profiling._ACTIVE
+        if profiler is not None:
+            profiler.record('node', self.__name__, self.id, start, duration,
+                            bytes_in=(args, kwargs), bytes_out=result)
+        if logger.enabled:
+            logger.timing(self.__name__, duration)
+        return result
 
     def __hash__(self):
-        return hash(str(self.id) + self.__name__)
+        return self._hash
 
     def add_arguments(self, *args, **kwargs):
         """Append arguments to the list of arguments for this operation.
@@ -0,0 +1,419 @@
+"""Compiled execution plans for FLoRIN graphs.
+
+Classes
+-------
+FlorinExecutionPlan
+    Flat, topologically sorted plan for running a graph on one data item.
+
+Functions
+---------
+nbytes
+    Estimate the memory held by a result.
+"""
+
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from operator import itemgetter
+import sys
+
+import networkx as nx
+import numpy as np
+
+from florin.batching import BatchSizeError
+from florin.graph.florin_node import FlorinNode
+
+
+class FlorinExecutionPlan(object):
+    """Flat, topologically sorted plan for running a graph on one data item.
+
+    Every node in the graph is assigned an integer slot in a list of results,
+    and every dependency is resolved to the slot of the node that produces
+    it. Running the plan fills the slots in order without touching the graph.
+
+    Each result is reference counted by the number of nodes that consume it
+    and dropped once all of them have run, so peak memory per item follows
+    the widest set of live results rather than the sum of every result.
+
+    Parameters
+    ----------
+    graph : florin.graph.FlorinOrderedMultiDiGraph
+        The graph to compile.
+
+    Attributes
+    ----------
+    nodes : list of FlorinNode
+        The nodes of the graph in execution order.
+    root : int
+        Slot of the node that receives the input data.
+    output : int
+        Slot of the node whose result is the output of the plan.
+    consumers : list of int
+        The number of nodes consuming the result in each slot.
+    width : int
+        The largest number of nodes that can run concurrently.
+    batched : bool
+        True if any node runs on whole batches of items, see ``run_batch``.
+    """
+
+    def __init__(self, graph):
+        order = {node: i for i, node in enumerate(graph.nodes)}
+        self.nodes = list(nx.lexicographical_topological_sort(
+            graph, key=order.get))
+        slots = {node: i for i, node in enumerate(self.nodes)}
+
+        inserted = list(graph.nodes)
+        self.root = slots[inserted[0]] if len(inserted) > 0 else None
+        self.output = slots[graph.last] if graph.last is not None else None
+
+        # For each node, store its arguments with dependencies replaced by
+        # placeholders along with the (position, slot) pairs to fill them.
+        self.args = []
+        self.arg_slots = []
+        self.kwarg_slots = []
+        self.inputs = []
+        self.consumers = [0 for _ in self.nodes]
+        for i, node in enumerate(self.nodes):
+            args = list(node.args)
+            arg_slots = []
+            for j, dep in enumerate(args):
+                if isinstance(dep, FlorinNode):
+                    arg_slots.append((j, slots[dep]))
+                    args[j] = None
+
+            kwarg_slots = []
+            for key, dep in node.kwargs.items():
+                if isinstance(dep, FlorinNode):
+                    kwarg_slots.append((key, slots[dep]))
+
+            inputs = sorted(set([slot for _, slot in arg_slots + kwarg_slots]))
+            for slot in inputs:
+                self.consumers[slot] += 1
+
+            self.args.append(tuple(args))
+            self.arg_slots.append(tuple(arg_slots))
+            self.kwarg_slots.append(tuple(kwarg_slots))
+            self.inputs.append(tuple(inputs))
+
+        # Nodes consuming each result, and the largest number of nodes that
+        # may run at once (the widest level of the graph).
+        self.dependents = [[] for _ in self.nodes]
+        depth = [0 for _ in self.nodes]
+        for i, inputs in enumerate(self.inputs):
+            for slot in inputs:
+                self.dependents[slot].append(i)
+                depth[i] = max(depth[i], depth[slot] + 1)
+        self.width = max(Counter(depth).values()) if len(depth) > 0 else 0
+
+        self.batched = any([node.batch is not None for node in self.nodes])
+        self._node_keys = None
+        self._structure_key = None
+
+        # The output is never released, even if other nodes consume it.
+        if self.output is not None:
+            self.consumers[self.output] = float('inf')
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __call__(self, data, report=None, threads=None, cache=None):
+        """Run the plan on one data item.
+
+        Parameters
+        ----------
+        data : tuple
+            The positional inputs to the root node.
+        report : dict, optional
+            If supplied, filled with the memory used while running the plan:
+            'peak_bytes', the most memory held by live results at once;
+            'total_bytes', the memory of every result combined (i.e., if no
+            result were released); and 'nodes', (name, bytes) pairs with the
+            size of each node's result in execution order.
+        threads : int, optional
+            If greater than 1, run nodes whose dependencies are satisfied
+            concurrently on up to ``threads`` threads. Results do not depend
+            on the order in which nodes finish.
+        cache : florin.cache.MemoryCache or florin.cache.DiskCache, optional
+            Cache to look up and store the results of nodes in, unless a node
+            has its own ``cache`` (or ``cache = False`` to opt out).
+
+        Returns
+        -------
+        result
+            The result of the output node.
+        """
+        results = [None] * len(self.nodes)
+        remaining = list(self.consumers)
+        usage = _MemoryUsage(report, len(self.nodes)) \
+            if report is not None else None
+
+        caches = [cache if node.cache is None else node.cache or None
+                  for node in self.nodes]
+        keys = [None] * len(self.nodes) \
+            if any(c is not None for c in caches) else None
+
+        if threads is not None and threads > 1 and self.width > 1:
+            self._run_concurrent(data, results, remaining, usage, threads,
+                                 caches, keys)
+        else:
+            for i, node in enumerate(self.nodes):
+                args, kwargs = self._arguments(i, data, results)
+                if keys is not None:
+                    keys[i] = self._key(i, data, keys)
+                results[i] = self._execute(i, args, kwargs, caches, keys)
+                del args, kwargs
+                self._finish(i, results, remaining, usage)
+
+        return results[self.output]
+
+    def run_batch(self, batch):
+        """Run the plan on a batch of data items.
+
+        Nodes marked with ``florin.batching.batched`` run once on the whole
+        batch, and all other nodes run once per item.
+
+        Parameters
+        ----------
+        batch : list of tuple
+            The positional inputs to the root node for each item.
+
+        Returns
+        -------
+        results : list
+            The result of the output node for each item.
+
+        Notes
+        -----
+        Batches always run serially and without a cache.
+        """
+        results = [None] * len(self.nodes)
+        remaining = list(self.consumers)
+
+        for i, node in enumerate(self.nodes):
+            if node.batch is None:
+                results[i] = []
+                for j in range(len(batch)):
+                    args, kwargs = self._batch_arguments(i, batch, results, j)
+                    results[i].append(node.run(*args, **kwargs))
+            else:
+                args, kwargs = self._batch_arguments(i, batch, results)
+                result = node.run(*args, **kwargs)
+                if len(result) != len(batch):
+                    raise BatchSizeError(node.__name__, len(batch),
+                                         len(result))
+                results[i] = list(result)
+            del args, kwargs
+            self._finish(i, results, remaining, None)
+
+        return results[self.output]
+
+    def structure_key(self):
+        """Compute a key identifying the operations and structure of the plan.
+
+        Returns
+        -------
+        key : str or None
+            Digest of the key of every node (see ``florin.cache``) and the
+            connections between them, or None if some node has no key.
+        """
+        from florin.checkpoint import digest
+        if self._structure_key is None:
+            keys = self._static_keys()
+            if any(key is None for key in keys):
+                return None
+            self._structure_key = digest([keys, self.arg_slots,
+                                          self.kwarg_slots, self.root,
+                                          self.output])
+        return self._structure_key
+
+    def _static_keys(self):
+        """Keys of each node's operation and non-node arguments, or None for
+        nodes that cannot be keyed by content."""
+        if self._node_keys is None:
+            self._node_keys = [self._static_key(node, args)
+                               for node, args in zip(self.nodes, self.args)]
+        return self._node_keys
+
+    def _static_key(self, node, args):
+        from florin.cache import operation_key
+        from florin.checkpoint import digest
+        key = operation_key(node.operation)
+        if key is None:
+            return None
+        kwargs = sorted([(k, v) for k, v in node.kwargs.items()
+                         if not isinstance(v, FlorinNode)],
+                        key=lambda kv: kv[0])
+        try:
+            return digest([key, args, kwargs])
+        except Exception:
+            return None
+
+    def _key(self, i, data, keys):
+        """Compute the cache key of a node from the keys of its inputs, or
+        None if it or any of its inputs has no key."""
+        from florin.checkpoint import digest
+        inputs = [(j, keys[slot]) for j, slot in self.arg_slots[i]]
+        inputs += [(k, keys[slot]) for k, slot in self.kwarg_slots[i]]
+        static = self._static_keys()[i]
+        if static is None or any(key is None for _, key in inputs):
+            return None
+        if i == self.root:
+            inputs.append(('data', digest(data)))
+        return digest([static, inputs])
+
+    def _execute(self, i, args, kwargs, caches, keys):
+        """Run a node, or reuse its cached result."""
+        cache = caches[i]
+        if cache is not None and keys[i] is None:
+            cache = None
+        if cache is not None:
+            hit, result = cache.get(keys[i])
+            if hit:
+                return result
+
+        result = self.nodes[i].run(*args, **kwargs)
+
+        # Iterators (e.g. tile generators) can only be consumed once.
+        if cache is not None and not isinstance(result, Iterator):
+            cache.put(keys[i], result)
+        return result
+
+    def _arguments(self, i, data, results):
+        """Fill in the arguments to a node from the results of its inputs."""
+        args = list(self.args[i])
+        for j, slot in self.arg_slots[i]:
+            args[j] = results[slot]
+
+        if len(self.kwarg_slots[i]) > 0:
+            kwargs = dict(self.nodes[i].kwargs)
+            for key, slot in self.kwarg_slots[i]:
+                kwargs[key] = results[slot]
+        else:
+            kwargs = self.nodes[i].kwargs
+
+        if i == self.root:
+            args = list(data) + args
+
+        return args, kwargs
+
+    def _batch_arguments(self, i, batch, results, item=None):
+        """Fill in the arguments to a node for one item of a batch, or with
+        the values for every item if ``item`` is None."""
+        if item is not None:
+            pick = itemgetter(item)
+        elif self.nodes[i].batch == 'stack':
+            pick = np.stack
+        else:
+            pick = list
+
+        args = list(self.args[i])
+        for j, slot in self.arg_slots[i]:
+            args[j] = pick(results[slot])
+
+        kwargs = dict(self.nodes[i].kwargs)
+        for key, slot in self.kwarg_slots[i]:
+            kwargs[key] = pick(results[slot])
+
+        if i == self.root:
+            if item is not None:
+                args = list(batch[item]) + args
+            else:
+                args = [pick(column) for column in zip(*batch)] + args
+
+        return args, kwargs
+
+    def _finish(self, i, results, remaining, usage):
+        """Record a node's result and drop results with no consumers left."""
+        if usage is not None:
+            usage.add(i, self.nodes[i], results[i])
+
+        for slot in self.inputs[i] + (i,):
+            if slot != i:
+                remaining[slot] -= 1
+            if remaining[slot] == 0 and results[slot] is not None:
+                results[slot] = None
+                if usage is not None:
+                    usage.remove(slot)
+
+    def _run_concurrent(self, data, results, remaining, usage, threads,
+                        caches, keys):
+        """Dispatch nodes to a thread pool as their inputs become ready.
+
+        Only the calling thread touches ``results`` and the reference counts;
+        worker threads just run operations. Completed nodes are processed in
+        plan order, so each result is computed from the same inputs no matter
+        which thread finishes first.
+        """
+        waiting = [len(inputs) for inputs in self.inputs]
+
+        def submit(executor, i):
+            args, kwargs = self._arguments(i, data, results)
+            if keys is not None:
+                keys[i] = self._key(i, data, keys)
+            return executor.submit(self._execute, i, args, kwargs, caches,
+                                   keys)
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            running = {}
+            for i in range(len(self.nodes)):
+                if waiting[i] == 0:
+                    running[submit(executor, i)] = i
+
+            while len(running) > 0:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=running.get):
+                    i = running.pop(future)
+                    results[i] = future.result()
+                    for dep in self.dependents[i]:
+                        waiting[dep] -= 1
+                        if waiting[dep] == 0:
+                            running[submit(executor, dep)] = dep
+                    self._finish(i, results, remaining, usage)
+
+
+class _MemoryUsage(object):
+    """Track the bytes held by live results for a plan report."""
+
+    def __init__(self, report, size):
+        self.report = report
+        self.sizes = [0 for _ in range(size)]
+        self.live = 0
+        report.update(peak_bytes=0, total_bytes=0, nodes=[])
+
+    def add(self, slot, node, result):
+        self.sizes[slot] = nbytes(result)
+        self.live += self.sizes[slot]
+        self.report['total_bytes'] += self.sizes[slot]
+        self.report['peak_bytes'] = max(self.report['peak_bytes'], self.live)
+        self.report['nodes'].append((node.__name__, self.sizes[slot]))
+
+    def remove(self, slot):
+        self.live -= self.sizes[slot]
+
+
+def nbytes(obj, mapped=False):
+    """Estimate the memory held by a result.
+
+    Parameters
+    ----------
+    obj
+        The result to measure.
+    mapped : bool
+        If True, count memory-mapped arrays by the size of their data.
+
+    Returns
+    -------
+    int
+        The size of ``obj`` in bytes. Arrays report the size of their data,
+        and lists, tuples, and dicts the combined size of their contents.
+        Memory-mapped arrays (unless ``mapped``) and lazy containers count as
+        their object size.
+    """
+    if isinstance(obj, np.ndarray) and \
+       (mapped or not isinstance(obj, np.memmap)):
+        return obj.nbytes
+    elif isinstance(obj, (list, tuple)):
+        return sum([nbytes(o, mapped=mapped) for o in obj])
+    elif isinstance(obj, dict):
+        return sum([nbytes(o, mapped=mapped) for o in obj.values()])
+    return sys.getsizeof(obj)
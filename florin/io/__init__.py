@@ -0,0 +1,203 @@
+"""I/O functions for loading and saving data in a variety of formats.
+
+Formats are handled by backends registered with ``register_backend``.
+``load`` and ``save`` choose a backend by sniffing the path, and each backend
+only imports its dependencies (h5py, cloudvolume, etc.) when it is first used.
+
+Classes
+-------
+HDF5Dataset
+    Managed, picklable handle to a dataset in an HDF5 file.
+HDF5FilePool
+    Per-process pool of open HDF5 files with LRU eviction.
+IOBackend
+    Description of how to load and save one data format.
+TiffStack
+    Lazy, page-indexed view of a multi-page TIFF stack.
+TiffStackWriter
+    Incrementally append pages to a TIFF stack.
+
+Functions
+---------
+find_backend
+    Find the backend that handles a path.
+get_backend
+    Get a registered backend by name.
+load
+    Load image(s) from a file.
+load_cloudvolume
+    Load a CloudVolume layer.
+load_hdf5
+    Load data from an HDF5 file.
+load_image
+    Load an image file.
+load_images
+    Load a directory of image files.
+load_npy
+    Load data from a numpy array file.
+load_tiff
+    Load a TIFF stack.
+load_zarr
+    Load data from a Zarr or N5 store.
+open_zarr
+    Open or create an array in a Zarr or N5 store.
+register_backend
+    Add a backend to the registry.
+save
+    Save image(s) in a variety of formats.
+save_cloudvolume
+    Save an image to a CloudVolume layer.
+save_hdf5
+    Save an image to HDF5 format.
+save_image
+    Save an image.
+save_images
+    Save a sequence of images.
+save_npy
+    Save an image to a numpy array file.
+save_tiff
+    Save an image to TIFF format.
+save_zarr
+    Save an image to a Zarr or N5 store.
+unregister_backend
+    Remove a backend from the registry.
+"""
+
+import os
+
+import numpy as np
+
+from florin.closure import florinate
+from florin.io.backends import IOBackend, find_backend, get_backend, \
+                               register_backend, unregister_backend
+from florin.io.cloudvolume import is_cloudvolume, load_cloudvolume, \
+                                  save_cloudvolume
+from florin.io.hdf5 import HDF5Dataset, HDF5FilePool, load_hdf5, save_hdf5
+from florin.io.images import load_image, load_images, save_image, \
+                             save_images
+from florin.io.npy import load_npy, save_npy
+from florin.io.tiff import load_tiff, save_tiff, TiffStack, TiffStackWriter
+from florin.io.zarr import is_zarr, load_zarr, open_zarr, save_zarr
+
+
+@florinate
+def load(path, **kwargs):
+    """Load images from a file.
+
+    Generic loader function that sniffs the path to determine how to load the
+    data. See ``find_backend`` for how a backend is chosen.
+
+    Parameters
+    ----------
+    path : str
+        Path to the image file(s) to load.
+
+    Other Parameters
+    ----------------
+    key
+        Key to load data from when working with key/value stores (e.g. HDF5,
+        npz, etc.)
+
+    Returns
+    -------
+    data : numpy.ndarray
+    """
+    backend = find_backend(path, mode='load')
+    return backend.load(path, **kwargs)
+
+
+@florinate
+def save(img, path, **kwargs):
+    """Save image(s) in a variety of formats.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to. This path determines which format the
+        data will be saved as.
+
+    Returns
+    -------
+    img
+        The unaltered image/volume.
+
+    Other Parameters
+    ----------------
+    See ``save_cloudvolume``, ``save_hdf5``, ``save_image``, ``save_images``,
+    ``save_npy``, ``save_tiff``, and ``save_zarr`` for filetype-specific
+    arguments.
+
+    Notes
+    -----
+    The filetype passed as ``path`` will determine the format of the saved
+    file. If no extension is found, 3D arrays will automatically be saved as
+    numbered PNG files in a directory created at ``path`` and 2D arrays will be
+    saved to ``path`` directly as a PNG. Paths with a protocol (e.g.
+    ``file://``) or pointing to an existing CloudVolume layer are saved with
+    ``save_cloudvolume``.
+    """
+    if isinstance(img, np.ndarray) and img.dtype == np.bool_:
+        img = img.astype(np.uint8) * 255
+
+    if isinstance(img, map):
+        img = next(img)
+    if isinstance(img, list) and len(img) == 1:
+        img = img[0]
+
+    backend = find_backend(path, mode='save')
+    backend.save(img, path, **kwargs)
+    return img
+
+
+def _is_image_directory(path, mode):
+    _, ext = os.path.splitext(path)
+    return os.path.isdir(path) or (mode == 'save' and ext == '')
+
+
+def _is_cloudvolume(path, mode):
+    return is_cloudvolume(path)
+
+
+def _is_zarr(path, mode):
+    return is_zarr(path)
+
+
+# Built-in backends. These are registered in order of increasing precedence.
+register_backend(IOBackend(
+    'image', load=load_image, save=save_image,
+    extensions=['png', 'jpg', 'jpeg', 'bmp', 'gif'],
+    magic=[b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff']))
+
+register_backend(IOBackend(
+    'images', load=load_images, save=save_images,
+    match=_is_image_directory))
+
+register_backend(IOBackend(
+    'npy', load=load_npy, save=save_npy,
+    extensions=['npy'],
+    magic=[b'\x93NUMPY'],
+    capabilities=['mmap']))
+
+register_backend(IOBackend(
+    'tiff', load=load_tiff, save=save_tiff,
+    extensions=['tif', 'tiff'],
+    magic=[b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'],
+    capabilities=['lazy', 'mmap']))
+
+register_backend(IOBackend(
+    'hdf5', load=load_hdf5, save=save_hdf5,
+    extensions=['h5', 'hdf5', 'hdf'],
+    magic=[b'\x89HDF\r\n\x1a\n'],
+    capabilities=['lazy', 'chunked']))
+
+register_backend(IOBackend(
+    'cloudvolume', load=load_cloudvolume, save=save_cloudvolume,
+    match=_is_cloudvolume,
+    capabilities=['lazy', 'chunked', 'parallel-write']))
+
+register_backend(IOBackend(
+    'zarr', load=load_zarr, save=save_zarr,
+    match=_is_zarr,
+    capabilities=['lazy', 'chunked', 'parallel-write']))
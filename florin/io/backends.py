@@ -0,0 +1,212 @@
+"""Registry of I/O backends used by ``florin.load`` and ``florin.save``.
+
+Classes
+-------
+IOBackend
+    Description of how to load and save one data format.
+
+Functions
+---------
+find_backend
+    Find the backend that handles a path.
+get_backend
+    Get a registered backend by name.
+register_backend
+    Add a backend to the registry.
+unregister_backend
+    Remove a backend from the registry.
+"""
+
+from collections import OrderedDict
+import os
+
+
+CAPABILITIES = frozenset(['lazy', 'mmap', 'chunked', 'parallel-write'])
+
+# Registered backends in registration order. Lookups walk this in reverse, so
+# backends registered later (e.g. by users) take precedence over built-ins.
+_BACKENDS = OrderedDict()
+
+# Backend used when nothing else claims a path.
+_FALLBACK = 'image'
+
+
+class UnknownBackendError(KeyError):
+    """Raised when a backend is requested that has not been registered."""
+    def __init__(self, name):
+        msg = 'No I/O backend named {} has been registered.'.format(name)
+        super(UnknownBackendError, self).__init__(msg)
+
+
+class InvalidCapabilityError(ValueError):
+    """Raised when a backend declares an unknown capability."""
+    def __init__(self, capabilities):
+        msg = 'Unknown backend capabilities {}. Must be a subset of {}'.format(
+            sorted(capabilities), sorted(CAPABILITIES))
+        super(InvalidCapabilityError, self).__init__(msg)
+
+
+class IOBackend(object):
+    """Description of how to load and save one data format.
+
+    Parameters
+    ----------
+    name : str
+        Unique name of the backend.
+    load : callable, optional
+        Function with signature ``load(path, **kwargs)`` that loads data.
+    save : callable, optional
+        Function with signature ``save(img, path, **kwargs)`` that saves data.
+    extensions : list of str, optional
+        File extensions (without the leading '.') handled by this backend.
+    magic : list of bytes, optional
+        Signatures found at the start of files in this format.
+    match : callable, optional
+        Function with signature ``match(path, mode)`` that returns True if the
+        backend handles ``path`` when loading (``mode='load'``) or saving
+        (``mode='save'``). Use for formats identified by something other than
+        an extension, e.g. URLs or directory layouts.
+    capabilities : list of str, optional
+        Features supported by the format. Any of 'lazy' (data is read on
+        access), 'mmap' (data may be memory-mapped), 'chunked' (data is stored
+        in independently addressable chunks), and 'parallel-write' (multiple
+        processes may write at once).
+
+    Notes
+    -----
+    Backends should import any heavy dependencies inside ``load`` and
+    ``save`` so that they are only imported when the format is first used.
+    """
+
+    def __init__(self, name, load=None, save=None, extensions=None,
+                 magic=None, match=None, capabilities=None):
+        self.name = name
+        self.load = load
+        self.save = save
+        self.extensions = [e.strip('.').lower() for e in extensions or []]
+        self.magic = list(magic or [])
+        self.match = match
+        self.capabilities = frozenset(capabilities or [])
+
+        if not self.capabilities <= CAPABILITIES:
+            raise InvalidCapabilityError(self.capabilities - CAPABILITIES)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.name)
+
+    def supports(self, mode):
+        """Determine if this backend can load or save.
+
+        Parameters
+        ----------
+        mode : {'load', 'save'}
+
+        Returns
+        -------
+        bool
+        """
+        return getattr(self, mode) is not None
+
+
+def register_backend(backend):
+    """Add a backend to the registry.
+
+    Parameters
+    ----------
+    backend : florin.io.IOBackend
+        The backend to register. Replaces any backend with the same name.
+    """
+    _BACKENDS.pop(backend.name, None)
+    _BACKENDS[backend.name] = backend
+
+
+def unregister_backend(name):
+    """Remove a backend from the registry.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend to remove.
+
+    Returns
+    -------
+    backend : florin.io.IOBackend
+        The removed backend.
+    """
+    try:
+        return _BACKENDS.pop(name)
+    except KeyError:
+        raise UnknownBackendError(name)
+
+
+def get_backend(name):
+    """Get a registered backend by name.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend.
+
+    Returns
+    -------
+    backend : florin.io.IOBackend
+    """
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise UnknownBackendError(name)
+
+
+def find_backend(path, mode='load'):
+    """Find the backend that handles a path.
+
+    Parameters
+    ----------
+    path : str
+        The path to load from or save to.
+    mode : {'load', 'save'}
+        Whether the path will be loaded or saved.
+
+    Returns
+    -------
+    backend : florin.io.IOBackend
+
+    Notes
+    -----
+    Backends are checked in order of
+
+    1. custom ``match`` functions,
+    2. magic bytes at the start of an existing file (loading only),
+    3. file extensions,
+
+    falling back to the 'image' backend if no other backend claims ``path``.
+    """
+    candidates = [b for b in reversed(_BACKENDS.values()) if b.supports(mode)]
+
+    for backend in candidates:
+        if backend.match is not None and backend.match(path, mode):
+            return backend
+
+    if mode == 'load' and os.path.isfile(path):
+        header = _read_header(path, candidates)
+        for backend in candidates:
+            if any(header.startswith(m) for m in backend.magic):
+                return backend
+
+    _, ext = os.path.splitext(path)
+    ext = ext.strip('.').lower()
+    for backend in candidates:
+        if ext in backend.extensions:
+            return backend
+
+    return get_backend(_FALLBACK)
+
+
+def _read_header(path, backends):
+    """Read enough of a file to compare against backend magic bytes."""
+    size = max([len(m) for b in backends for m in b.magic] or [0])
+    try:
+        with open(path, 'rb') as f:
+            return f.read(size)
+    except (IOError, OSError):
+        return b''
@@ -0,0 +1,304 @@
+"""I/O for CloudVolume (Neuroglancer precomputed) layers.
+
+Functions
+---------
+is_cloudvolume
+    Determine whether a path refers to a CloudVolume layer.
+load_cloudvolume
+    Load a CloudVolume layer.
+save_cloudvolume
+    Save an image to a CloudVolume layer.
+"""
+
+import functools
+import itertools
+from multiprocessing.pool import ThreadPool
+import os
+import re
+import sys
+
+import numpy as np
+
+
+def is_cloudvolume(path):
+    """Determine whether a path refers to a CloudVolume layer.
+
+    Parameters
+    ----------
+    path : str
+        The path to check.
+
+    Returns
+    -------
+    bool
+        True if ``path`` has a protocol (e.g. ``file://``, ``gs://``) or is a
+        local directory containing a layer ``info`` file.
+    """
+    return bool(re.search(r'^[a-zA-Z]+://.+$', path)) or \
+        (os.path.isdir(path) and os.path.isfile(os.path.join(path, 'info')))
+
+
+def load_cloudvolume(path, mip=0, **kwargs):
+    """Load a CloudVolume layer.
+
+    Parameters
+    ----------
+    path : str
+        The layer to load. Local paths are loaded as ``file://`` layers,
+        relative to the working directory.
+    mip : int
+        The MIP level to load. Default: 0.
+
+    Returns
+    -------
+    data : cloudvolume.CloudVolume
+    """
+    from cloudvolume import CloudVolume
+
+    return CloudVolume(_layer_path(path), mip=mip)
+
+
+def save_cloudvolume(img, path, mode='image', origin=None, mip=0,
+                     resolution=(1, 1, 1), flip_xy=False, voxel_offset=None,
+                     volume_size=None, chunk_size=(64, 64, 64),
+                     factor=(2, 2, 2), parallel=None):
+    """Save images to a CloudVolume layer.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save, indexed as (z, y, x) with an optional
+        trailing channel axis.
+    path : str
+        The layer to write to. Local paths are written as ``file://`` layers,
+        relative to the working directory.
+    mode : {'image', 'segmentation'}
+        The type of layer to write. Downsampled MIP levels are computed with
+        mean pooling for images and mode pooling for segmentations.
+    origin : tuple of int, optional
+        The (z, y, x) position of ``img`` relative to the start of the layer.
+        Default: (0, 0, 0).
+    mip : int
+        The highest MIP level to write. Levels 1 through ``mip`` are generated
+        from ``img`` in a single pass. Default: 0.
+    resolution : tuple of int
+        The (x, y, z) voxel resolution of a new layer.
+    flip_xy : bool
+        If True, swap the x and y axes of ``img`` before writing.
+    voxel_offset : tuple of int, optional
+        The (x, y, z) voxel offset of a new layer. Default: (0, 0, 0).
+    volume_size : tuple of int, optional
+        The (x, y, z) size of a new layer. Default: the extent of ``img``
+        placed at ``origin``.
+    chunk_size : tuple of int
+        The (x, y, z) chunk size of a new layer.
+    factor : tuple of int
+        The (x, y, z) downsampling factor between MIP levels.
+    parallel : int, optional
+        The number of threads writing chunk-aligned blocks. Setting None will
+        attempt to use as many as can be supported.
+
+    Returns
+    -------
+    cv : cloudvolume.CloudVolume
+        The layer at MIP level 0.
+    """
+    from cloudvolume import CloudVolume
+
+    if mode not in ['image', 'segmentation']:
+        raise ValueError('Invalid mode {}. Must be one of "image", "segmentation"'.format(mode))
+
+    path = _layer_path(path)
+
+    # CloudVolume indexes layers as (x, y, z, channel).
+    img = np.asarray(img)
+    if img.ndim == 3:
+        img = img[..., np.newaxis]
+    axes = (1, 2, 0, 3) if flip_xy else (2, 1, 0, 3)
+    img = np.transpose(img, axes=axes)
+
+    if origin is None:
+        origin = (0, 0, 0)
+    origin = np.asarray([origin[i] for i in axes[:3]])
+
+    if mode == 'segmentation' and img.dtype not in [np.uint32, np.uint64]:
+        img = img.astype(np.uint32)
+
+    if not _cloudvolume_exists(path):
+        comm = _mpi_comm()
+        if comm is None or comm.Get_rank() == 0:
+            _create_cloudvolume_layer(
+                img, path, mode, origin, mip, resolution, voxel_offset,
+                volume_size, chunk_size, factor)
+
+        if comm is not None and comm.Get_size() > 1:
+            comm.barrier()
+
+    cv_args = dict(
+        bounded=True, fill_missing=True, autocrop=False,
+        cache=False, compress_cache=None, cdn_cache=False,
+        progress=False, info=None, provenance=None,
+        compress=(mode=='segmentation'), non_aligned_writes=True, parallel=1)
+
+    # Write each MIP level as a set of chunk-aligned blocks so that no two
+    # threads ever touch the same chunk, then pool the level to get the next.
+    with ThreadPool(parallel) as pool:
+        for m in range(mip + 1):
+            cv = CloudVolume(path, mip=m, **cv_args)
+            start = origin // np.power(np.asarray(factor), m) + \
+                np.asarray(cv.voxel_offset)
+            blocks = _chunk_aligned_blocks(
+                start, img.shape[:3], cv.chunk_size, cv.voxel_offset)
+            pool.map(functools.partial(_write_block, cv, img, start), blocks)
+
+            if m < mip:
+                img = _downsample(img, factor, mode)
+
+    return CloudVolume(path, mip=0, **cv_args)
+
+
+def _cloudvolume_exists(path):
+    """Determine whether a CloudVolume layer has already been created."""
+    from cloudvolume import CloudVolume
+    from cloudvolume.exceptions import InfoUnavailableError
+
+    if path.startswith('file://'):
+        return os.path.isfile(os.path.join(path[len('file://'):], 'info'))
+    try:
+        CloudVolume(path, progress=False)
+    except InfoUnavailableError:
+        return False
+    return True
+
+
+def _create_cloudvolume_layer(img, path, mode, origin, mip, resolution,
+                              voxel_offset, volume_size, chunk_size, factor):
+    """Write the info file of a new CloudVolume layer."""
+    from cloudvolume import CloudVolume
+
+    if voxel_offset is None:
+        voxel_offset = (0, 0, 0)
+    if volume_size is None:
+        volume_size = origin + np.asarray(img.shape[:3])
+
+    info = CloudVolume.create_new_info(
+        num_channels=img.shape[-1],
+        layer_type=mode,
+        data_type=str(img.dtype),
+        encoding='raw' if mode == 'image' else 'compressed_segmentation',
+        resolution=list(resolution),
+        voxel_offset=list(voxel_offset),
+        volume_size=[int(i) for i in volume_size],
+        chunk_size=list(chunk_size),
+        max_mip=mip,
+        factor=list(factor)
+    )
+
+    if mode == 'segmentation':
+        for scale in info['scales'][1:]:
+            scale['compressed_segmentation_block_size'] = \
+                info['scales'][0]['compressed_segmentation_block_size']
+
+    cv = CloudVolume(path, info=info, progress=False)
+    cv.commit_info()
+
+
+def _chunk_aligned_blocks(start, shape, chunk_size, voxel_offset):
+    """Split a region into blocks that fall on layer chunk boundaries.
+
+    Parameters
+    ----------
+    start : array_like
+        The first voxel of the region.
+    shape : tuple of int
+        The shape of the region.
+    chunk_size : array_like
+        The chunk size of the layer.
+    voxel_offset : array_like
+        The voxel offset of the layer, where the chunk grid starts.
+
+    Returns
+    -------
+    blocks : list of tuple of slice
+        Slices into the region (not the layer) for each block.
+    """
+    bounds = []
+    for s, n, c, o in zip(start, shape, chunk_size, voxel_offset):
+        s, n, c, o = int(s), int(n), int(c), int(o)
+        first = o + ((s - o) // c + 1) * c
+        edges = [s] + list(range(first, s + n, c)) + [s + n]
+        bounds.append([slice(edges[i] - s, edges[i + 1] - s)
+                       for i in range(len(edges) - 1)])
+    return list(itertools.product(*bounds))
+
+
+def _write_block(cv, img, start, block):
+    """Write one block of ``img`` into a CloudVolume layer."""
+    dest = tuple([slice(int(start[i]) + b.start, int(start[i]) + b.stop)
+                  for i, b in enumerate(block)])
+    cv[dest] = img[block]
+
+
+def _downsample(img, factor, mode):
+    """Pool an (x, y, z, channel) volume by ``factor`` along the first axes.
+
+    Parameters
+    ----------
+    img : numpy.ndarray
+        The volume to downsample.
+    factor : tuple of int
+        The pooling factor along the x, y, and z axes.
+    mode : {'image', 'segmentation'}
+        Images are mean pooled, segmentations are mode pooled.
+
+    Returns
+    -------
+    pooled : numpy.ndarray
+    """
+    factor = tuple(factor) + (1,)
+
+    # Replicate edge voxels so that every axis divides evenly, then view each
+    # pooling window as the last axis of the array.
+    pad = [(0, -s % f) for s, f in zip(img.shape, factor)]
+    if any(p[1] > 0 for p in pad):
+        img = np.pad(img, pad, mode='edge')
+
+    shape = []
+    for s, f in zip(img.shape, factor):
+        shape.extend([s // f, f])
+    blocks = img.reshape(shape).transpose(0, 2, 4, 6, 1, 3, 5, 7)
+    blocks = blocks.reshape(blocks.shape[:4] + (-1,))
+
+    if mode == 'segmentation':
+        counts = np.stack(
+            [np.sum(blocks == blocks[..., i:i + 1], axis=-1)
+             for i in range(blocks.shape[-1])],
+            axis=-1)
+        pooled = np.take_along_axis(
+            blocks, np.argmax(counts, axis=-1)[..., np.newaxis], axis=-1)
+        pooled = pooled[..., 0]
+    else:
+        pooled = blocks.mean(axis=-1)
+        if np.issubdtype(img.dtype, np.integer):
+            pooled = np.round(pooled)
+        pooled = pooled.astype(img.dtype)
+
+    return pooled
+
+
+def _layer_path(path):
+    """Get the CloudVolume path of a layer, making local paths absolute."""
+    if re.search(r'^[a-zA-Z\d]+://.+$', path):
+        return path
+    return 'file://{}'.format(os.path.abspath(path))
+
+
+def _mpi_comm():
+    """Get the MPI world communicator if MPI is already in use.
+
+    Importing ``mpi4py.MPI`` initializes MPI, so layer creation is only
+    coordinated across ranks when the calling program has already done so.
+    """
+    if 'mpi4py.MPI' in sys.modules:
+        return sys.modules['mpi4py.MPI'].COMM_WORLD
+    return None
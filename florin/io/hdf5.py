@@ -0,0 +1,362 @@
+"""I/O for HDF5 files.
+
+Open HDF5 files are shared through a per-process pool, so repeated loads of
+the same file reuse one handle and the number of open files stays bounded.
+
+Classes
+-------
+HDF5Dataset
+    Managed, picklable handle to a dataset in an HDF5 file.
+HDF5FilePool
+    Per-process pool of open HDF5 files with LRU eviction.
+
+Functions
+---------
+load_hdf5
+    Load data from an HDF5 file.
+save_hdf5
+    Save an image to HDF5 format.
+"""
+
+import atexit
+from collections import OrderedDict
+import os
+import threading
+
+
+class HDF5FilePool(object):
+    """Per-process pool of open HDF5 files with LRU eviction.
+
+    Parameters
+    ----------
+    max_open : int
+        The maximum number of files to keep open. When exceeded, the least
+        recently used file without outstanding references is closed.
+
+    Notes
+    -----
+    Files opened for writing hold HDF5's file lock, which keeps other
+    processes from reading them, so writers should close them when done
+    (see ``release``).
+
+    Handles inherited from a parent process are not safe to use after a fork.
+    The pool detects when it is used from a new process and opens fresh
+    handles. Inherited read-only files are closed in the new process first,
+    otherwise HDF5 would share the inherited file descriptor between
+    processes. Inherited writable files are left untouched so that the child
+    does not flush the parent's pending writes.
+    """
+
+    def __init__(self, max_open=32):
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self._refcounts = {}
+        self._inherited = []
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    def __contains__(self, path):
+        self._check_pid()
+        return os.path.abspath(path) in self._files
+
+    def __len__(self):
+        self._check_pid()
+        return len(self._files)
+
+    def get(self, path, mode='r'):
+        """Get an open file from the pool, opening it if necessary.
+
+        Parameters
+        ----------
+        path : str
+            Path to the HDF5 file.
+        mode : {'r', 'r+', 'a'}
+            The access needed. Files opened read-only are reopened for
+            writing if a writable mode is requested.
+
+        Returns
+        -------
+        f : h5py.File
+        """
+        import h5py
+
+        path = os.path.abspath(path)
+        with self._lock:
+            self._check_pid()
+            f = self._files.get(path)
+
+            if f is not None and (not f.id.valid or
+                                  (mode != 'r' and f.mode == 'r')):
+                self._close(path)
+                f = None
+
+            if f is None:
+                f = h5py.File(path, mode)
+                self._files[path] = f
+                self._evict()
+            else:
+                self._files.move_to_end(path)
+
+            return f
+
+    def acquire(self, path, mode='r'):
+        """Get an open file and hold a reference to it.
+
+        Files with outstanding references are only closed once every file in
+        the pool is referenced. Call ``release`` when done with the file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the HDF5 file.
+        mode : {'r', 'r+', 'a'}
+            The access needed.
+
+        Returns
+        -------
+        f : h5py.File
+        """
+        with self._lock:
+            f = self.get(path, mode)
+            path = os.path.abspath(path)
+            self._refcounts[path] = self._refcounts.get(path, 0) + 1
+            return f
+
+    def release(self, path, close=False):
+        """Release a reference to a file obtained with ``acquire``.
+
+        Parameters
+        ----------
+        path : str
+            Path to the HDF5 file.
+        close : bool
+            If True, close the file if no references to it remain.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._check_pid()
+            count = self._refcounts.get(path, 0) - 1
+            if count > 0:
+                self._refcounts[path] = count
+            else:
+                self._refcounts.pop(path, None)
+                if close:
+                    self._close(path)
+
+    def close(self, path=None):
+        """Close one or all files in the pool.
+
+        Parameters
+        ----------
+        path : str, optional
+            Path to the file to close. If None, close every file.
+        """
+        with self._lock:
+            self._check_pid()
+            paths = list(self._files) if path is None \
+                else [os.path.abspath(path)]
+            for p in paths:
+                self._close(p)
+
+    def _check_pid(self):
+        """Start over with no open files if used from a forked process."""
+        if os.getpid() != self._pid:
+            for f in self._files.values():
+                if f.id.valid and f.mode == 'r':
+                    f.close()
+                else:
+                    self._inherited.append(f)
+            self._files = OrderedDict()
+            self._refcounts = {}
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+
+    def _close(self, path):
+        f = self._files.pop(path, None)
+        if f is not None and f.id.valid:
+            f.close()
+
+    def _evict(self):
+        while len(self._files) > self.max_open:
+            unreferenced = [p for p in self._files
+                            if self._refcounts.get(p, 0) == 0]
+            self._close(unreferenced[0] if len(unreferenced) > 0
+                        else next(iter(self._files)))
+
+
+class HDF5Dataset(object):
+    """Managed, picklable handle to a dataset in an HDF5 file.
+
+    The file is held open in the per-process ``HDF5FilePool`` while the
+    handle is alive. If the file is closed by the pool, or the handle is used
+    in another process (after a fork or being pickled), the file is reopened
+    on the next access.
+
+    Parameters
+    ----------
+    path : str
+        Path to the HDF5 file.
+    key : str
+        Key of the dataset in the file.
+    mode : {'r', 'r+', 'a'}
+        The file access mode. Use 'r+' or 'a' to write to the dataset. A
+        writable file is closed when its last handle is closed, releasing its
+        lock for readers in other processes.
+    """
+
+    def __init__(self, path, key='stack', mode='r'):
+        self.path = os.path.abspath(path)
+        self.key = key
+        self.mode = mode
+        self.closed = False
+        self._file = None
+        self._dataset = None
+        self._pid = None
+        self._acquire()
+
+    @property
+    def dataset(self):
+        """The underlying ``h5py.Dataset``."""
+        if self.closed:
+            raise ValueError('I/O operation on closed dataset {}[{}]'.format(
+                self.path, self.key))
+        if self._pid != os.getpid():
+            self._acquire()
+        if not self._file.id.valid:
+            self._file = _POOL.get(self.path, self.mode)
+            self._dataset = self._file[self.key]
+        return self._dataset
+
+    @property
+    def file_object(self):
+        """The ``h5py.File`` containing the dataset."""
+        self.dataset
+        return self._file
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        return self.dataset.ndim
+
+    @property
+    def chunks(self):
+        return self.dataset.chunks
+
+    @property
+    def attrs(self):
+        return self.dataset.attrs
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, key):
+        return self.dataset[key]
+
+    def __setitem__(self, key, val):
+        self.dataset[key] = val
+
+    def __array__(self, dtype=None):
+        img = self.dataset[()]
+        return img if dtype is None else img.astype(dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        return {'path': self.path, 'key': self.key, 'mode': self.mode}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], key=state['key'], mode=state['mode'])
+
+    def close(self):
+        """Release this handle's reference to the file."""
+        if not self.closed and self._pid == os.getpid():
+            _POOL.release(self.path, close=self.mode != 'r')
+        self.closed = True
+        self._file = None
+        self._dataset = None
+
+    def _acquire(self):
+        self._file = _POOL.acquire(self.path, self.mode)
+        self._dataset = self._file[self.key]
+        self._pid = os.getpid()
+
+
+# Files opened by this process, closed automatically at exit.
+_POOL = HDF5FilePool()
+atexit.register(_POOL.close)
+
+
+def file_pool():
+    """Get the pool of open HDF5 files for this process.
+
+    Returns
+    -------
+    pool : florin.io.hdf5.HDF5FilePool
+    """
+    return _POOL
+
+
+def load_hdf5(path, key='stack', keep_alive=False, mode='r'):
+    """Load data from an HDF5 file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the HDF5 file to load.
+    key
+        Key to load data from.
+    keep_alive : bool
+        If True, return a managed handle to the dataset instead of reading
+        it into memory. Default: False.
+    mode : {'r', 'r+', 'a'}
+        The file access mode of a managed handle. Default: 'r'.
+
+    Returns
+    -------
+    data : numpy.ndarray or florin.io.HDF5Dataset
+    """
+    if keep_alive:
+        img = HDF5Dataset(path, key=key, mode=mode)
+    else:
+        img = _POOL.get(path, 'r')[key][()]
+
+    return img
+
+
+def save_hdf5(img, path, key='stack', overwrite=True):
+    """Save an image to HDF5 format.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to.
+
+    Notes
+    -----
+    The file is closed once written, unless a managed handle is using it, so
+    that readers in other processes are not blocked by its lock.
+    """
+    f = _POOL.acquire(path, 'a')
+    try:
+        if overwrite and key in f:
+            del f[key]
+        f.create_dataset(key, data=img)
+        f.flush()
+    finally:
+        _POOL.release(path, close=True)
@@ -0,0 +1,114 @@
+"""I/O for standard image formats and directories of images.
+
+Functions
+---------
+load_image
+    Load an image file.
+load_images
+    Load a directory of image files.
+save_image
+    Save an image.
+save_images
+    Save a sequence of images.
+"""
+
+import glob
+import os
+import sys
+
+import numpy as np
+
+
+def load_image(path):
+    """Load an image file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the image file to load.
+
+    Returns
+    -------
+    data : numpy.ndarray
+    """
+    from skimage.io import imread
+
+    img = imread(path)
+    return img
+
+
+def load_images(path, ext='png'):
+    """Load a directory of image files.
+
+    Parameters
+    ----------
+    path : str
+        Path to the image file(s) to load.
+    ext : str
+        The file extension to match. Only files with this extension will be
+        loaded. Default: 'png'
+
+    Returns
+    -------
+    data : numpy.ndarray
+    """
+    from skimage.io import imread
+
+    img_names = sorted(glob.glob(os.path.join(path, '*' + ext)))
+    imgs = None
+    for i, img in enumerate(img_names):
+        img = imread(img)
+        if imgs is None:
+            imgs = np.zeros((len(img_names),) + img.shape, dtype=img.dtype)
+        imgs[i] += img
+    return imgs
+
+
+def save_image(img, path):
+    """Save an image.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to.
+    """
+    from skimage.io import imsave
+
+    _, ext = os.path.splitext(path)
+    ext = ext.strip('.').lower()
+
+    if ext == '':
+        ext = 'png'
+        path = os.path.join(path, 'image.' + ext)
+
+    imsave(path, img)
+
+
+def save_images(img, path, ext='png'):
+    """Save a sequence of images.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to.
+    ext : str
+        The file extension to save each image with.
+    """
+    from skimage.io import imsave
+
+    if os.path.isfile(path) or img.ndim == 2:
+        save_image(img, path)
+    elif img.ndim == 3:
+        if not os.path.isdir(path):
+            if sys.version_info.major == 3:
+                os.makedirs(path, exist_ok=True)
+            else:
+                os.makedirs(path)
+        zeros = int(np.floor(np.log10(img.shape[0])) + 1)
+        for i in range(img.shape[0]):
+            fpath = '{}.{}'.format(str(i).zfill(zeros), ext.strip('.').lower())
+            imsave(os.path.join(path, fpath), img[i])
@@ -0,0 +1,43 @@
+"""I/O for numpy array files.
+
+Functions
+---------
+load_npy
+    Load data from a numpy array file.
+save_npy
+    Save an image to a numpy array file.
+"""
+
+import numpy as np
+
+
+def load_npy(path, mmap_mode=None):
+    """Load data from a numpy array file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the array file to load.
+    mmap_mode : {None, 'r+', 'r', 'w+', 'c'}
+        If not None, memory-map the file with the given mode instead of
+        reading it into memory. See ``numpy.load``.
+
+    Returns
+    -------
+    data : numpy.ndarray
+    """
+    img = np.load(path, mmap_mode=mmap_mode)
+    return img
+
+
+def save_npy(img, path):
+    """Save an image to a numpy array file.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to.
+    """
+    np.save(path, img)
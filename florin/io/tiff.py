@@ -0,0 +1,238 @@
+"""I/O for TIFF stacks.
+
+Classes
+-------
+TiffStack
+    Lazy, page-indexed view of a multi-page TIFF stack.
+TiffStackWriter
+    Incrementally append pages to a TIFF stack.
+
+Functions
+---------
+load_tiff
+    Load a TIFF stack.
+save_tiff
+    Save an image to TIFF format.
+"""
+
+import numpy as np
+
+
+# Size above which TIFF files are written as BigTIFF, leaving headroom under
+# the 4 GB limit of classic TIFF for tags and page offsets.
+_BIGTIFF_THRESHOLD = 2 ** 32 - 2 ** 25
+
+
+def load_tiff(path, lazy=False):
+    """Load a TIFF stack.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TIFF stack to load.
+    lazy : bool
+        If True, return a ``TiffStack`` that reads pages on access instead of
+        loading the whole stack. Default: False.
+
+    Returns
+    -------
+    data : numpy.ndarray or florin.io.TiffStack
+    """
+    import tifffile
+
+    if lazy:
+        img = TiffStack(path)
+    else:
+        img = tifffile.imread(path)
+    return img
+
+
+def save_tiff(img, path, bigtiff=None):
+    """Save an image to TIFF format.
+
+    Parameters
+    ----------
+    img : array_like or iterable of array_like
+        The image/volume to save, or a sequence of pages/slabs of pages that
+        will be appended to the stack one at a time.
+    path : str
+        The filepath to save the data to.
+    bigtiff : bool, optional
+        If True, write a BigTIFF file. If None, arrays larger than 4 GB and
+        any streamed input, whose size is not known ahead of time, are
+        written as BigTIFF.
+    """
+    if hasattr(img, 'shape'):
+        if bigtiff is None:
+            nbytes = np.prod(img.shape) * np.dtype(img.dtype).itemsize
+            bigtiff = nbytes > _BIGTIFF_THRESHOLD
+        img = [img]
+    elif bigtiff is None:
+        bigtiff = True
+
+    with TiffStackWriter(path, bigtiff=bigtiff) as writer:
+        for pages in img:
+            writer.write(pages)
+
+
+class TiffStack(object):
+    """Lazy, page-indexed view of a multi-page TIFF stack.
+
+    Pages are only read from disk when they are indexed. If the image data in
+    the file are uncompressed and stored contiguously, the stack is
+    memory-mapped instead.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TIFF stack to open.
+
+    Attributes
+    ----------
+    shape : tuple of int
+        The shape of the stack, with pages along the first axis.
+    dtype : numpy.dtype
+        The data type of the stack.
+    memmapped : bool
+        True if the stack is memory-mapped.
+    """
+
+    def __init__(self, path):
+        import tifffile
+
+        self.path = path
+        self._tiff = tifffile.TiffFile(path)
+
+        page = self._tiff.pages[0]
+        self.shape = (len(self._tiff.pages),) + tuple(page.shape)
+        self.dtype = np.dtype(page.dtype)
+
+        try:
+            self._memmap = tifffile.memmap(path, mode='r')
+            if self._memmap.shape != self.shape:
+                self._memmap = None
+        except ValueError:
+            self._memmap = None
+
+    @property
+    def memmapped(self):
+        return self._memmap is not None
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self._memmap is not None:
+            return self._memmap[key]
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        # Expand any ellipsis so that the first entry always indexes pages.
+        for i, k in enumerate(key):
+            if k is Ellipsis:
+                fill = (slice(None),) * (self.ndim - len(key) + 1)
+                key = key[:i] + fill + key[i + 1:]
+                break
+
+        if len(key) == 0:
+            key = (slice(None),)
+
+        pages = np.arange(len(self))[key[0]]
+        rest = key[1:]
+
+        if pages.ndim == 0:
+            return self._tiff.pages[int(pages)].asarray()[rest]
+
+        out = None
+        for i, page in enumerate(pages):
+            data = self._tiff.pages[int(page)].asarray()[rest]
+            if out is None:
+                out = np.zeros((len(pages),) + data.shape, dtype=data.dtype)
+            out[i] = data
+
+        if out is None:
+            out = np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+            out = out[(slice(None),) + rest]
+        return out
+
+    def __array__(self, dtype=None):
+        img = self[:]
+        return img if dtype is None else img.astype(dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        """Close the underlying file."""
+        self._memmap = None
+        self._tiff.close()
+
+
+class TiffStackWriter(object):
+    """Incrementally append pages to a TIFF stack.
+
+    Pages are written as they are received, so a stack can be built from a
+    stream of results without holding the full volume in memory. Uncompressed
+    pages of the same shape are stored contiguously and may be memory-mapped
+    by ``TiffStack`` once written.
+
+    Parameters
+    ----------
+    path : str
+        The filepath to write the stack to.
+    bigtiff : bool
+        If True, write a BigTIFF file. Required for files larger than 4 GB.
+    append : bool
+        If True, append pages to an existing TIFF file.
+
+    Attributes
+    ----------
+    pages : int
+        The number of pages written so far.
+    """
+
+    def __init__(self, path, bigtiff=False, append=False):
+        import tifffile
+
+        self.path = path
+        self.bigtiff = bigtiff
+        self.pages = 0
+        self._writer = tifffile.TiffWriter(path, bigtiff=bigtiff, append=append)
+
+    def write(self, img):
+        """Append one or more pages to the stack.
+
+        Parameters
+        ----------
+        img : array_like
+            A 2D page, or an array of pages stacked along the first axis.
+        """
+        img = np.asarray(img)
+        pages = [img] if img.ndim == 2 else img
+        for page in pages:
+            self._writer.write(np.ascontiguousarray(page), contiguous=True)
+            self.pages += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Finish writing and close the file."""
+        self._writer.close()
@@ -0,0 +1,187 @@
+"""I/O for Zarr and N5 chunked arrays.
+
+Zarr and N5 store every chunk of an array in its own file, so separate
+processes may read and write non-overlapping, chunk-aligned regions of the
+same array concurrently without any locking.
+
+Functions
+---------
+is_zarr
+    Determine whether a path refers to a Zarr or N5 store.
+load_zarr
+    Load data from a Zarr or N5 store.
+open_zarr
+    Open or create an array in a Zarr or N5 store.
+save_zarr
+    Save an image to a Zarr or N5 store.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def is_zarr(path):
+    """Determine whether a path refers to a Zarr or N5 store.
+
+    Parameters
+    ----------
+    path : str
+        The path to check.
+
+    Returns
+    -------
+    bool
+        True if ``path`` has a '.zarr' or '.n5' extension or is a directory
+        containing Zarr or N5 metadata.
+    """
+    _, ext = os.path.splitext(path.rstrip(os.path.sep))
+    if ext.lower() in ['.zarr', '.n5']:
+        return True
+    return os.path.isdir(path) and (
+        any(os.path.isfile(os.path.join(path, f))
+            for f in ['.zarray', '.zgroup']) or _is_n5(path))
+
+
+def load_zarr(path, key=None, lazy=False):
+    """Load data from a Zarr or N5 store.
+
+    Parameters
+    ----------
+    path : str
+        Path to the store to load.
+    key : str, optional
+        Key of the array to load from a group. If the store is a group and no
+        key is supplied, 'stack' is loaded.
+    lazy : bool
+        If True, return the ``zarr.Array`` so that data is read on access.
+        Default: False.
+
+    Returns
+    -------
+    data : numpy.ndarray or zarr.Array
+    """
+    img = open_zarr(path, key=key, mode='r')
+    if not lazy:
+        img = img[...]
+    return img
+
+
+def open_zarr(path, key=None, mode='r', **kwargs):
+    """Open or create an array in a Zarr or N5 store.
+
+    Parameters
+    ----------
+    path : str
+        Path to the store. Paths ending in '.n5' or containing N5 metadata are
+        opened as N5.
+    key : str, optional
+        Key of the array in a group. If None, the array at the root of the
+        store is opened, or 'stack' if the root is a group.
+    mode : {'r', 'r+', 'a', 'w', 'w-'}
+        The persistence mode, see ``zarr.open_array``.
+
+    Other Parameters
+    ----------------
+    Additional keyword arguments (e.g. ``shape``, ``chunks``, ``dtype``) are
+    passed to ``zarr.open_array`` when creating the array.
+
+    Returns
+    -------
+    data : zarr.Array
+    """
+    import zarr
+
+    store = _store(path)
+
+    if key is None:
+        if mode not in ['r', 'r+'] or not zarr.storage.contains_group(store):
+            try:
+                return zarr.open_array(store, mode=mode, **kwargs)
+            except zarr.errors.ContainsArrayError:
+                # Another process created the array after zarr checked for
+                # it, e.g. when every MPI rank writes tiles into one store.
+                if mode != 'a':
+                    raise
+                return zarr.open_array(store, mode='r+')
+        key = 'stack'
+
+    group = zarr.open_group(store, mode='r' if mode == 'r' else 'a')
+    if mode in ['r', 'r+']:
+        return group[key]
+    elif mode == 'a':
+        try:
+            return group.require_dataset(key, **kwargs)
+        except zarr.errors.ContainsArrayError:
+            return group[key]
+    return group.create_dataset(key, overwrite=(mode == 'w'), **kwargs)
+
+
+def save_zarr(img, path, key=None, chunks=None, origin=None, shape=None,
+              overwrite=True):
+    """Save an image to a Zarr or N5 store.
+
+    Parameters
+    ----------
+    img : array_like
+        The image/volume to save.
+    path : str
+        The filepath to save the data to.
+    key : str, optional
+        Key of the array in a group. If None, the array is stored at the root
+        of the store.
+    chunks : tuple of int, optional
+        The chunk shape of a new array. If None, Zarr chooses a chunk shape.
+    origin : tuple of int, optional
+        If supplied, write ``img`` into the region of an existing array
+        starting at ``origin`` instead of replacing the array. Tiles written
+        by separate processes that do not share chunks need no locking.
+    shape : tuple of int, optional
+        The shape of the array to create if writing at ``origin`` and the
+        array does not yet exist.
+    overwrite : bool
+        If True, replace any existing array when ``origin`` is None.
+
+    Returns
+    -------
+    data : zarr.Array
+        The array that was written to.
+    """
+    img = np.asarray(img)
+
+    if origin is None:
+        out = open_zarr(path, key=key, mode='w' if overwrite else 'w-',
+                        shape=img.shape, dtype=img.dtype,
+                        chunks=chunks if chunks is not None else True)
+        out[...] = img
+    else:
+        if shape is None:
+            out = open_zarr(path, key=key, mode='r+')
+        else:
+            out = open_zarr(path, key=key, mode='a', shape=shape,
+                            dtype=img.dtype,
+                            chunks=chunks if chunks is not None else img.shape)
+        slices = tuple([slice(o, o + s) for o, s in zip(origin, img.shape)])
+        out[slices] = img
+
+    return out
+
+
+def _is_n5(path):
+    """Check for the root attributes file of an N5 container."""
+    try:
+        with open(os.path.join(path, 'attributes.json'), 'r') as f:
+            return 'n5' in json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+
+
+def _store(path):
+    """Create the Zarr store for a path."""
+    import zarr
+
+    _, ext = os.path.splitext(path.rstrip(os.path.sep))
+    if ext.lower() == '.n5' or _is_n5(path):
+        return zarr.N5Store(path)
+    return zarr.DirectoryStore(path)
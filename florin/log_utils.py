@@ -1,42 +1,220 @@
+"""Logging for FLoRIN pipelines.
+
+Log records are handed to a queue and written to stdout by a background
+thread, so operations never wait on the terminal. Per-call timing lines are
+only formatted if they will be written, and can be sampled or replaced by a
+per-operation summary for runs with many small tiles.
+
+Classes
+-------
+FlorinLogger
+    Logger for FLoRIN pipelines.
+"""
+
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
 
 
 class FlorinLogger(object):
-    def __init__(self, quiet=False):
-        self.logger = logging.getLogger('florin')
+    """Logger for FLoRIN pipelines.
+
+    Parameters
+    ----------
+    quiet : bool
+        If True, log nothing. Default: False.
+    summary_mode : bool
+        If True, aggregate the running time of each operation instead of
+        logging every call, see ``summary``. Default: False.
+    sample : int
+        Log the running time of only every ``sample``-th call of each
+        operation, if not in summary mode. Default: 1.
 
-        if not quiet:
-            self.handler = logging.StreamHandler(sys.stdout)
-            self.formatter = logging.Formatter(
-                '%(asctime)s %(name)s : %(message)s')
-            self.handler.setFormatter(self.formatter)
-        else:
-            self.handler = logging.NullHandler()
+    Attributes
+    ----------
+    logger : logging.Logger
+        The underlying 'florin' logger.
 
-        self.logger.setLevel(logging.INFO)
+    Examples
+    --------
+    Silence logging, or summarize running times instead of logging each call:
+
+    >>> florin.logger.quiet = True
+    >>> florin.logger.summary_mode = True
+    >>> pipeline.run(data)
+    >>> florin.logger.summary()
+    """
+
+    def __init__(self, quiet=False, summary_mode=False, sample=1):
+        self.logger = logging.getLogger('florin')
+        self.formatter = logging.Formatter(
+            '%(asctime)s %(name)s : %(message)s')
+        self.handler = _BackgroundHandler(self.formatter)
         self.logger.addHandler(self.handler)
+
+        self.summary_mode = summary_mode
+        self.sample = sample
+        self._stats = {}
+        self._calls = {}
+        self._lock = threading.Lock()
         self.quiet = quiet
+        atexit.register(self._shutdown)
 
-    def __setattr__(self, key, val):
-        if key == 'quiet':
-            self.logger.removeHandler(self.handler)
-            self.handler = logging.StreamHandler(sys.stdout) if not val \
-                           else logging.NullHandler()
-            if not val:
-                self.handler.setFormatter(self.formatter)
-            self.logger.addHandler(self.handler)
+    @property
+    def quiet(self):
+        """bool : If True, log nothing."""
+        return not self.logger.isEnabledFor(logging.INFO)
 
-        super(FlorinLogger, self).__setattr__(key, val)
+    @quiet.setter
+    def quiet(self, val):
+        self.logger.setLevel(logging.WARNING if val else logging.INFO)
 
-    def info(self, msg):
-        self.logger.info(msg)
+    @property
+    def enabled(self):
+        """bool : True if informational messages are logged."""
+        return self.logger.isEnabledFor(logging.INFO)
 
-    def quiet(self):
-        self.quiet = True
+    def info(self, msg, *args):
+        """Log an informational message.
+
+        Parameters
+        ----------
+        msg : str
+            The message, optionally with %-style placeholders.
+        *args
+            Values for the placeholders, only formatted if the message is
+            logged.
+        """
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args)
+
+    def timing(self, name, seconds):
+        """Log the running time of a call to an operation.
+
+        Parameters
+        ----------
+        name : str
+            The name of the operation.
+        seconds : float
+            The running time of the call.
+        """
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        if self.summary_mode:
+            with self._lock:
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = [0, 0.0, 0.0]
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+            return
+
+        if self.sample > 1:
+            with self._lock:
+                calls = self._calls[name] = self._calls.get(name, 0) + 1
+            if (calls - 1) % self.sample != 0:
+                return
+
+        self.logger.info('Function %s: running time %0.3fs', name, seconds)
+
+    def summary(self, reset=True):
+        """Log and return the running times of each operation.
+
+        Only calls made in summary mode are counted.
+
+        Parameters
+        ----------
+        reset : bool
+            If True, start the next summary from scratch. Default: True.
+
+        Returns
+        -------
+        summary : dict
+            Maps the name of each operation to its number of 'calls', and its
+            'total' and 'max' running time in seconds.
+        """
+        with self._lock:
+            stats = self._stats
+            if reset:
+                self._stats = {}
+
+        summary = {}
+        for name, (calls, total, longest) in sorted(stats.items()):
+            summary[name] = {'calls': calls, 'total': total, 'max': longest}
+            self.info('Function %s: %d calls, total %0.3fs, mean %0.3fs, '
+                      'max %0.3fs', name, calls, total, total / calls,
+                      longest)
+        return summary
 
     def verbose(self):
+        """Resume logging after ``quiet`` was set."""
         self.quiet = False
 
+    def _shutdown(self):
+        if self.summary_mode and len(self._stats) > 0:
+            self.summary()
+        self.handler.close()
+
+
+class _BackgroundHandler(logging.handlers.QueueHandler):
+    """Queue handler that writes records to stdout on a background thread.
+
+    The thread is started on the first record logged in each process, so
+    forked workers start their own.
+    """
+
+    def __init__(self, formatter):
+        super(_BackgroundHandler, self).__init__(queue.Queue())
+        self.setFormatter(formatter)
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        self.queue.put_nowait(record)
+
+    def flush(self):
+        """Write every queued record."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener.start()
+
+    def close(self):
+        """Write every queued record and stop the background thread."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        super(_BackgroundHandler, self).close()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            stream = logging.StreamHandler(_Stdout())
+            stream.setFormatter(logging.Formatter('%(message)s'))
+            self.queue = queue.Queue()
+            self._listener = logging.handlers.QueueListener(self.queue, stream)
+            self._listener.start()
+            self._pid = os.getpid()
+
+
+class _Stdout(object):
+    """Writes to whatever ``sys.stdout`` is when a record is written."""
+
+    def write(self, s):
+        sys.stdout.write(s)
+
+    def flush(self):
+        sys.stdout.flush()
+
 
 logger = FlorinLogger()
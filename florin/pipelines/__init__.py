@@ -2,6 +2,8 @@
 
 Classes
 -------
+AsyncPipeline
+    Asynchronous computation overlapping I/O-bound operations.
 BalsamPipeline
     Distributed computation using the Balsam job submission database.
 MPIPipeline
@@ -12,18 +14,44 @@ MultithreadingPipeline
     Multithreading using the Python multithreading library.
 SerialPipeline
     Single-core serial deferred computation.
+TaskFarmPipeline
+    Task farming over a pluggable transport.
 WorkQueuePipeline
     Distributed computing using Work Queue to manage tasks.
 """
 
-from .pipeline import Pipeline
-from .balsam import BalsamPipeline
-from .mpi import MPIPipeline, MPITaskQueuePipeline
-from .multiprocess import MultiprocessingPipeline
-from .multithread import MultithreadingPipeline
-from .serial import SerialPipeline
-from .workqueue import WorkQueuePipeline
-
-__all__ = ['BalsamPipeline', 'MPIPipeline', 'MPITaskQueuePipeline',
-           'MultiprocessingPipeline', 'MultithreadingPipeline',
-           'SerialPipeline', 'WorkQueuePipeline']
+import importlib
+
+
+# Maps each pipeline class to the submodule it is imported from on first use.
+_LAZY = {
+    'AsyncPipeline': 'asynchronous',
+    'BalsamPipeline': 'balsam',
+    'MPIPipeline': 'mpi',
+    'MPITaskQueuePipeline': 'mpi',
+    'MultiprocessingPipeline': 'multiprocess',
+    'MultithreadingPipeline': 'multithread',
+    'Pipeline': 'pipeline',
+    'SerialPipeline': 'serial',
+    'TaskFarmPipeline': 'taskfarm',
+    'WorkQueuePipeline': 'workqueue',
+}
+
+__all__ = ['AsyncPipeline', 'BalsamPipeline', 'MPIPipeline',
+           'MPITaskQueuePipeline', 'MultiprocessingPipeline',
+           'MultithreadingPipeline', 'SerialPipeline', 'TaskFarmPipeline',
+           'WorkQueuePipeline']
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    module = importlib.import_module('{}.{}'.format(__name__, _LAZY[name]))
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
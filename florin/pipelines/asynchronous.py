@@ -0,0 +1,167 @@
+"""Asynchronous pipeline for I/O-bound operations.
+
+Classes
+-------
+AsyncPipeline
+    Pipeline that overlaps operations on an asyncio event loop.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+
+from florin.pipelines.pipeline import bounded_imap, Pipeline
+
+
+class AsyncPipeline(Pipeline):
+    """Pipeline that overlaps operations on an asyncio event loop.
+
+    Many data items move through the operations at once. Coroutine functions
+    (``async def``) are awaited on the event loop, and other operations are
+    offloaded to a thread pool, so that a single process can keep loading,
+    computing, and saving at the same time.
+
+    Parameters
+    ----------
+    operations : callables
+        The operations/functions/callable classes to run in this pipeline.
+    limits : dict, optional
+        The most calls of each operation, by name, that may run at once,
+        e.g. ``{'load': 16, 'ndnt': 4}``.
+    concurrency : int, optional
+        The most calls that may run at once for operations not in
+        ``limits``. Default: None, limited only by ``window``.
+    threads : int, optional
+        The number of threads to offload synchronous operations to. Default:
+        the ``concurrent.futures.ThreadPoolExecutor`` default.
+    inline : collection of str
+        Names of quick synchronous operations to run directly on the event
+        loop instead of a thread. Default: ('pipeline_input',).
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
+    window : int
+        The maximum number of items in flight. Default: 64.
+
+    Notes
+    -----
+    The event loop runs on a background thread that is started the first time
+    the pipeline is run, along with its thread pool, and both are kept until
+    ``close`` is called. Calls from synchronous code block until their
+    results are ready, so the pipeline may be used as a sub-pipeline or from
+    within another event loop's executor.
+
+    Checkpoints are read and written on the thread pool. Operations marked
+    with ``florin.batching.batched`` are not batched; the graph runs on the
+    thread pool for each item instead.
+    """
+
+    def __init__(self, *operations, limits=None, concurrency=None,
+                 threads=None, inline=('pipeline_input',), window=64,
+                 **kwargs):
+        super(AsyncPipeline, self).__init__(*operations, window=window,
+                                            **kwargs)
+        self.limits = dict(limits) if limits is not None else {}
+        self.concurrency = concurrency
+        self.threads = threads
+        self.inline = set(inline)
+
+    def imap(self, data, window=None, ordered=True):
+        loop = self._get_pool()
+        yield from bounded_imap(
+            lambda item: loop.submit(self._run_item(item, loop)),
+            data, window or self.window, ordered=ordered)
+
+    def run(self, data):
+        return list(self.imap(data))
+
+    async def _run_item(self, item, loop):
+        """Run one data item through the operations on the event loop."""
+        graph = self.operations
+        plan = graph.compile()
+
+        if plan.batched:
+            return await loop.offload(graph, item)
+
+        key, data, metadata = graph._split(item)
+        if key is not None and \
+           await loop.offload(graph.checkpoint.__contains__, key):
+            result = await loop.offload(graph.checkpoint.load, key)
+        else:
+            results = [None] * len(plan.nodes)
+            remaining = list(plan.consumers)
+            for i, node in enumerate(plan.nodes):
+                args, kwargs = plan._arguments(i, data, results)
+                async with loop.limit(i, self.limits.get(node.__name__,
+                                                         self.concurrency)):
+                    if asyncio.iscoroutinefunction(node.operation):
+                        results[i] = await node.run_async(*args, **kwargs)
+                    elif node.__name__ in self.inline:
+                        results[i] = node.run(*args, **kwargs)
+                    else:
+                        results[i] = await loop.offload(node.run, *args,
+                                                        **kwargs)
+                del args, kwargs
+                plan._finish(i, results, remaining, None)
+            result = results[plan.output]
+
+            if key is not None:
+                await loop.offload(graph.checkpoint.save, key, result)
+
+        if metadata is not None:
+            return result, metadata
+        return result
+
+    def _create_pool(self):
+        return _EventLoopThread(self.threads)
+
+    def _close_pool(self, loop):
+        loop.shutdown()
+
+
+class _EventLoopThread(object):
+    """An event loop running on a background thread with a thread pool."""
+
+    def __init__(self, threads=None):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.loop = asyncio.new_event_loop()
+        self.semaphores = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine, returning a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def offload(self, func, *args, **kwargs):
+        """Run a synchronous function on the thread pool."""
+        return self.loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    def limit(self, stage, limit):
+        """Get the semaphore bounding concurrent calls to a stage."""
+        if limit is None:
+            return _NoLimit()
+        if stage not in self.semaphores:
+            self.semaphores[stage] = asyncio.Semaphore(limit)
+        return self.semaphores[stage]
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown()
+
+
+class _NoLimit(object):
+    """Stand-in for a semaphore that never blocks."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
@@ -1,5 +1,34 @@
-from florin.pipelines.pipeline import Pipeline
+"""Distributed pipeline using the Balsam job database.
 
-class BalsamPipeline(Pipeline):
-    def run(self, data):
-        return next(map(self.operations, data))
+Classes
+-------
+BalsamPipeline
+    Distributed computation using the Balsam job submission database.
+"""
+
+from florin.pipelines.taskfarm import TaskFarmPipeline
+
+
+class BalsamPipeline(TaskFarmPipeline):
+    """Distributed computation using the Balsam job submission database.
+
+    Parameters
+    ----------
+    operations : callables
+        Sequence of operations to run in the pipeline.
+
+    Other Parameters
+    ----------------
+    Additional keyword arguments (e.g. ``transport``, ``workers``,
+    ``batch_size``, ``retries``) are passed to
+    ``florin.pipelines.taskfarm.TaskFarmPipeline``.
+
+    Notes
+    -----
+    Submitting tasks as Balsam jobs is not supported yet. Without a
+    ``transport``, tasks run on a local pool of processes. To run on Balsam,
+    pass a ``transport`` that submits each serialized task as a job running
+    ``python -m florin.pipelines.taskfarm``, see
+    ``florin.pipelines.taskfarm.Transport``.
+    """
+    pass
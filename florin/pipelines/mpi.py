@@ -4,14 +4,31 @@ Classes
 -------
 MPIPipeline
     MPI-based multiprocessing pipeline.
+MPITaskQueuePipeline
+    MPI-based master/worker task queue pipeline.
+
+Functions
+---------
+join_tiles_mpi
+    Join the tiles computed on every MPI rank into a single array.
 """
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import inspect
+from itertools import chain, islice
+from operator import itemgetter
+import os
 import sys
 
 import dill
+import numpy as np
 
-from florin.pipelines.pipeline import Pipeline
+from florin.batching import batches
+from florin.closure import florinate
+from florin.io.zarr import open_zarr
+from florin.pipelines.pipeline import bounded_imap, Pipeline
+from florin.tiling import join_tiles
 
 
 class MPIPipeline(Pipeline):
@@ -24,6 +41,24 @@ class MPIPipeline(Pipeline):
     max_workers : int, optional
         The maximum number of MPI processes to spawn. If None, scales to the
         MPI universe size.
+    batch_size : int or 'auto'
+        With ``threads``, the number of items each local worker runs as one
+        batch (see ``florin.batching``). Default: 1.
+    threads : int or 'auto', optional
+        The number of local workers in each spawned process. If 'auto', split
+        the cores of each node evenly between the processes spawned on it.
+        Default: None, to run one item at a time in each process.
+    ranks_per_node : int, optional
+        The number of spawned processes on each node, used when ``threads``
+        is 'auto'. Default: None, to count the processes that share memory
+        with each one.
+    local_pool : {'thread', 'process'}
+        The kind of local pool to run with ``threads``. Default: 'thread'.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
+    window : int, optional
+        The maximum number of items in flight when streaming. Default: twice
+        the number of workers.
 
     Notes
     -----
@@ -35,20 +70,57 @@ class MPIPipeline(Pipeline):
 
     .. _mpi4py.futures documentation: https://mpi4py.readthedocs.io/en/stable/mpi4py.futures.html
 
+    Spawned workers are kept for later calls and receive the operations once,
+    when they start. Call ``close`` to shut them down.
+
+    For hybrid parallelism, set ``threads`` to run a local pool in every
+    spawned process, as with ``MPITaskQueuePipeline``. Each task then carries
+    a batch of items for every local worker, and the number of local workers
+    is taken from the first process to start, so nodes should be alike.
     """
 
-    def __init__(self, *operations, max_workers=None):
-        super(MPIPipeline, self).__init__(*operations)
+    def __init__(self, *operations, max_workers=None, threads=None,
+                 ranks_per_node=None, local_pool='thread', **kwargs):
+        super(MPIPipeline, self).__init__(*operations, **kwargs)
         self.max_workers = max_workers
+        self.threads = threads
+        self.ranks_per_node = ranks_per_node
+        self.local_pool = local_pool
 
     def run(self, data):
-        from mpi4py import MPI
+        if self.threads is not None:
+            return list(self.imap(data))
+        return list(self._get_pool().map(_run_operations, data))
+
+    def imap(self, data, window=None, ordered=True):
+        pool = self._get_pool()
+        window = window or self.window or 2 * pool.num_workers
+        if self.threads is None:
+            yield from bounded_imap(
+                lambda item: pool.submit(_run_operations, item),
+                data, window, ordered=ordered)
+            return
+
+        size = self._batch_size(data, pool.num_workers * pool.local_workers)
+        chunks = batches(data, size * pool.local_workers)
+        for results in bounded_imap(
+                lambda chunk: pool.submit(_run_local, chunk, size),
+                chunks, window, ordered=ordered):
+            yield from results
+
+    def _create_pool(self):
         from mpi4py.futures import MPIPoolExecutor
-        MPI.pickle.__init__(dill.dumps, dill.loads)
 
-        with MPIPoolExecutor(max_workers=self.max_workers) as pool:
-            result = pool.map(self.operations, data)
-        return result
+        # Spawned workers unpickle messages with the standard pickle module,
+        # so the operations are sent pickled with dill.
+        pool = MPIPoolExecutor(max_workers=self.max_workers,
+                               initializer=_set_operations,
+                               initargs=(dill.dumps(self.operations),
+                                         self.threads, self.ranks_per_node,
+                                         self.local_pool))
+        if self.threads is not None:
+            pool.local_workers = pool.submit(_local_worker_count).result()
+        return pool
 
 
 class MPITaskQueuePipeline(Pipeline):
@@ -57,38 +129,424 @@ class MPITaskQueuePipeline(Pipeline):
     Approximates a map operation using a task queue built on MPI send/recv
     semantics. Use when MPI_Comm_spawn is unavailable.
 
+    Rank 0 acts as the master, handing out batches of tasks to the other
+    ranks as they finish their previous batch, so that ranks given quick
+    tasks (e.g. empty tiles) take on more of them. By default, each rank
+    returns the results of the tasks it ran, in the order they were assigned.
+
+    For hybrid parallelism, set ``threads`` to run a local pool on every rank.
+    Workers then keep one batch in flight per local worker, and the master
+    runs batches on its own pool between handing out work, so that a job may
+    use one rank per node (or socket) with threads or processes inside it.
+
     Parameters
     ----------
     operations : callables
         Sequence of operations to run in the pipeline.
+    batch_size : int or 'auto'
+        The number of tasks handed to a worker at a time, which the worker
+        runs as one batch (see ``florin.batching``). Larger batches cut down
+        on messages when tasks are small. Default: 1.
+    gather : {None, 'root', 'all'}
+        If 'root', collect every result on rank ``root`` in the order of the
+        input data, and return an empty list on the other ranks. If 'all',
+        return every result on all ranks. Default: None, to keep results on
+        the rank that computed them.
+    root : int
+        The rank to gather results on. Default: 0.
+    comm : mpi4py.MPI.Comm, optional
+        The communicator to run over. Default: ``MPI.COMM_WORLD``.
+    threads : int or 'auto', optional
+        The number of local workers on each rank. If 'auto', split the cores
+        of each node evenly between the ranks on it. Default: None, to run
+        tasks one batch at a time on the rank itself.
+    ranks_per_node : int, optional
+        The number of ranks on each node, used when ``threads`` is 'auto'.
+        Default: None, to count the ranks that share memory with this one.
+    local_pool : {'thread', 'process'}
+        The kind of local pool to run with ``threads``. Threads suit
+        operations that release the GIL (most numpy and scikit-image code);
+        processes suit pure Python operations. Default: 'thread'.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results
+        computed on this rank.
 
     Notes
     -----
     MPI is configured by wrapping Python in an ``mpiexec`` or ``mpirun`` call
     at runtime.
 
+    If the data supports indexing (e.g. a list, array, or lazily loaded
+    volume), only task indices are sent, and each worker reads just the items
+    it is assigned. Generators (e.g. ``florin.tile``) are iterated only on the
+    master, which sends each item to the worker that will process it.
+
+    Every rank must run the pipeline, and each worker must consume all of its
+    results, since the master waits until every worker has asked for more
+    work. With a single rank, all tasks run locally. With ``threads`` set,
+    the master also returns the results of the tasks it ran.
+
+    Local pools are kept for later calls until ``close`` is called. A
+    process pool forks each rank, which some MPI implementations warn about
+    or do not support; prefer threads, or more ranks, where that is a
+    problem.
+
+    Gathering pickles the results. To combine tiles, leave ``gather`` unset
+    and follow this pipeline with ``mpi_join``, which reduces array buffers
+    directly or writes tiles into a shared chunked store.
+
     This Pipeline instance was built to work with the Cray mpich implementation
     of MPI, which does not necessarily provide MPI_Comm_spawn.
     """
 
+    def __init__(self, *operations, batch_size=1, gather=None, root=0,
+                 comm=None, threads=None, ranks_per_node=None,
+                 local_pool='thread', **kwargs):
+        super(MPITaskQueuePipeline, self).__init__(*operations, **kwargs)
+        self.batch_size = batch_size
+        self.gather = gather
+        self.root = root
+        self.comm = comm
+        self.threads = threads
+        self.ranks_per_node = ranks_per_node
+        self.local_pool = local_pool
+
+    def __getstate__(self):
+        state = super(MPITaskQueuePipeline, self).__getstate__()
+        state['comm'] = None
+        return state
+
     def run(self, data):
+        if self.gather is None:
+            return list(self.imap(data))
+
+        comm = _get_comm(self.comm)
+        results = list(self._imap_indexed(data))
+        if self.gather == 'all':
+            results = comm.allgather(results)
+        else:
+            results = comm.gather(results, root=self.root)
+
+        if results is None:
+            return []
+        return [r for _, r in sorted(chain(*results), key=itemgetter(0))]
+
+    def imap(self, data, window=None, ordered=True):
+        for _, result in self._imap_indexed(data):
+            yield result
+
+    def _imap_indexed(self, data):
+        """Run the task queue, yielding (index, result) pairs on this rank."""
+        comm = _get_comm(self.comm)
+
+        indexed = not inspect.isgenerator(data) and \
+            hasattr(data, '__getitem__') and hasattr(data, '__len__')
+
+        pool = self._get_pool() if self.threads is not None else None
+
+        if comm.Get_size() == 1:
+            yield from self._serve(comm, data, indexed, pool)
+            return
+
+        # Each run gets its own communicator, so that a worker that has
+        # already moved on to the next run cannot have its requests answered
+        # by a master still serving this one.
+        comm = comm.Dup()
+        try:
+            if comm.Get_rank() == 0 and pool is not None:
+                yield from self._serve(comm, data, indexed, pool)
+            elif comm.Get_rank() == 0:
+                # Without a local pool, the master only hands out work.
+                for _ in self._serve(comm, data, indexed):
+                    pass
+            elif pool is not None:
+                for pairs in bounded_imap(pool.submit,
+                                          self._work(comm, data, indexed),
+                                          pool.workers):
+                    yield from pairs
+            else:
+                for batch in self._work(comm, data, indexed):
+                    yield from self._run_batch(batch)
+        finally:
+            comm.Free()
+
+    def _run_batch(self, batch):
+        """Run a batch of (index, item) pairs, yielding (index, result)."""
+        results = self.operations.run_batch([item for _, item in batch])
+        yield from zip([i for i, _ in batch], results)
+
+    def _serve(self, comm, data, indexed, pool=None):
+        """Hand out batches of tasks until every worker has been stopped.
+
+        With a single rank or a local pool, the master runs batches itself,
+        yielding (index, result) pairs, and otherwise yields nothing.
+        """
         from mpi4py import MPI
-        MPI.pickle.__init__(dill.dumps, dill.loads)
-        comm = MPI.COMM_WORLD
-        rank = comm.Get_rank()
-        size = comm.Get_size()
-
-        idx = rank
-
-        results = []
-        if not inspect.isgenerator(data):
-            while idx < len(data):
-                in_data = data[idx]
-                results.append(self.operations(in_data))
-                idx += size
+
+        if indexed:
+            tasks = iter(range(len(data)))
         else:
-            for i, in_data in enumerate(data):
-                if i == idx:
-                    results.append(self.operations(in_data))
-                    idx += size
-        return results
+            tasks = enumerate(data)
+
+        workers = comm.Get_size() - 1
+        if pool is not None:
+            workers += pool.workers
+        size = self._batch_size(data, max(1, workers))
+        status = MPI.Status()
+        active = comm.Get_size() - 1
+
+        if active == 0 and pool is None:
+            for batch in batches(tasks, size):
+                yield from self._run_batch(self._items(batch, data, indexed))
+            return
+
+        local = deque()
+        while True:
+            # Pass on finished local results and keep the local pool busy, so
+            # that it only runs dry once every task has been handed out.
+            while len(local) > 0 and local[0].done():
+                yield from local.popleft().result()
+            while pool is not None and len(local) < pool.workers:
+                batch = list(islice(tasks, size))
+                if len(batch) == 0:
+                    break
+                local.append(pool.submit(self._items(batch, data, indexed)))
+
+            if active == 0:
+                if len(local) == 0:
+                    break
+                wait([local[0]])
+                continue
+
+            if len(local) > 0 and not comm.Iprobe(
+                    source=MPI.ANY_SOURCE, tag=_TAG_READY):
+                wait([local[0]], timeout=_POLL_INTERVAL)
+                continue
+
+            comm.recv(source=MPI.ANY_SOURCE, tag=_TAG_READY, status=status)
+            batch = list(islice(tasks, size))
+            if len(batch) > 0:
+                comm.send(batch, dest=status.Get_source(), tag=_TAG_TASK)
+            else:
+                comm.send(None, dest=status.Get_source(), tag=_TAG_STOP)
+                active -= 1
+
+    def _work(self, comm, data, indexed):
+        """Request batches from the master, yielding lists of (index, item)
+        pairs."""
+        from mpi4py import MPI
+
+        status = MPI.Status()
+        while True:
+            comm.send(None, dest=0, tag=_TAG_READY)
+            batch = comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+            if status.Get_tag() == _TAG_STOP:
+                break
+            yield self._items(batch, data, indexed)
+
+    @staticmethod
+    def _items(batch, data, indexed):
+        """Get the (index, item) pairs for a batch of tasks."""
+        if indexed:
+            return [(task, data[task]) for task in batch]
+        return batch
+
+    def _create_pool(self):
+        return _LocalPool(self.operations,
+                          _local_workers(self.threads, self.ranks_per_node,
+                                         self.comm),
+                          self.local_pool)
+
+
+class _LocalPool(object):
+    """Thread or process pool that runs batches of tasks on one rank."""
+
+    def __init__(self, operations, workers, kind='thread'):
+        if kind not in ('thread', 'process'):
+            raise ValueError(
+                "local_pool must be 'thread' or 'process', got {}".format(
+                    kind))
+        self.operations = operations
+        self.workers = workers
+        if kind == 'thread':
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            from multiprocess import Pool
+            from florin.pipelines import multiprocess
+            self.pool = Pool(workers, initializer=multiprocess._set_operations,
+                             initargs=(operations,))
+
+    def submit(self, batch):
+        """Run a list of (index, item) pairs, returning a future of
+        (index, result) pairs."""
+        indices = [i for i, _ in batch]
+        items = [item for _, item in batch]
+        future = Future()
+
+        def receive(results):
+            future.set_result(list(zip(indices, results)))
+
+        if isinstance(self.pool, ThreadPoolExecutor):
+            inner = self.pool.submit(self.operations.run_batch, items)
+            inner.add_done_callback(
+                lambda f: future.set_exception(f.exception())
+                if f.exception() is not None else receive(f.result()))
+        else:
+            from florin.pipelines import multiprocess
+            self.pool.apply_async(multiprocess._run_operations,
+                                  (items, False, True), callback=receive,
+                                  error_callback=future.set_exception)
+        return future
+
+    def shutdown(self):
+        if isinstance(self.pool, ThreadPoolExecutor):
+            self.pool.shutdown()
+        else:
+            self.pool.close()
+            self.pool.join()
+
+
+def join_tiles_mpi(tiles, out=None, root=0, all_ranks=False, comm=None,
+                   chunks=None):
+    """Join the tiles computed on every MPI rank into a single array.
+
+    Parameters
+    ----------
+    tiles : collection of FlorinArray
+        The tiles computed on this rank, e.g. the output of an
+        ``MPITaskQueuePipeline``. May be empty.
+    out : str, optional
+        Path to a Zarr or N5 store. If supplied, every rank writes its tiles
+        directly into the array at that path, which is created with chunks of
+        shape ``chunks``. Otherwise, tiles are joined in memory on each rank
+        and summed across ranks with an MPI reduction.
+    root : int
+        The rank to return the joined array on. Default: 0.
+    all_ranks : bool
+        If True, return the joined array on every rank. Default: False.
+    comm : mpi4py.MPI.Comm, optional
+        The communicator to join over. Default: ``MPI.COMM_WORLD``.
+    chunks : tuple of int, optional
+        The chunk shape of the array created in ``out``, normally the shape
+        the tiles were made with, see ``florin.join``.
+
+    Returns
+    -------
+    joined : array_like or None
+        The array created by joining the tiles from all ranks, as if by
+        ``florin.join``. None on ranks other than ``root`` unless
+        ``all_ranks`` is set. Arrays in a store are returned as a read-only
+        ``zarr.Array``.
+
+    Notes
+    -----
+    This is a collective operation that every rank must call. In-memory joins
+    are reduced with ``MPI_Reduce``/``MPI_Allreduce`` on the array buffers,
+    so tiles are never pickled, but each rank holds an array the size of the
+    full volume. Writing to a store keeps only the local tiles in memory;
+    tiles must be chunk-aligned and not overlap.
+    """
+    from mpi4py import MPI
+    comm = _get_comm(comm)
+    rank = comm.Get_rank()
+
+    if isinstance(out, str):
+        join_tiles(tiles, out=out, chunks=chunks)
+        comm.Barrier()
+        if all_ranks or rank == root:
+            return open_zarr(out, mode='r')
+        return None
+
+    local = join_tiles(tiles)
+
+    # Ranks without tiles (e.g. the task queue master) need the shape and
+    # type of the joined array to take part in the reduction.
+    info = comm.allgather(
+        None if local is None else (local.shape, local.dtype.str))
+    info = [i for i in info if i is not None]
+    if len(info) == 0:
+        return None
+    shape, dtype = info[0]
+    if local is None:
+        local = np.zeros(shape, dtype=dtype)
+
+    # Overlapping tiles are summed by join, which for masks is a logical or.
+    op = MPI.LOR if local.dtype == np.bool_ else MPI.SUM
+    local = np.ascontiguousarray(local)
+
+    if all_ranks:
+        joined = np.empty_like(local)
+        comm.Allreduce(local, joined, op=op)
+    elif rank == root:
+        joined = np.empty_like(local)
+        comm.Reduce(local, joined, op=op, root=root)
+    else:
+        comm.Reduce(local, None, op=op, root=root)
+        joined = None
+
+    return joined
+
+
+def _local_workers(threads, ranks_per_node=None, comm=None):
+    """Get the number of local workers to run on each rank."""
+    if threads != 'auto':
+        return threads
+
+    ranks = ranks_per_node
+    if ranks is None:
+        from mpi4py import MPI
+        node = _get_comm(comm).Split_type(MPI.COMM_TYPE_SHARED)
+        ranks = node.Get_size()
+        node.Free()
+    return max(1, (os.cpu_count() or 1) // ranks)
+
+
+def _get_comm(comm=None):
+    """Get the communicator to use, configuring mpi4py to pickle with dill."""
+    from mpi4py import MPI
+    MPI.pickle.__init__(dill.dumps, dill.loads)
+    return comm if comm is not None else MPI.COMM_WORLD
+
+
+mpi_join = florinate(join_tiles_mpi)
+
+
+# Message tags for the MPITaskQueuePipeline task queue.
+_TAG_READY = 1
+_TAG_TASK = 2
+_TAG_STOP = 3
+
+# Seconds the master waits on its local pool between checks for requests.
+_POLL_INTERVAL = 0.001
+
+
+# The operations run by this MPI worker, and its local pool, if any, set when
+# the worker starts.
+_OPERATIONS = None
+_LOCAL = None
+
+
+def _set_operations(operations, threads=None, ranks_per_node=None,
+                    local_pool='thread'):
+    global _OPERATIONS, _LOCAL
+    _OPERATIONS = operations = dill.loads(operations)
+    if threads is not None:
+        _LOCAL = _LocalPool(operations,
+                            _local_workers(threads, ranks_per_node),
+                            local_pool)
+
+
+def _run_operations(data):
+    return _OPERATIONS(data)
+
+
+def _run_local(items, size):
+    """Run items on this worker's local pool, in batches of ``size``."""
+    pairs = list(enumerate(items))
+    futures = [_LOCAL.submit(pairs[i:i + size])
+               for i in range(0, len(pairs), size)]
+    return [result for future in futures for _, result in future.result()]
+
+
+def _local_worker_count():
+    return _LOCAL.workers
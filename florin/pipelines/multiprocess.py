@@ -6,11 +6,13 @@ MultiprocessingPipeline
     Pipeline for multi-core parallel processing on a single machine.
 """
 
-import multiprocessing as mp
+from concurrent.futures import Future
+from itertools import chain
+import os
 
-from pathos.multiprocessing import ProcessPool
-
-from florin.pipelines.pipeline import Pipeline
+from florin import profiling
+from florin.pipelines.pipeline import bounded_imap, Pipeline
+from florin.pipelines.sharedmem import share, unshare
 
 
 class MultiprocessingPipeline(Pipeline):
@@ -23,16 +25,156 @@ class MultiprocessingPipeline(Pipeline):
     processes : int, optional
         The number of processes to use. Setting None will attempt to use as
         many as can be supported.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
+    window : int, optional
+        The maximum number of items (or batches) in flight when streaming.
+        Default: twice the number of processes.
+    shared_memory : bool
+        If True, pass arrays to and from workers through shared memory
+        instead of pickling them. Default: False.
+    shared_threshold : int
+        The smallest array, in bytes, to pass through shared memory. Smaller
+        arrays are pickled. Default: 1 MiB.
+    scratch_dir : str, optional
+        Directory for the shared scratch files. Default: ``/dev/shm`` if
+        available, otherwise the system temporary directory.
+
+    Notes
+    -----
+    The operations are sent to each worker once, when the pool starts, and
+    every task after that carries only its data item.
 
+    With ``shared_memory``, each large input array (or array in an input
+    tuple, e.g. a tile) is copied once into a memory-mapped scratch file and
+    workers receive only its path, shape, dtype and offset. Workers map the
+    input without copying it and write large results into new scratch files,
+    which are mapped in the parent and removed, so the memory is freed along
+    with the returned arrays. Results are ``numpy.memmap`` instances.
     """
 
-    def __init__(self, *operations, processes=None):
-        super(MultiprocessingPipeline, self).__init__(*operations)
+    def __init__(self, *operations, processes=None, shared_memory=False,
+                 shared_threshold=2 ** 20, scratch_dir=None, **kwargs):
+        super(MultiprocessingPipeline, self).__init__(*operations, **kwargs)
         self.processes = processes
+        self.shared_memory = shared_memory
+        self.shared_threshold = shared_threshold
+        self.scratch_dir = scratch_dir
+
+    def imap(self, data, window=None, ordered=True):
+        pool = self._get_pool()
+        window = window or self.window or 2 * self._processes()
+        profiler = profiling.active()
+        batch = self.batch_size != 1
+        if batch:
+            data = self._batches(data, self._processes())
+
+        def submit(item):
+            future = Future()
+            if self.shared_memory:
+                item, inputs = _share(item, self.shared_threshold,
+                                      self.scratch_dir, batch)
+                pool.apply_async(
+                    _run_shared, (item, self.shared_threshold,
+                                  self.scratch_dir, profiler is not None,
+                                  batch),
+                    callback=lambda result: _receive(future, result, inputs,
+                                                     profiler, batch),
+                    error_callback=lambda e: _receive(future, e, inputs))
+            else:
+                pool.apply_async(_run_operations,
+                                 (item, profiler is not None, batch),
+                                 callback=lambda result: _receive(
+                                     future, result, profiler=profiler,
+                                     batch=batch),
+                                 error_callback=future.set_exception)
+            return future
+
+        results = bounded_imap(submit, data, window, ordered=ordered)
+        if batch:
+            results = chain.from_iterable(results)
+        yield from results
 
     def run(self, data):
-        pool = ProcessPool(nodes=self.processes)
-        result = pool.map(self.operations, data)
-        # with mp.Pool(self.processes) as pool:
-            # result = pool.map(self.operations, data)
-        return result
+        if self.shared_memory or self.batch_size != 1 or \
+           profiling.active() is not None:
+            return list(self.imap(data))
+        return self._get_pool().map(_run_operations, data)
+
+    def _create_pool(self):
+        from multiprocess import Pool
+        return Pool(self._processes(), initializer=_set_operations,
+                    initargs=(self.operations,))
+
+    def _close_pool(self, pool):
+        pool.close()
+        pool.join()
+
+    def _processes(self):
+        return self.processes if self.processes is not None \
+            else os.cpu_count()
+
+
+# The operations run by this worker process, set when the pool starts.
+_OPERATIONS = None
+
+
+def _set_operations(operations):
+    global _OPERATIONS
+    _OPERATIONS = operations
+
+
+def _run_operations(data, profile=False, batch=False):
+    """Run the operations, returning the recorded events if profiling."""
+    run = _OPERATIONS.run_batch if batch else _OPERATIONS
+    if profile:
+        return profiling.collect(run, data)
+    return run(data)
+
+
+def _run_shared(data, threshold, directory, profile=False, batch=False):
+    """Run the operations on shared inputs and share the result."""
+    result = _run_operations(_unshare(data, 'c', False, batch),
+                             profile=profile, batch=batch)
+    if profile:
+        result, events = result
+        result, _ = _share(result, threshold, directory, batch)
+        return result, events
+    result, _ = _share(result, threshold, directory, batch)
+    return result
+
+
+def _receive(future, result, inputs=(), profiler=None, batch=False):
+    """Map a result into memory, free the shared inputs, and merge events."""
+    try:
+        for shared in inputs:
+            shared.unlink()
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+            return
+        if profiler is not None:
+            result, events = result
+            profiler.merge(events)
+        future.set_result(_unshare(result, 'r+', True, batch))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def _share(obj, threshold, directory, batch):
+    """Share an item, or each item of a batch."""
+    if not batch:
+        return share(obj, threshold=threshold, directory=directory)
+    items, shared = [], []
+    for item in obj:
+        item, descriptors = share(item, threshold=threshold,
+                                  directory=directory)
+        items.append(item)
+        shared.extend(descriptors)
+    return items, shared
+
+
+def _unshare(obj, mode, unlink, batch):
+    """Unshare an item, or each item of a batch."""
+    if not batch:
+        return unshare(obj, mode=mode, unlink=unlink)
+    return [unshare(item, mode=mode, unlink=unlink) for item in obj]
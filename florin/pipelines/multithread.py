@@ -6,9 +6,11 @@ MultithreadingPipeline
     Pipeline for multithreaded parallel processing on a single machine.
 """
 
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain
+import os
 
-from florin.pipelines.pipeline import Pipeline
+from florin.pipelines.pipeline import bounded_imap, Pipeline
 
 
 class MultithreadingPipeline(Pipeline):
@@ -21,13 +23,53 @@ class MultithreadingPipeline(Pipeline):
     threads : int, optional
         The number of threads to use. Setting None will attempt to use as
         many as can be supported.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
+    window : int, optional
+        The maximum number of items (or batches) in flight when streaming.
+        Default: twice the number of threads.
     """
 
-    def __init__(self, *operations, threads=None):
-        super(MultithreadingPipeline, self).__init__(*operations)
+    def __init__(self, *operations, threads=None, **kwargs):
+        super(MultithreadingPipeline, self).__init__(*operations, **kwargs)
         self.threads = threads
 
+    def imap(self, data, window=None, ordered=True):
+        pool = self._get_pool()
+        window = window or self.window or 2 * self._threads()
+        if self.batch_size == 1:
+            yield from bounded_imap(
+                lambda item: pool.submit(self.operations, item),
+                data, window, ordered=ordered)
+        else:
+            for results in bounded_imap(
+                    lambda batch: pool.submit(self.operations.run_batch,
+                                              batch),
+                    self._batches(data, self._threads()), window,
+                    ordered=ordered):
+                yield from results
+
     def run(self, data):
-        with ThreadPool(self.threads) as pool:
-            result = pool.map(self.operations, data)
-        return result
+        pool = self._get_pool()
+        if self.batch_size == 1:
+            futures = [pool.submit(self.operations, item) for item in data]
+        else:
+            futures = [pool.submit(self.operations.run_batch, batch)
+                       for batch in self._batches(data, self._threads())]
+        try:
+            results = [future.result() for future in futures]
+        finally:
+            # If an item failed, let no other item finish after this returns.
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+        if self.batch_size != 1:
+            results = list(chain.from_iterable(results))
+        return results
+
+    def _create_pool(self):
+        return ThreadPoolExecutor(max_workers=self._threads())
+
+    def _threads(self):
+        return self.threads if self.threads is not None else os.cpu_count()
@@ -4,16 +4,27 @@ Classes
 -------
 Pipeline
     Base pipeline.
+
+Functions
+---------
+bounded_imap
+    Lazily map over data with a bounded number of tasks in flight.
 """
 
-from collections import Sequence
+from collections import deque
+from collections.abc import Sequence, Sized
+from concurrent.futures import FIRST_COMPLETED, wait
 import functools
 import inspect
+import os
 import re
+import threading
 
-import dill
 import networkx as nx
 
+from florin import serialization
+from florin.batching import auto_batch_size, batches
+from florin.checkpoint import Checkpoint
 from florin.closure import florinate
 from florin.compose import compose
 from florin.graph import FlorinOrderedMultiDiGraph, FlorinNode
@@ -27,6 +38,41 @@ class Pipeline(object):
     ----------
     operations : callables
         The operations/functions/callable classes to run in this pipeline.
+    stream : bool
+        If True, calling the pipeline returns a generator that yields results
+        as they are computed (see ``imap``) instead of a list. Default: False.
+    window : int, optional
+        The maximum number of data items in flight at once when streaming.
+        If None, each pipeline chooses a window based on its worker count.
+    checkpoint : str or florin.checkpoint.Checkpoint, optional
+        Directory (or checkpoint) to record completed data items in. When the
+        pipeline is run again, e.g. after a failure, completed items are not
+        recomputed and their stored results are used instead.
+    cache : florin.cache.MemoryCache or florin.cache.DiskCache, optional
+        Cache for the results of the pipeline's operations. Results are
+        reused whenever an operation runs with the same arguments on the same
+        inputs, e.g. when re-running a pipeline after changing only a later
+        operation.
+    batch_size : int or 'auto'
+        The number of data items to run through the pipeline together.
+        Operations marked with ``florin.batching.batched`` run once per
+        batch, and parallel pipelines hand out a batch per task. If 'auto',
+        choose a size from the number of items and workers. Default: 1.
+
+    Notes
+    -----
+    Pipelines with parallel workers start a pool of workers the first time
+    they are run and reuse it for every later call, which matters when a
+    sub-pipeline runs once per tile. Call ``close`` or use the pipeline as a
+    context manager to shut the pool down. Pools are not copied when a
+    pipeline is pickled or used in a forked process; a new pool is started
+    there on first use.
+
+    Checkpoints record each data item (e.g. tile) as it completes, wherever
+    it is computed, so they work with every pipeline as long as workers share
+    the checkpoint directory. Use the checkpoint on the pipeline that the
+    tiles are passed to. Items completed with ``Checkpoint(results=False)``
+    produce None when resumed, and ``florin.join`` skips None tiles.
 
     Attributes
     ----------
@@ -35,8 +81,20 @@ class Pipeline(object):
         operations stored as nodes and data flow/dependencies stored as edges.
     """
 
-    def __init__(self, *operations):
-        self.operations = FlorinOrderedMultiDiGraph()
+    def __init__(self, *operations, stream=False, window=None,
+                 checkpoint=None, cache=None, batch_size=1):
+        self.stream = stream
+        self.window = window
+        self.batch_size = batch_size
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+        if isinstance(checkpoint, str):
+            checkpoint = Checkpoint(checkpoint)
+        self.operations = FlorinOrderedMultiDiGraph(checkpoint=checkpoint,
+                                                    cache=cache)
+        self.operations.name = self.__class__.__name__
         in_node = pipeline_input()
         self.operations.add(in_node)
 
@@ -97,17 +155,128 @@ class Pipeline(object):
         # Wrap data to be an iterable if it is not one already.
         if not isinstance(data, Sequence) and not inspect.isgenerator(data) or isinstance(data, str):
             data = [data]
+        if self.stream:
+            return self.imap(data)
         return self.run(data)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_pool=None, _pool_pid=None, _pool_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+
+    def close(self):
+        """Shut down the worker pool held by this pipeline, if any.
+
+        The pipeline may still be run afterward, in which case a new pool is
+        started.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            if pool is not None and self._pool_pid == os.getpid():
+                self._close_pool(pool)
+
     def dump(self, fp):
         """Serialize the pipeline and operations.
 
         Parameters
         ----------
         fp : File
-            File to write the serialization to.
+            File to write the serialization to, opened in text or binary
+            mode.
+
+        Notes
+        -----
+        The pipeline is written as a versioned JSON spec that refers to
+        functions by import path, see ``florin.serialization``.
         """
-        dill.dump(self, fp)
+        serialization.dump(self, fp)
+
+    def imap(self, data, window=None, ordered=True):
+        """Lazily run data through the pipeline, yielding results.
+
+        Parameters
+        ----------
+        data : iterable
+            The inputs to the pipeline. Items are drawn from ``data`` only as
+            room opens up in the window.
+        window : int, optional
+            The maximum number of items in flight at once. If None, use the
+            pipeline's ``window``.
+        ordered : bool
+            If True, yield results in the order of ``data``. Otherwise, yield
+            results as soon as they are complete. Default: True.
+
+        Yields
+        ------
+        result
+            The output of applying the pipeline to each item of ``data``.
+
+        Notes
+        -----
+        Memory use is bounded by the window rather than the number of items,
+        so downstream consumers (e.g. ``florin.join``) can process results
+        incrementally. Subclasses with parallel workers override this method;
+        the default runs one item (or batch) at a time.
+        """
+        if self.batch_size == 1:
+            for item in data:
+                yield self.operations(item)
+        else:
+            for batch in self._batches(data):
+                yield from self.operations.run_batch(batch)
+
+    def memory_report(self, data):
+        """Run one data item through the pipeline and report its memory use.
+
+        Parameters
+        ----------
+        data
+            A single input to the pipeline.
+
+        Returns
+        -------
+        result
+            The output of applying the pipeline to ``data``.
+        report : dict
+            'peak_bytes', the most memory held by intermediate results at
+            once; 'total_bytes', the memory of every intermediate result
+            combined; and 'nodes', (name, bytes) pairs with the size of the
+            result of each operation in execution order.
+        """
+        report = {}
+        result = self.operations(data, report=report)
+        return result, report
+
+    def profile(self, data):
+        """Run data through the pipeline while profiling its operations.
+
+        Parameters
+        ----------
+        data
+            The input to the first function in the pipeline.
+
+        Returns
+        -------
+        result
+            The output of ``run``.
+        profiler : florin.profiling.Profiler
+            The latency, bytes in and out, and memory growth of every
+            operation and pipeline run, see ``Profiler.summary``.
+        """
+        from florin.profiling import Profiler
+        with Profiler() as profiler:
+            result = self.run(data)
+        return result, profiler
 
     def run(self, data):
         """Run data through the pipeline.
@@ -130,17 +299,95 @@ class Pipeline(object):
         """
         raise NotImplementedError
 
-    @staticmethod
+    def _batch_size(self, data, workers=1):
+        """Resolve ``batch_size`` for data spread over some workers."""
+        if self.batch_size == 'auto':
+            return auto_batch_size(
+                len(data) if isinstance(data, Sized) else None, workers)
+        return self.batch_size
+
+    def _batches(self, data, workers=1):
+        """Group data into batches of ``batch_size`` items."""
+        return batches(data, self._batch_size(data, workers))
+
+    def _get_pool(self):
+        """Get the worker pool for this process, starting it if necessary."""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = self._create_pool()
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _create_pool(self):
+        """Start a new pool of workers. Override to use a worker pool."""
+        raise NotImplementedError
+
+    def _close_pool(self, pool):
+        """Shut down a pool created by ``_create_pool``."""
+        pool.shutdown()
+
+    @classmethod
     def load(cls, fp):
         """Deserialize a pipeline.
 
         Parameters
         ----------
         fp : File
-            File pointer to the serialized pipeline.
+            File pointer to the serialized pipeline, opened in text or binary
+            mode. Pipelines pickled by earlier versions of FLoRIN are read
+            from binary files.
+
+        Returns
+        -------
+        pipeline : Pipeline
+            The pipeline, of the class it was serialized from.
         """
-        pipe = dill.load(fp)
-        return fp
+        return serialization.load(fp)
+
+
+def bounded_imap(submit, data, window, ordered=True):
+    """Lazily map over data with a bounded number of tasks in flight.
+
+    Parameters
+    ----------
+    submit : callable
+        Function that schedules a single item and returns a
+        ``concurrent.futures.Future`` holding its result.
+    data : iterable
+        The items to submit.
+    window : int
+        The maximum number of submitted items whose results have not been
+        yielded yet.
+    ordered : bool
+        If True, yield results in the order of ``data``. Otherwise, yield
+        results as they complete.
+
+    Yields
+    ------
+    result
+        The result of each submitted item.
+    """
+    window = max(1, window)
+    pending = deque()
+
+    for item in data:
+        pending.append(submit(item))
+        if len(pending) >= window:
+            yield _next_result(pending, ordered)
+
+    while len(pending) > 0:
+        yield _next_result(pending, ordered)
+
+
+def _next_result(pending, ordered):
+    """Remove the next result from a queue of futures."""
+    if ordered:
+        future = pending.popleft()
+    else:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        future = next(f for f in pending if f in done)
+        pending.remove(future)
+    return future.result()
 
 
 class PipelineInput(object):
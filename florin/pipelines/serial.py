@@ -18,9 +18,13 @@ class SerialPipeline(Pipeline):
     ----------
     operations : callables
         The operations/functions/callable classes to run in this pipeline.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
 
     """
 
     def run(self, data):
+        if self.batch_size != 1:
+            return list(self.imap(data))
         result = map(self.operations, data)
         return list(result)
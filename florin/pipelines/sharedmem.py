@@ -0,0 +1,190 @@
+"""Shared-memory transport of arrays between processes.
+
+Arrays are placed in memory-mapped scratch files, by default on the tmpfs at
+``/dev/shm``, so that processes exchange a small descriptor instead of
+pickling the data itself.
+
+Classes
+-------
+SharedArray
+    Picklable descriptor of an array in a shared scratch file.
+
+Functions
+---------
+scratch_dir
+    Get the default directory for shared scratch files.
+share
+    Move large arrays into shared memory, replacing them with descriptors.
+unshare
+    Map shared arrays back into memory, replacing their descriptors.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+
+class SharedArray(object):
+    """Picklable descriptor of an array in a shared scratch file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the scratch file holding the array data.
+    shape : tuple of int
+        The shape of the array.
+    dtype : numpy.dtype or str
+        The data type of the array.
+    offset : int
+        Offset of the array data in the file, in bytes.
+    """
+
+    def __init__(self, path, shape, dtype, offset=0):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self.offset = offset
+
+    @classmethod
+    def create(cls, arr, directory=None):
+        """Copy an array into a new shared scratch file.
+
+        Parameters
+        ----------
+        arr : numpy.ndarray
+            The array to share.
+        directory : str, optional
+            Directory to create the scratch file in. Default: the result of
+            ``scratch_dir()``.
+
+        Returns
+        -------
+        shared : SharedArray
+        """
+        fd, path = tempfile.mkstemp(
+            prefix='florin-', suffix='.shm',
+            dir=directory if directory is not None else scratch_dir())
+        os.close(fd)
+        shared = cls(path, arr.shape, arr.dtype)
+
+        if arr.size > 0:
+            out = np.memmap(path, dtype=arr.dtype, mode='w+', shape=arr.shape)
+            out[...] = arr
+            del out
+        return shared
+
+    def open(self, mode='r+'):
+        """Map the shared array into memory without copying it.
+
+        Parameters
+        ----------
+        mode : {'r', 'r+', 'c'}
+            The memory map mode. Use 'c' for private, copy-on-write access.
+
+        Returns
+        -------
+        arr : numpy.ndarray
+        """
+        if int(np.prod(self.shape)) == 0:
+            return np.zeros(self.shape, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode=mode,
+                         shape=self.shape, offset=self.offset)
+
+    def unlink(self):
+        """Remove the scratch file.
+
+        Arrays already mapped from the file remain valid until they are
+        garbage collected.
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def scratch_dir():
+    """Get the default directory for shared scratch files.
+
+    Returns
+    -------
+    path : str
+        ``/dev/shm`` if it is a writable directory, otherwise the system
+        temporary directory.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def share(obj, threshold=0, directory=None):
+    """Move large arrays into shared memory, replacing them with descriptors.
+
+    Parameters
+    ----------
+    obj
+        An array, or a tuple or list whose elements may be arrays (e.g. a tile
+        and its metadata).
+    threshold : int
+        Arrays smaller than this many bytes are left in place.
+    directory : str, optional
+        Directory to create scratch files in.
+
+    Returns
+    -------
+    obj
+        ``obj`` with each shared array replaced by a ``SharedArray``.
+    shared : list of SharedArray
+        The descriptors that were created. The caller is responsible for
+        unlinking them once they are no longer needed.
+    """
+    shared = []
+
+    def _share(x):
+        if isinstance(x, np.ndarray) and not x.dtype.hasobject and \
+           x.nbytes >= threshold:
+            shared.append(SharedArray.create(x, directory=directory))
+            return shared[-1]
+        return x
+
+    if isinstance(obj, tuple):
+        obj = tuple([_share(x) for x in obj])
+    elif isinstance(obj, list):
+        obj = [_share(x) for x in obj]
+    else:
+        obj = _share(obj)
+
+    return obj, shared
+
+
+def unshare(obj, mode='r+', unlink=False):
+    """Map shared arrays back into memory, replacing their descriptors.
+
+    Parameters
+    ----------
+    obj
+        A ``SharedArray``, or a tuple or list whose elements may be.
+    mode : {'r', 'r+', 'c'}
+        The memory map mode.
+    unlink : bool
+        If True, remove each scratch file once it has been mapped, so that
+        the memory is freed along with the array.
+
+    Returns
+    -------
+    obj
+        ``obj`` with each ``SharedArray`` replaced by the array it describes.
+    """
+    def _unshare(x):
+        if isinstance(x, SharedArray):
+            arr = x.open(mode=mode)
+            if unlink:
+                x.unlink()
+            return arr
+        return x
+
+    if isinstance(obj, tuple):
+        return tuple([_unshare(x) for x in obj])
+    elif isinstance(obj, list):
+        return [_unshare(x) for x in obj]
+    return _unshare(obj)
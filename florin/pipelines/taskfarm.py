@@ -0,0 +1,463 @@
+"""Task-farm pipelines with pluggable task transports.
+
+A task farm serializes the operation graph once, splits the data into
+batches of tasks, and hands them to a transport that runs them on workers,
+locally or through a distributed task manager.
+
+Classes
+-------
+LocalTransport
+    Transport that runs tasks on a local pool of worker processes.
+TaskFarmPipeline
+    Pipeline that farms batches of tasks out to a transport.
+Transport
+    Interface for sending tasks to workers and receiving their results.
+WorkQueueTransport
+    Transport that runs tasks through a Work Queue manager.
+
+Functions
+---------
+run_task
+    Run a serialized batch of tasks through an operation graph.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+
+import dill
+
+from florin import serialization
+from florin.batching import batches
+from florin.log_utils import logger
+from florin.pipelines.pipeline import Pipeline
+
+
+class TaskFailedError(RuntimeError):
+    """Raised when a batch of tasks fails more times than allowed."""
+    def __init__(self, indices, attempts, error):
+        msg = 'Tasks {} failed after {} attempts: {}'.format(
+            indices, attempts, error)
+        super(TaskFailedError, self).__init__(msg)
+
+
+class Transport(object):
+    """Interface for sending tasks to workers and receiving their results.
+
+    Transports move opaque, serialized payloads. A transport receives the
+    serialized operation graph once in ``start``, then any number of task
+    payloads through ``submit``, and reports each task's outcome through
+    ``wait``.
+
+    Attributes
+    ----------
+    workers : int
+        The number of tasks the transport can run at once. Used to size the
+        number of tasks kept in flight.
+    """
+
+    workers = 1
+
+    def start(self, graph):
+        """Prepare workers to run tasks.
+
+        Parameters
+        ----------
+        graph : bytes
+            The serialized operation graph.
+        """
+        raise NotImplementedError
+
+    def submit(self, task_id, payload):
+        """Send a task to be run.
+
+        Parameters
+        ----------
+        task_id : int
+            Identifier to report the task's result under.
+        payload : bytes
+            The serialized batch of tasks, see ``run_task``.
+        """
+        raise NotImplementedError
+
+    def wait(self):
+        """Wait for any submitted task to finish.
+
+        Returns
+        -------
+        task_id : int
+            The id of the finished task.
+        result : bytes or None
+            The serialized result, see ``run_task``, or None if it failed.
+        error : str or None
+            Description of the failure, or None if the task succeeded.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Shut down the workers."""
+        pass
+
+
+class LocalTransport(Transport):
+    """Transport that runs tasks on a local pool of worker processes.
+
+    Stands in for a remote task manager so that task-farm pipelines can run
+    and be tested on a single machine.
+
+    Parameters
+    ----------
+    workers : int, optional
+        The number of worker processes. Default: the number of CPUs.
+
+    Notes
+    -----
+    When a worker process dies, every task in the pool fails with
+    ``BrokenProcessPool`` and the pool is replaced. The first of these tasks
+    to be reported is blamed for the crash and reported as failed, and the
+    rest are run again on the new pool. Tasks submitted just as a pool broke
+    may never be failed by it (a race in ``ProcessPoolExecutor`` before
+    Python 3.9), so when no task finishes for a while, tasks left unfinished
+    in replaced pools are run again.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else os.cpu_count()
+        self._graph = None
+        self._executor = None
+        self._done = queue.Queue()
+        self._payloads = {}
+        self._futures = {}
+        self._generation = 0
+        self._blamed = 0
+        self._restarted = None
+
+    def start(self, graph):
+        self._graph = graph
+        self._restart()
+
+    def submit(self, task_id, payload):
+        self._payloads[task_id] = payload
+        self._submit(task_id)
+
+    def wait(self):
+        while True:
+            try:
+                task_id, generation, future = self._done.get(
+                    timeout=_LOST_TIMEOUT)
+            except queue.Empty:
+                self._cancel_lost()
+                continue
+
+            if self._futures.get(task_id, (None, None))[1] is not future:
+                # The task was already run again or reported.
+                continue
+
+            try:
+                result, error = future.result(), None
+            except BrokenProcessPool as e:
+                if generation <= self._blamed:
+                    # Failed along with the task blamed for the crash.
+                    self._submit(task_id)
+                    continue
+                self._blamed = generation
+                if generation == self._generation:
+                    self._restart()
+                result, error = None, '{}: {}'.format(type(e).__name__, e)
+            except Exception as e:
+                result, error = None, '{}: {}'.format(type(e).__name__, e)
+            del self._payloads[task_id]
+            del self._futures[task_id]
+            return task_id, result, error
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _submit(self, task_id):
+        payload = self._payloads[task_id]
+        try:
+            future = self._executor.submit(_run_loaded, self._graph, payload)
+        except BrokenProcessPool:
+            # A worker died, so start over with a new pool.
+            self._restart()
+            future = self._executor.submit(_run_loaded, self._graph, payload)
+        generation = self._generation
+        self._futures[task_id] = (generation, future)
+        future.add_done_callback(
+            lambda f: self._done.put((task_id, generation, f)))
+
+    def _restart(self):
+        if self._executor is not None:
+            # Wait for the broken pool's workers to be stopped, so that no
+            # task runs in both pools at once.
+            self._executor.shutdown()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._generation += 1
+        self._restarted = time.monotonic()
+
+    def _cancel_lost(self):
+        """Run tasks lost by a replaced pool again."""
+        if time.monotonic() - self._restarted < _LOST_TIMEOUT:
+            return
+        for task_id, (generation, future) in list(self._futures.items()):
+            if generation < self._generation and not future.done():
+                future.cancel()
+                self._submit(task_id)
+
+
+class WorkQueueTransport(Transport):
+    """Transport that runs tasks through a Work Queue manager.
+
+    Each task runs ``python -m florin.pipelines.taskfarm`` on a worker with
+    the serialized graph, which workers cache after their first task.
+
+    Parameters
+    ----------
+    port : int
+        The port for Work Queue workers to connect to.
+    name : str, optional
+        Project name to advertise to the catalog server.
+    workers : int
+        The number of tasks to keep queued at once. Default: 1.
+    python : str
+        The Python interpreter to run tasks with on the workers.
+        Default: 'python'.
+
+    Notes
+    -----
+    Requires the ``work_queue`` module from CCTools. Workers must have florin
+    and its dependencies installed.
+    """
+
+    def __init__(self, port=9123, name=None, workers=1, python='python'):
+        self.port = port
+        self.name = name
+        self.workers = workers
+        self.python = python
+        self._queue = None
+        self._tmpdir = None
+        self._tasks = {}
+
+    def start(self, graph):
+        import work_queue as wq
+
+        self._queue = wq.WorkQueue(self.port)
+        if self.name is not None:
+            self._queue.specify_name(self.name)
+
+        self._tmpdir = tempfile.mkdtemp(prefix='florin-wq-')
+        self._graph = os.path.join(self._tmpdir, 'graph.pkl')
+        with open(self._graph, 'wb') as f:
+            f.write(graph)
+
+    def submit(self, task_id, payload):
+        import work_queue as wq
+
+        task_in = os.path.join(self._tmpdir, 'task-{}.pkl'.format(task_id))
+        task_out = os.path.join(self._tmpdir, 'result-{}.pkl'.format(task_id))
+        with open(task_in, 'wb') as f:
+            f.write(payload)
+
+        task = wq.Task('{} -m florin.pipelines.taskfarm graph.pkl task.pkl '
+                       'result.pkl'.format(self.python))
+        task.specify_input_file(self._graph, 'graph.pkl', cache=True)
+        task.specify_input_file(task_in, 'task.pkl', cache=False)
+        task.specify_output_file(task_out, 'result.pkl', cache=False)
+        task.specify_tag(str(task_id))
+        self._queue.submit(task)
+        self._tasks[task_id] = (task_in, task_out)
+
+    def wait(self):
+        task = None
+        while task is None:
+            task = self._queue.wait(5)
+
+        task_id = int(task.tag)
+        task_in, task_out = self._tasks.pop(task_id)
+        result, error = None, None
+        try:
+            if task.return_status != 0 or not os.path.isfile(task_out):
+                error = 'Work Queue task exited with status {}: {}'.format(
+                    task.return_status, task.output)
+            else:
+                with open(task_out, 'rb') as f:
+                    result = f.read()
+        finally:
+            for path in [task_in, task_out]:
+                if os.path.isfile(path):
+                    os.remove(path)
+        return task_id, result, error
+
+    def close(self):
+        self._queue = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+
+class TaskFarmPipeline(Pipeline):
+    """Pipeline that farms batches of tasks out to a transport.
+
+    Parameters
+    ----------
+    operations : callables
+        Sequence of operations to run in the pipeline.
+    transport : florin.pipelines.taskfarm.Transport, optional
+        The transport to run tasks with. Default: a ``LocalTransport``.
+    workers : int, optional
+        The number of local worker processes if no transport is supplied.
+    batch_size : int or 'auto'
+        The number of data items sent in each task, and run together through
+        the operations, see ``florin.batching``. Default: 1.
+    retries : int
+        The number of times to resubmit a failed task before giving up.
+        Default: 2.
+    stream : bool
+        If True, calling the pipeline returns a generator over the results.
+    window : int, optional
+        The maximum number of tasks in flight. Default: twice the number of
+        workers of the transport.
+
+    Notes
+    -----
+    The operation graph is serialized as a JSON spec (see
+    ``florin.serialization``) and sent to the transport once, when the
+    pipeline is first run. The transport is kept for later
+    calls until ``close`` is called.
+    """
+
+    def __init__(self, *operations, transport=None, workers=None, retries=2,
+                 **kwargs):
+        super(TaskFarmPipeline, self).__init__(*operations, **kwargs)
+        self.transport = transport
+        self.workers = workers
+        self.retries = retries
+
+    def run(self, data):
+        return list(self.imap(data))
+
+    def imap(self, data, window=None, ordered=True):
+        transport = self._get_pool()
+        window = window or self.window or 2 * transport.workers
+
+        size = self._batch_size(data, transport.workers)
+        tasks = batches(enumerate(data), size)
+        task_ids = count()
+        in_flight = {}
+        buffered = {}
+        next_index = 0
+        exhausted = False
+
+        def submit(batch, attempts):
+            task_id = next(task_ids)
+            in_flight[task_id] = (batch, attempts)
+            transport.submit(task_id, dill.dumps(batch))
+
+        try:
+            while True:
+                # Keep the window full, counting results held for ordering.
+                while not exhausted and len(in_flight) + \
+                        len(buffered) // size < window:
+                    batch = next(tasks, None)
+                    if batch is None:
+                        exhausted = True
+                    else:
+                        submit(batch, 1)
+
+                if len(in_flight) == 0:
+                    break
+
+                task_id, result, error = transport.wait()
+                batch, attempts = in_flight.pop(task_id)
+
+                if error is not None:
+                    indices = [i for i, _ in batch]
+                    if attempts > self.retries:
+                        raise TaskFailedError(indices, attempts, error)
+                    logger.info('Tasks %s failed, retrying: %s', indices,
+                                error)
+                    submit(batch, attempts + 1)
+                    continue
+
+                for i, r in dill.loads(result):
+                    if ordered:
+                        buffered[i] = r
+                    else:
+                        yield r
+
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+        finally:
+            # Collect abandoned tasks so they are not reported to later runs.
+            for _ in range(len(in_flight)):
+                transport.wait()
+
+    def _create_pool(self):
+        transport = self.transport
+        if transport is None:
+            transport = LocalTransport(workers=self.workers)
+        transport.start(
+            serialization.dumps(self.operations).encode('utf-8'))
+        return transport
+
+    def _close_pool(self, transport):
+        transport.close()
+
+
+def run_task(operations, payload):
+    """Run a serialized batch of tasks through an operation graph.
+
+    Parameters
+    ----------
+    operations : florin.graph.FlorinOrderedMultiDiGraph
+        The operation graph.
+    payload : bytes
+        Serialized list of (index, data) pairs, run as one batch.
+
+    Returns
+    -------
+    result : bytes
+        Serialized list of (index, result) pairs.
+    """
+    batch = dill.loads(payload)
+    results = operations.run_batch([item for _, item in batch])
+    return dill.dumps([(i, result) for (i, _), result in zip(batch, results)])
+
+
+# Seconds to wait for a task before checking for tasks lost by a broken pool.
+_LOST_TIMEOUT = 1
+
+# The serialized operation graph last run by this worker process, and the
+# graph loaded from it.
+_OPERATIONS = (None, None)
+
+
+def _run_loaded(graph, payload):
+    """Run a batch, loading the graph only on the worker's first task."""
+    global _OPERATIONS
+    if _OPERATIONS[0] != graph:
+        _OPERATIONS = (graph, serialization.loads(graph))
+    return run_task(_OPERATIONS[1], payload)
+
+
+def main(graph, task, result):
+    """Run a batch of tasks from files, as on a remote worker."""
+    with open(graph, 'rb') as f:
+        operations = serialization.load(f)
+    with open(task, 'rb') as f:
+        payload = f.read()
+    with open(result, 'wb') as f:
+        f.write(run_task(operations, payload))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:4])
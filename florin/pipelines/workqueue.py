@@ -1,5 +1,39 @@
-from florin.pipelines.pipeline import Pipeline
+"""Distributed pipeline using Work Queue to manage tasks.
 
-class WorkQueuePipeline(Pipeline):
-    def run(self, data):
-        return next(map(self.operations, data))
+Classes
+-------
+WorkQueuePipeline
+    Distributed computing using Work Queue to manage tasks.
+"""
+
+from florin.pipelines.taskfarm import TaskFarmPipeline, WorkQueueTransport
+
+
+class WorkQueuePipeline(TaskFarmPipeline):
+    """Distributed computing using Work Queue to manage tasks.
+
+    Parameters
+    ----------
+    operations : callables
+        Sequence of operations to run in the pipeline.
+    port : int, optional
+        The port for Work Queue workers to connect to. If None, tasks run on
+        a local pool of processes instead of through Work Queue.
+    name : str, optional
+        Project name for the Work Queue manager to advertise.
+
+    Other Parameters
+    ----------------
+    Additional keyword arguments (e.g. ``transport``, ``workers``,
+    ``batch_size``, ``retries``) are passed to
+    ``florin.pipelines.taskfarm.TaskFarmPipeline``.
+    """
+
+    def __init__(self, *operations, port=None, name=None, transport=None,
+                 workers=None, **kwargs):
+        if transport is None and port is not None:
+            transport = WorkQueueTransport(
+                port=port, name=name,
+                workers=workers if workers is not None else 1)
+        super(WorkQueuePipeline, self).__init__(
+            *operations, transport=transport, workers=workers, **kwargs)
@@ -0,0 +1,295 @@
+"""Per-node and per-pipeline profiling of FLoRIN runs.
+
+Profiling is off by default and costs a single check per node call. While a
+``Profiler`` is active, every node and pipeline run in the process records
+its latency, the bytes passed in and out, and the change in peak resident
+memory, which can be summarized or exported as JSON, CSV, or a Chrome trace
+(viewable in ``chrome://tracing`` or Perfetto).
+
+Classes
+-------
+Profiler
+    Collector of per-node and per-pipeline metrics.
+
+Functions
+---------
+active
+    Get the active profiler, if any.
+collect
+    Call a function with a fresh profiler and return its events.
+"""
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The profiler recording this process's runs, or None if profiling is off.
+_ACTIVE = None
+
+
+# Fields of each recorded event, in CSV column order.
+FIELDS = ['category', 'name', 'id', 'start', 'duration', 'bytes_in',
+          'bytes_out', 'rss_delta', 'pid', 'tid']
+
+
+class Profiler(object):
+    """Collector of per-node and per-pipeline metrics.
+
+    Use the profiler as a context manager, or call ``enable`` and
+    ``disable``, to record the nodes and pipelines run in this process in the
+    meantime, including those run on threads. Multiprocessing pipelines send
+    the events recorded by their workers back to the active profiler.
+
+    Attributes
+    ----------
+    events : list of dict
+        One event per node or pipeline run, with the keys in ``FIELDS``.
+        'category' is 'node' or 'pipeline', 'start' is the wall clock time
+        and 'duration' the latency in seconds, 'bytes_in' and 'bytes_out' are
+        the estimated sizes of the inputs and result, and 'rss_delta' is the
+        growth of the process's peak resident memory in bytes.
+
+    Examples
+    --------
+    >>> with Profiler() as profiler:
+    ...     pipeline.run(data)
+    >>> profiler.summary()['node']['threshold']['p50']
+    >>> profiler.to_chrome_trace('trace.json')
+    """
+
+    def __init__(self):
+        self.events = []
+        self._previous = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def enable(self):
+        """Start recording runs in this process."""
+        global _ACTIVE
+        self._previous.append(_ACTIVE)
+        _ACTIVE = self
+
+    def disable(self):
+        """Stop recording, restoring any previously active profiler."""
+        global _ACTIVE
+        _ACTIVE = self._previous.pop() if len(self._previous) > 0 else None
+
+    def profile(self, node, args, kwargs):
+        """Run a node's operation and record an event for it.
+
+        Parameters
+        ----------
+        node : florin.graph.FlorinNode
+            The node being run.
+        args : tuple
+        kwargs : dict
+            The resolved arguments to the operation.
+
+        Returns
+        -------
+        result
+            The result of the operation.
+        """
+        rss = _peak_rss()
+        start = time.time()
+        begin = time.perf_counter()
+        result = node.operation(*args, **kwargs)
+        duration = time.perf_counter() - begin
+        self.record('node', node.__name__, node.id, start, duration,
+                    bytes_in=(args, kwargs), bytes_out=result,
+                    rss_delta=_peak_rss() - rss)
+        return result
+
+    def record(self, category, name, id, start, duration, bytes_in=None,
+               bytes_out=None, rss_delta=0):
+        """Record an event.
+
+        Parameters
+        ----------
+        category : {'node', 'pipeline'}
+        name : str
+        id : int
+            Identifier distinguishing events of the same name.
+        start : float
+            Wall clock time the run started.
+        duration : float
+            Latency of the run in seconds.
+        bytes_in, bytes_out
+            The inputs and result of the run, measured with
+            ``florin.graph.florin_plan.nbytes`` (counting memory-mapped
+            arrays by their data).
+        rss_delta : int
+            Growth of the peak resident memory in bytes.
+        """
+        from florin.graph.florin_plan import nbytes
+
+        event = {
+            'category': category,
+            'name': name,
+            'id': id,
+            'start': start,
+            'duration': duration,
+            'bytes_in': nbytes(bytes_in, mapped=True)
+                        if bytes_in is not None else 0,
+            'bytes_out': nbytes(bytes_out, mapped=True)
+                         if bytes_out is not None else 0,
+            'rss_delta': rss_delta,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def merge(self, events):
+        """Add events recorded elsewhere, e.g. in a worker process.
+
+        Parameters
+        ----------
+        events : list of dict
+        """
+        with self._lock:
+            self.events.extend(events)
+
+    def clear(self):
+        """Discard all recorded events."""
+        with self._lock:
+            self.events = []
+
+    def summary(self):
+        """Aggregate the events by category and name.
+
+        Returns
+        -------
+        summary : dict
+            Maps each category to a dict mapping each name to its 'calls',
+            'total', 'mean', 'p50', 'p90', 'p99' and 'max' latency in
+            seconds, total 'bytes_in' and 'bytes_out', and largest
+            'rss_delta'.
+        """
+        groups = {}
+        for event in list(self.events):
+            key = (event['category'], event['name'])
+            groups.setdefault(key, []).append(event)
+
+        summary = {}
+        for (category, name), events in sorted(groups.items()):
+            durations = np.array([e['duration'] for e in events])
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            summary.setdefault(category, {})[name] = {
+                'calls': len(events),
+                'total': float(durations.sum()),
+                'mean': float(durations.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(durations.max()),
+                'bytes_in': sum([e['bytes_in'] for e in events]),
+                'bytes_out': sum([e['bytes_out'] for e in events]),
+                'rss_delta': max([e['rss_delta'] for e in events]),
+            }
+        return summary
+
+    def to_json(self, path):
+        """Write the summary and events as JSON.
+
+        Parameters
+        ----------
+        path : str
+        """
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'events': list(self.events)},
+                      f, indent=2)
+
+    def to_csv(self, path):
+        """Write the events as CSV, one row per event.
+
+        Parameters
+        ----------
+        path : str
+        """
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(list(self.events))
+
+    def to_chrome_trace(self, path):
+        """Write the events in Chrome trace event format.
+
+        Parameters
+        ----------
+        path : str
+        """
+        trace = [{
+            'name': e['name'],
+            'cat': e['category'],
+            'ph': 'X',
+            'ts': e['start'] * 1e6,
+            'dur': e['duration'] * 1e6,
+            'pid': e['pid'],
+            'tid': e['tid'],
+            'args': {k: e[k] for k in ['id', 'bytes_in', 'bytes_out',
+                                       'rss_delta']},
+        } for e in list(self.events)]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+
+def active():
+    """Get the active profiler, if any.
+
+    Returns
+    -------
+    profiler : Profiler or None
+    """
+    return _ACTIVE
+
+
+def collect(func, *args):
+    """Call a function with a fresh profiler and return its events.
+
+    Used by workers to send the events of a task back to the profiler in the
+    parent process.
+
+    Parameters
+    ----------
+    func : callable
+    *args
+        Arguments to pass to ``func``.
+
+    Returns
+    -------
+    result
+        The result of ``func``.
+    events : list of dict
+        The events recorded during the call.
+    """
+    profiler = Profiler()
+    with profiler:
+        result = func(*args)
+    return result, profiler.events
+
+
+def _peak_rss():
+    """Get the peak resident memory of this process in bytes."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
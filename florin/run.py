@@ -1,34 +1,339 @@
 """Utilities for running serialized pipelines.
 
+The ``florin`` command runs a serialized pipeline (see ``Pipeline.dump``)
+over its inputs from the command line, e.g. as one job of a sharded batch
+run launched by a scheduler::
+
+    florin pipeline.json volume.zarr --tile-shape 64,64,64 \\
+        --backend processes --workers 16 --shard $SLURM_ARRAY_TASK_ID/8 \\
+        --output segmented.zarr --checkpoint ckpt/
+
 Functions
 ---------
 deserialize_and_run
     Load a serialized pipeline and run it on provided data.
+main
+    Run a serialized pipeline from the command line.
 """
 
+import argparse
+from contextlib import ExitStack
+from itertools import chain
+import os
+import sys
+import time
+
+from florin.checkpoint import Checkpoint
+from florin.log_utils import logger
 from florin.pipelines.pipeline import Pipeline
 
 
+BACKENDS = ['serial', 'threads', 'processes', 'mpi']
+
+
 def deserialize_and_run(path, data):
-    with open(path, 'r') as f:
+    """Load a serialized pipeline and run it on provided data.
+
+    Parameters
+    ----------
+    path : str
+        Path to the serialized pipeline.
+    data
+        The input to the pipeline.
+
+    Returns
+    -------
+    result
+        The output of the pipeline.
+    """
+    with open(path, 'rb') as f:
         pipeline = Pipeline.load(f)
     return pipeline(data)
 
 
-if __name__ == '__main__':
-    import argparse
+def main(argv=None):
+    """Run a serialized pipeline from the command line.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Default: ``sys.argv[1:]``.
+
+    Notes
+    -----
+    Each input is a data item passed to the pipeline, or, with
+    ``--tile-shape``, an array loaded with ``florin.load`` whose tiles are
+    the data items. ``--tiles`` and ``--shard`` select which items run, so
+    that separate jobs can split the work. With ``--output``, tiles are
+    written into a Zarr or N5 store as they complete, which jobs and MPI
+    ranks may share. Otherwise, results are discarded, so the pipeline
+    should save its own.
+
+    With ``--memory``, the first item is run alone to measure its peak
+    memory, and the number of items in flight afterward is limited so that
+    their intermediate results fit in the budget. With MPI, the first rank
+    measures the item, keeps its result, and shares the limit with the other
+    ranks.
+    """
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.output is not None and args.tile_shape is None:
+        parser.error('--output requires --tile-shape')
+    if args.output is not None and len(args.inputs) > 1:
+        parser.error('--output joins the tiles of a single input')
+
+    with open(args.pipeline, 'rb') as f:
+        pipeline = Pipeline.load(f)
+    if args.checkpoint is not None:
+        # Tiles are already in the output store, so resumed runs need not
+        # keep their results.
+        pipeline.operations.checkpoint = Checkpoint(
+            args.checkpoint, results=args.output is None)
+
+    profiler = None
+    if args.profile is not None:
+        from florin.profiling import Profiler
+        profiler = Profiler()
 
+    start = time.time()
+    with profiler if profiler is not None else ExitStack():
+        items = _items(args)
+        window = None
+        first = []
+        if args.memory is not None:
+            window, first, items = _window(pipeline, items, args.memory,
+                                           args.backend == 'mpi')
+        runner = _runner(pipeline, args, window)
+        count = _run(runner, items, first, window, args.output,
+                     args.tile_shape)
+    runner.close()
+
+    logger.info('Ran %d items in %0.3fs', count, time.time() - start)
+    if profiler is not None:
+        _write_profile(profiler, args.profile, args.profile_format,
+                       _rank() if args.backend == 'mpi' else None)
+
+
+def _parser():
     p = argparse.ArgumentParser(
-        description='Load and run a serialized pipeline')
+        prog='florin', description='Run a serialized FLoRIN pipeline.')
     p.add_argument('pipeline', type=str,
                    help='path to the serialized pipeline')
-    p.add_argument('data', type=str,
-                   help='input to the first function in the pipeline')
-    args = p.parse_args()
+    p.add_argument('inputs', type=str, nargs='+',
+                   help='inputs to run the pipeline on')
+    p.add_argument('--backend', choices=BACKENDS,
+                   help='how to run items in parallel (default: the '
+                        'serialized pipeline\'s own model)')
+    p.add_argument('--workers', type=_workers,
+                   help='threads or processes to run; with MPI, threads per '
+                        'rank, or "auto" to split each node\'s cores')
+    p.add_argument('--batch-size', type=_workers,
+                   help='items to run together, or "auto"')
+    p.add_argument('--load', action='store_true',
+                   help='load each input with florin.load instead of '
+                        'passing its path')
+    p.add_argument('--tile-shape', type=_shape,
+                   help='load each input and run the pipeline on tiles of '
+                        'this shape, e.g. 64,64,64')
+    p.add_argument('--tiles', type=_range,
+                   help='range of tiles (or inputs) to run, e.g. 100:200')
+    p.add_argument('--shard', type=_shard,
+                   help='run only shard I of N of the tiles (or inputs), '
+                        'e.g. 3/8')
+    p.add_argument('--output', type=str,
+                   help='Zarr or N5 store to write tiles into')
+    p.add_argument('--memory', type=_bytes,
+                   help='memory budget for items in flight, e.g. 16G')
+    p.add_argument('--checkpoint', type=str,
+                   help='directory to record completed items in, so that '
+                        'they are skipped when the job is run again')
+    p.add_argument('--profile', type=str,
+                   help='file to write profiling results to')
+    p.add_argument('--profile-format', choices=['json', 'csv', 'trace'],
+                   default='json',
+                   help='format of the profiling results: a summary and '
+                        'events as JSON, events as CSV, or a Chrome trace '
+                        '(default: json)')
+
+    return p
+
+
+def _items(args):
+    """Get the data items selected by the range and shard arguments."""
+    start, stop = args.tiles if args.tiles is not None else (0, None)
+    index, count = args.shard if args.shard is not None else (0, 1)
+    select = slice(start + index, stop, count)
+
+    if args.tile_shape is None:
+        inputs = args.inputs[select]
+        if args.load:
+            return (_load(path) for path in inputs)
+        return inputs
+
+    def tiles():
+        from florin.tiling import tile_generator
+        for path in args.inputs:
+            yield from tile_generator(_load(path), shape=args.tile_shape,
+                                      select=select)
+    return tiles()
+
+
+def _load(path):
+    """Load an input as ``florin.load`` would."""
+    from florin.io import find_backend
+    return find_backend(path, mode='load').load(path)
+
+
+def _window(pipeline, items, budget, mpi=False):
+    """Measure the first item and choose the number of items in flight.
+
+    Returns the window, the result of the first item (on this rank), and the
+    remaining items.
+    """
+    items = iter(items)
+    try:
+        first = next(items)
+    except StopIteration:
+        return None, [], items
 
-    if args.data is None:
-        raise ValueError('No data provided to the pipeline')
-    if args.pipeline is None:
-        raise ValueError('No pipeline or data provided')
+    rank = _rank() if mpi else 0
+    window = None
+    if rank == 0:
+        result, report = pipeline.memory_report(first)
+        peak = report.get('peak_bytes', 0)
+        window = max(1, budget // peak) if peak > 0 else None
 
-    deserialize_and_run(args.pipeline, args.data)
+    if mpi:
+        # Only the first rank runs the first item, and every rank skips it.
+        from florin.pipelines.mpi import _get_comm
+        window = _get_comm().bcast(window, root=0)
+        if rank != 0:
+            return window, [], items
+    return window, [result], items
+
+
+def _runner(pipeline, args, window):
+    """Create the pipeline that runs the items on the chosen backend."""
+    from florin.pipelines import (MPITaskQueuePipeline,
+                                  MultiprocessingPipeline,
+                                  MultithreadingPipeline, SerialPipeline)
+
+    workers = args.workers
+    if window is not None and isinstance(workers, int):
+        workers = min(workers, window)
+
+    if args.backend is None:
+        runner = pipeline
+    elif args.backend == 'serial':
+        runner = SerialPipeline()
+    elif args.backend == 'threads':
+        runner = MultithreadingPipeline(threads=workers, window=window)
+    elif args.backend == 'processes':
+        runner = MultiprocessingPipeline(processes=workers, window=window)
+    else:
+        runner = MPITaskQueuePipeline(threads=workers)
+
+    if runner is not pipeline:
+        runner.operations = pipeline.operations
+        runner.batch_size = pipeline.batch_size
+    if args.batch_size is not None:
+        runner.batch_size = args.batch_size
+    return runner
+
+
+def _run(runner, items, first, window, output, chunks=None):
+    """Run the items, writing tiles into the output store, if any.
+
+    Returns the number of items run.
+    """
+    count = 0
+
+    def results():
+        nonlocal count
+        for result in chain(first, runner.imap(items, window=window)):
+            count += 1
+            yield result
+
+    if output is not None:
+        from florin.tiling import join_tiles
+        join_tiles(results(), out=output, chunks=chunks)
+    else:
+        for _ in results():
+            pass
+    return count
+
+
+def _write_profile(profiler, path, fmt, rank=None):
+    if rank is not None:
+        root, ext = os.path.splitext(path)
+        path = '{}.{}{}'.format(root, rank, ext)
+    if fmt == 'csv':
+        profiler.to_csv(path)
+    elif fmt == 'trace':
+        profiler.to_chrome_trace(path)
+    else:
+        profiler.to_json(path)
+
+
+def _rank():
+    from florin.pipelines.mpi import _get_comm
+    return _get_comm().Get_rank()
+
+
+def _workers(value):
+    if value == 'auto':
+        return value
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be at least 1')
+    return value
+
+
+def _shape(value):
+    try:
+        shape = tuple(int(s) for s in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected comma-separated integers, got {}'.format(value))
+    return shape
+
+
+def _range(value):
+    try:
+        start, stop = value.split(':')
+        start = int(start) if start != '' else 0
+        stop = int(stop) if stop != '' else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected START:STOP, got {}'.format(value))
+    if start < 0 or stop is not None and stop < start:
+        raise argparse.ArgumentTypeError(
+            'expected 0 <= START <= STOP, got {}'.format(value))
+    return start, stop
+
+
+def _shard(value):
+    try:
+        index, count = [int(s) for s in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected INDEX/COUNT, got {}'.format(value))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            'expected 0 <= INDEX < COUNT, got {}'.format(value))
+    return index, count
+
+
+def _bytes(value):
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+    scale = units.get(value[-1:].upper(), 1)
+    try:
+        return int(float(value[:-1] if scale > 1 else value) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected a number of bytes, e.g. 512M or 16G, got {}'.format(
+                value))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
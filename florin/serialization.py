@@ -0,0 +1,355 @@
+"""Versioned, declarative serialization of pipelines.
+
+Pipelines are written as JSON: a spec of each pipeline's class and options,
+and of the nodes in its operation graph with their arguments. Edges between
+nodes are recorded as references in the arguments. Functions and classes
+are referenced by import path, simple objects by their class and state, and
+small arrays by value, so a spec loads quickly and is cheap to send to
+workers. Anything else (e.g. closures and lambdas) is pickled with dill and
+embedded in the spec.
+
+Classes
+-------
+SerializationError
+    Raised when a spec cannot be loaded.
+
+Functions
+---------
+dump
+    Write a pipeline or operation graph to a file.
+dumps
+    Serialize a pipeline or operation graph to a JSON string.
+load
+    Read a pipeline or operation graph from a file.
+loads
+    Deserialize a pipeline or operation graph from a JSON string.
+"""
+
+import base64
+import importlib
+import inspect
+import json
+
+import dill
+import numpy as np
+
+from florin.batching import batched
+from florin.graph import FlorinNode, FlorinOrderedMultiDiGraph
+
+
+# Version of the spec format written by this module. Specs written by later
+# versions are refused, and older versions remain readable.
+FORMAT_VERSION = 1
+
+# The largest array, in elements, stored by value. Larger arrays are pickled.
+MAX_ARRAY_SIZE = 1024
+
+
+class SerializationError(ValueError):
+    """Raised when a spec cannot be loaded."""
+    def __init__(self, reason):
+        super(SerializationError, self).__init__(
+            'Could not load serialized pipeline: {}'.format(reason))
+
+
+def dump(obj, fp, indent=None):
+    """Write a pipeline or operation graph to a file.
+
+    Parameters
+    ----------
+    obj : florin.pipelines.Pipeline or florin.graph.FlorinOrderedMultiDiGraph
+        The object to serialize.
+    fp : File
+        File to write the spec to, opened in text or binary mode.
+    indent : int, optional
+        Indentation of the JSON, for readability. Default: None, for the most
+        compact output.
+    """
+    s = dumps(obj, indent=indent)
+    if 'b' in getattr(fp, 'mode', ''):
+        s = s.encode('utf-8')
+    fp.write(s)
+
+
+def dumps(obj, indent=None):
+    """Serialize a pipeline or operation graph to a JSON string.
+
+    Parameters
+    ----------
+    obj : florin.pipelines.Pipeline or florin.graph.FlorinOrderedMultiDiGraph
+        The object to serialize.
+    indent : int, optional
+        Indentation of the JSON, for readability. Default: None, for the most
+        compact output.
+
+    Returns
+    -------
+    spec : str
+    """
+    if isinstance(obj, FlorinOrderedMultiDiGraph):
+        spec = {'florin': FORMAT_VERSION, 'graph': _graph_spec(obj)}
+    else:
+        spec = {'florin': FORMAT_VERSION, 'pipeline': _pipeline_spec(obj)}
+    return json.dumps(spec, indent=indent)
+
+
+def load(fp):
+    """Read a pipeline or operation graph from a file.
+
+    Parameters
+    ----------
+    fp : File
+        File to read the spec from, opened in text or binary mode. Files
+        written with dill by earlier versions of FLoRIN are also read.
+
+    Returns
+    -------
+    obj : florin.pipelines.Pipeline or florin.graph.FlorinOrderedMultiDiGraph
+    """
+    return loads(fp.read())
+
+
+def loads(s):
+    """Deserialize a pipeline or operation graph from a JSON string.
+
+    Parameters
+    ----------
+    s : str or bytes
+        The spec. Bytes written with dill by earlier versions of FLoRIN are
+        also accepted.
+
+    Returns
+    -------
+    obj : florin.pipelines.Pipeline or florin.graph.FlorinOrderedMultiDiGraph
+
+    Raises
+    ------
+    SerializationError
+        If the spec was written by a newer version of FLoRIN or is not a
+        pipeline spec.
+    """
+    if isinstance(s, bytes):
+        if not s.lstrip().startswith(b'{'):
+            return dill.loads(s)
+        s = s.decode('utf-8')
+
+    spec = json.loads(s)
+    if not isinstance(spec, dict) or 'florin' not in spec:
+        raise SerializationError('not a FLoRIN pipeline spec')
+    if spec['florin'] > FORMAT_VERSION:
+        raise SerializationError(
+            'written with format version {}, but only versions up to {} are '
+            'supported'.format(spec['florin'], FORMAT_VERSION))
+
+    if 'graph' in spec:
+        return _load_graph(spec['graph'])
+    return _load_pipeline(spec['pipeline'])
+
+
+def _pipeline_spec(pipeline):
+    """Describe a pipeline by its class, options, and operation graph."""
+    state = pipeline.__getstate__()
+    options = {key: _encode(val) for key, val in state.items()
+               if key != 'operations' and not key.startswith('_pool')}
+    return {'class': _import_path(type(pipeline)),
+            'options': options,
+            'graph': _graph_spec(pipeline.operations)}
+
+
+def _load_pipeline(spec):
+    cls = _import(spec['class'])
+    pipeline = cls.__new__(cls)
+    state = {key: _decode(val) for key, val in spec['options'].items()}
+    state.update(operations=_load_graph(spec['graph']), _pool=None,
+                 _pool_pid=None)
+    pipeline.__setstate__(state)
+    return pipeline
+
+
+def _graph_spec(graph):
+    """Describe an operation graph by its nodes and their arguments."""
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+
+    specs = []
+    for node in nodes:
+        spec = {'operation': _encode(node.operation),
+                'args': [_encode(arg, index) for arg in node.args],
+                'kwargs': {key: _encode(val, index)
+                           for key, val in node.kwargs.items()}}
+        if node.cache is not None:
+            spec['cache'] = _encode(node.cache)
+        if node.batch is not None:
+            spec['batch'] = node.batch
+        specs.append(spec)
+
+    return {'name': graph.name,
+            'threads': graph.threads,
+            'checkpoint': _encode(graph.checkpoint),
+            'cache': _encode(graph.cache),
+            'nodes': specs,
+            'last': index.get(graph.last)}
+
+
+def _load_graph(spec):
+    graph = FlorinOrderedMultiDiGraph(threads=spec['threads'],
+                                      checkpoint=_decode(spec['checkpoint']),
+                                      cache=_decode(spec['cache']))
+    graph.name = spec['name']
+
+    # Create every node before resolving arguments, which may refer to nodes
+    # later in the order.
+    nodes = [FlorinNode(_decode(node['operation'])) for node in spec['nodes']]
+    for node, node_spec in zip(nodes, spec['nodes']):
+        node.args = tuple(_decode(arg, nodes) for arg in node_spec['args'])
+        node.kwargs = {key: _decode(val, nodes)
+                       for key, val in node_spec['kwargs'].items()}
+        if 'cache' in node_spec:
+            node.cache = _decode(node_spec['cache'])
+        if 'batch' in node_spec:
+            node.batch = node_spec['batch']
+
+    for node in nodes:
+        graph.add(node)
+    graph.last = nodes[spec['last']] if spec['last'] is not None else None
+    return graph
+
+
+def _encode(obj, nodes=None):
+    """Convert an argument or attribute into JSON-compatible values."""
+    from florin.pipelines.pipeline import Pipeline
+
+    if obj is None or type(obj) in (bool, int, float, str):
+        return obj
+    elif isinstance(obj, FlorinNode) and nodes is not None and obj in nodes:
+        return {'$node': nodes[obj]}
+    elif type(obj) is list:
+        return [_encode(val, nodes) for val in obj]
+    elif type(obj) is tuple:
+        return {'$tuple': [_encode(val, nodes) for val in obj]}
+    elif type(obj) is dict:
+        if all(isinstance(key, str) and not key.startswith('$')
+               for key in obj):
+            return {key: _encode(val, nodes) for key, val in obj.items()}
+        return {'$dict': [[_encode(key, nodes), _encode(val, nodes)]
+                          for key, val in obj.items()]}
+    elif isinstance(obj, Pipeline):
+        return {'$pipeline': _pipeline_spec(obj)}
+    elif isinstance(obj, np.ndarray) and obj.dtype != object and \
+            obj.size <= MAX_ARRAY_SIZE:
+        return {'$array': obj.tolist(), 'dtype': obj.dtype.str}
+    elif isinstance(obj, np.generic) and obj.dtype != object:
+        return {'$scalar': obj.item(), 'dtype': obj.dtype.str}
+
+    path = _import_path(obj)
+    if path is not None:
+        return {'$import': path}
+
+    # Florinated functions refer to the wrapper at the import path.
+    wrapped = _import_path(obj, wrapped=True)
+    if wrapped is not None:
+        return {'$import': wrapped, 'wrapped': True}
+
+    # Functions marked with ``batched`` refer to the function they wrap.
+    batch = getattr(obj, '_florin_batch', None)
+    if batch is not None and hasattr(obj, '__wrapped__'):
+        return {'$batched': _encode(obj.__wrapped__, nodes),
+                'stack': batch == 'stack'}
+
+    if _simple_object(obj):
+        if _custom_getstate(type(obj)):
+            state = obj.__getstate__()
+        else:
+            state = obj.__dict__
+        return {'$object': _import_path(type(obj)),
+                'state': _encode(state, nodes)}
+
+    return {'$dill': base64.b64encode(dill.dumps(obj)).decode('ascii')}
+
+
+def _decode(obj, nodes=None):
+    """Convert values created by ``_encode`` back into Python objects."""
+    if isinstance(obj, list):
+        return [_decode(val, nodes) for val in obj]
+    elif not isinstance(obj, dict):
+        return obj
+
+    if '$node' in obj:
+        return nodes[obj['$node']]
+    elif '$tuple' in obj:
+        return tuple(_decode(val, nodes) for val in obj['$tuple'])
+    elif '$dict' in obj:
+        return {_decode(key, nodes): _decode(val, nodes)
+                for key, val in obj['$dict']}
+    elif '$pipeline' in obj:
+        return _load_pipeline(obj['$pipeline'])
+    elif '$array' in obj:
+        return np.array(obj['$array'], dtype=obj['dtype'])
+    elif '$scalar' in obj:
+        return np.dtype(obj['dtype']).type(obj['$scalar'])
+    elif '$import' in obj:
+        target = _import(obj['$import'])
+        return target.__wrapped__ if obj.get('wrapped') else target
+    elif '$batched' in obj:
+        return batched(_decode(obj['$batched'], nodes), stack=obj['stack'])
+    elif '$object' in obj:
+        cls = _import(obj['$object'])
+        instance = cls.__new__(cls)
+        state = _decode(obj['state'], nodes)
+        if hasattr(instance, '__setstate__'):
+            instance.__setstate__(state)
+        else:
+            instance.__dict__.update(state)
+        return instance
+    elif '$dill' in obj:
+        return dill.loads(base64.b64decode(obj['$dill']))
+    return {key: _decode(val, nodes) for key, val in obj.items()}
+
+
+def _import_path(obj, wrapped=False):
+    """Get the path that imports an object, or None if there is none.
+
+    If ``wrapped``, find the path of a wrapper around the object instead.
+    """
+    module = getattr(obj, '__module__', None)
+    qualname = getattr(obj, '__qualname__', None)
+    if not isinstance(module, str) or not isinstance(qualname, str) or \
+       module == '__main__' or '<' in qualname:
+        return None
+
+    path = '{}:{}'.format(module, qualname)
+    try:
+        target = _import(path)
+    except (ImportError, AttributeError):
+        return None
+
+    if wrapped:
+        target = getattr(target, '__wrapped__', None)
+    return path if target is obj else None
+
+
+def _import(path):
+    """Import an object from a 'module:qualname' path."""
+    module, qualname = path.split(':')
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _simple_object(obj):
+    """Check if an object is restored by copying its class and state."""
+    cls = type(obj)
+    return not inspect.isroutine(obj) and \
+        cls.__module__ != 'builtins' and \
+        not isinstance(obj, (list, tuple, dict, set, frozenset, np.ndarray)) \
+        and cls.__reduce_ex__ is object.__reduce_ex__ and \
+        cls.__reduce__ is object.__reduce__ and \
+        (hasattr(obj, '__dict__') or _custom_getstate(cls)) and \
+        _import_path(cls) is not None
+
+
+def _custom_getstate(cls):
+    """Check if a class defines its own ``__getstate__``."""
+    return getattr(cls, '__getstate__', None) is not \
+        getattr(object, '__getstate__', None)
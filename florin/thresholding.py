@@ -4,10 +4,14 @@ Functions
 ---------
 ndnt
     Binarize data with N-Dimensional Neighborhood Thresholding.
+ndnt_batch
+    Binarize a batch of same-shaped tiles with NDNT in one pass.
 """
 
+from florin.batching import batched
 from florin.closure import florinate
-from florin.ndnt import ndnt
+from florin.ndnt import ndnt, ndnt_stack
 
 
 ndnt = florinate(ndnt)
+ndnt_batch = florinate(batched(ndnt_stack, stack=True))
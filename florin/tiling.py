@@ -8,13 +8,14 @@ join_tiles
     Join a sequence of tiles into a single array.
 """
 
-import h5py
-import numpy as np
+import os
+import sys
 
-from cloudvolume import CloudVolume
+import numpy as np
 
 from florin.closure import florinate
-from florin.context import FlorinMetadata
+from florin.context import TileMetadata
+from florin.io.zarr import open_zarr
 
 
 class DimensionMismatchError(ValueError):
@@ -32,25 +33,32 @@ class ShapeStepMismatchError(ValueError):
     pass
 
 
-def tile_generator(img, shape=None, stride=None, offset=None, tile_store=None):
+def tile_generator(img, shape=None, stride=None, offset=None, tile_store=None,
+                   select=None):
     """Tile data into n-dimensional subdivisions.
 
     Parameters
     ----------
     img : array_like
         The data to subdivide.
-    shape : tuple of int
-        The shape of the subdivisions.
+    shape : tuple of int or 'chunks'
+        The shape of the subdivisions. If 'chunks', use the chunk shape of
+        ``img`` (e.g. a Zarr array or chunked HDF5 dataset) so that each tile
+        maps to exactly one chunk.
     stride : tuple of int
         The stride between subdivisions.
+    select : slice, optional
+        Yield only the tiles at these positions in the tiling order, e.g.
+        ``slice(0, None, 4)`` for every fourth tile. Tiles that are not
+        selected are never read.
 
     Yields
     ------
     tile : florin.FlorinVolume
         A subdivision of ``img``. Subdivisions are yielded in sequence from the
         start of ``img``.
-    metadata : florin.context.Metadata
-        Key/value store of metadata, e.g. for joining tiles.
+    metadata : florin.context.TileMetadata
+        The origin of the tile and the shape of ``img``, for joining tiles.
 
     Notes
     -----
@@ -59,6 +67,9 @@ def tile_generator(img, shape=None, stride=None, offset=None, tile_store=None):
     """
 
     # Normalize the shape and stride tuples to match the dimensionality of img.
+    if isinstance(shape, str) and shape == 'chunks':
+        shape = getattr(img, 'chunks', None)
+
     if shape is None:
         shape = img.shape
     elif len(shape) < len(img.shape):
@@ -90,68 +101,110 @@ def tile_generator(img, shape=None, stride=None, offset=None, tile_store=None):
     stride = np.asarray(stride)
     offset = np.asarray(offset)
 
-    # Get the number of volumes
+    # Get the number of volumes. Tiles at the end of each axis are clipped to
+    # the array, so round up to include them.
     img_shape = np.asarray(img.shape)
-    blocked_shape = ((img_shape - offset) / stride)
-    for i in range(1, blocked_shape.ndim):
-        blocked_shape[i] = np.ceil(blocked_shape[i])
-    blocked_shape = blocked_shape.astype(np.int32)
+    blocked_shape = np.ceil((img_shape - offset) / stride).astype(np.int32)
     n_blocks = int(np.prod(blocked_shape))
 
     start_block = np.ravel_multi_index(
         tuple([np.array([i]) for i in offset]),
         img.shape)[0]
 
+    blocks = range(start_block, n_blocks)
+    if select is not None:
+        blocks = blocks[select]
+
     # Iterate over the blocks and return them on request
-    for i in range(start_block, n_blocks):
+    cloudvolume = _is_cloudvolume(img)
+    for i in blocks:
         idx = np.asarray(np.unravel_index(i, blocked_shape))
         start = idx * stride
-        end = start + shape
-        over = np.where(end > np.asarray(img.shape))
-        end[over] = np.asarray(img.shape)[over]
-        slices = [slice(start[j], end[j]) for j in range(len(shape))]
+        end = np.minimum(start + shape, img_shape)
+        slices = [slice(s, e) for s, e in zip(start.tolist(), end.tolist())]
 
-        if isinstance(img, CloudVolume):
+        if cloudvolume:
             slices = slices[::-1]
 
         block = img[tuple(slices)]
 
-        if isinstance(block, CloudVolume):
+        if _is_cloudvolume(block):
             block = np.transpose(block, axes=(2, 1, 0))
 
-        yield block, \
-              FlorinMetadata(original_shape=img.shape, origin=tuple(start))
+        yield block, TileMetadata(tuple(start.tolist()), img.shape)
 
 
-def join_tiles(tiles):
+def join_tiles(tiles, out=None, chunks=None):
     """Join a set of tiles into a single array.
 
     Parameters
     ----------
     tiles : collection of FlorinArray
         The collection of tiles to join.
-    shape : tuple of int
-        The shape of the joined array.
+    out : array_like or str, optional
+        The array to join the tiles into. If a path to a Zarr or N5 store, the
+        tiles are written into an array at that path, which is created with
+        chunks of shape ``chunks`` if it does not exist. If None, a new
+        in-memory array is created.
+    chunks : tuple of int, optional
+        The chunk shape of an array created in a store, normally the shape
+        the tiles were made with. If None, use the shape of the first tile,
+        which is smaller than the rest if it was clipped at the edge of the
+        array.
 
     Returns
     -------
     joined : array_like
         The array created by joining the tiles and inserting them into the
         correct positions.
+
+    Notes
+    -----
+    Chunked stores let separate processes join disjoint sets of tiles into
+    the same array concurrently, provided tiles are chunk-aligned and do not
+    overlap. Every process should pass the same ``chunks``, since any of them
+    may be the one to create the array.
+
+    Tiles are written over the contents of ``out`` when it is given, so
+    joining the same tiles into a store again (e.g. when a job is rerun)
+    leaves it unchanged. Tiles joined into a new in-memory array are summed
+    where they overlap.
     """
-    out = None
+    overwrite = out is not None
     for tile, metadata in tiles:
+        # Tiles completed in an earlier, checkpointed run may be left out.
+        if tile is None:
+            continue
+
         if out is None:
             out = np.zeros(metadata['original_shape'], dtype=tile.dtype)
+        elif isinstance(out, str):
+            out = open_zarr(out, mode='a', shape=metadata['original_shape'],
+                            dtype=tile.dtype,
+                            chunks=chunks if chunks is not None else tile.shape)
 
         start = np.asarray(metadata['origin'])
         end = start + np.asarray(tile.shape)
         slices = [slice(start[i], end[i]) for i in range(tile.ndim)]
 
-        out[tuple(slices)] += tile
+        if overwrite:
+            out[tuple(slices)] = tile
+        else:
+            out[tuple(slices)] += tile
+
+    # If there were no tiles to write, return the existing array in the
+    # store, if any.
+    if isinstance(out, str):
+        out = open_zarr(out, mode='r+') if os.path.exists(out) else None
 
     return out
 
 
+def _is_cloudvolume(img):
+    """Check for a CloudVolume without importing cloudvolume."""
+    cloudvolume = sys.modules.get('cloudvolume')
+    return cloudvolume is not None and isinstance(img, cloudvolume.CloudVolume)
+
+
 tile = florinate(tile_generator)
 join = florinate(join_tiles)
@@ -13,15 +13,12 @@ setup(
     url='https://github.com/jeffkinnison/florin',
     author='Jeff Kinnison, Elia Shahbazi',
     author_email='jkinniso@nd.edu, ashahbaz@nd.edu',
-    packages=['florin', 'florin.graph', 'florin.pipelines'],
+    packages=['florin', 'florin.graph', 'florin.io', 'florin.pipelines'],
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Operating System :: POSIX',
         'Operating System :: Unix',
@@ -29,15 +26,21 @@ setup(
         'Topic :: Scientific/Engineering :: Medical Science Apps.',
         'Topic :: System :: Distributed Computing',
     ],
+    python_requires='>=3.7',
     keywords='machine_learning hyperparameters distributed_computing',
+    entry_points={
+        'console_scripts': ['florin = florin.run:main'],
+    },
     install_requires=[
         'cloud-volume',
         'h5py',
         'mpi4py>=3.0.0',
+        'multiprocess',
         'networkx',
         'numpy',
-        'pathos',
         'scikit-image',
         'scipy',
+        'tifffile>=2020.9.30',
+        'zarr>=2.5,<3',
     ]
 )
@@ -0,0 +1,116 @@
+"""Unit tests for batched execution."""
+
+import numpy as np
+import pytest
+
+from florin.batching import (auto_batch_size, batched, batches,
+                             BatchSizeError)
+from florin.closure import florinate
+from florin.ndnt import ndnt
+from florin.pipelines import (MultiprocessingPipeline, MultithreadingPipeline,
+                              SerialPipeline, TaskFarmPipeline)
+from florin.thresholding import ndnt_batch
+from florin.tiling import join, tile
+
+
+CALLS = []
+
+
+@florinate
+@batched(stack=True)
+def scale(tiles, factor=1):
+    CALLS.append(len(tiles))
+    return tiles * factor
+
+
+@florinate
+def offset(x, value=0):
+    return x + value
+
+
+@florinate
+@batched
+def count(items):
+    return [len(items)] * len(items)
+
+
+@florinate
+@batched
+def broken(items):
+    return items[:-1]
+
+
+def test_batches():
+    assert list(batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batches([], 3)) == []
+
+    assert auto_batch_size(1000, workers=4) == 62
+    assert auto_batch_size(10, workers=4) == 1
+    assert auto_batch_size(10 ** 6, workers=1) == 256
+    assert auto_batch_size(None) == 32
+
+
+def test_batched_node():
+    # Outside of a batch, a batched operation sees a batch of one.
+    del CALLS[:]
+    p = SerialPipeline(scale(factor=2), offset(value=1))
+    assert np.all(p.run([np.ones(3)])[0] == 3)
+    assert CALLS == [1]
+
+    with pytest.raises(BatchSizeError):
+        SerialPipeline(broken(), batch_size=2).run([1, 2])
+
+
+def test_batched_wrapper():
+    def double(items):
+        return [2 * x for x in items]
+
+    # Marking a function leaves it unbatched everywhere else.
+    assert florinate(batched(double))().batch == 'list'
+    assert florinate(double)().batch is None
+    assert not hasattr(double, '_florin_batch')
+
+    # Florinated functions and builtins may be marked as well.
+    assert batched(florinate(double), stack=True)().batch == 'stack'
+    assert florinate(double)().batch is None
+    assert florinate(batched(len))().batch == 'list'
+    p = SerialPipeline(batched(florinate(double))(), batch_size=2)
+    assert p.run([1, 2, 3]) == [2, 4, 6]
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (SerialPipeline, {}),
+    (MultithreadingPipeline, {'threads': 2}),
+    (MultiprocessingPipeline, {'processes': 2}),
+    (MultiprocessingPipeline, {'processes': 2, 'shared_memory': True,
+                               'shared_threshold': 0}),
+    (TaskFarmPipeline, {'workers': 2}),
+])
+def test_batch_size(pipeline, kwargs):
+    data = [np.full((2, 2), i) for i in range(10)]
+    with pipeline(count(), offset(value=1), batch_size=4, **kwargs) as p:
+        assert p.run(data) == [5] * 4 + [5] * 4 + [3] * 2
+        assert list(p.imap(data)) == [5] * 4 + [5] * 4 + [3] * 2
+
+    with pipeline(scale(factor=3), batch_size='auto', **kwargs) as p:
+        out = p.run(data)
+    assert all([np.all(o == 3 * d) for o, d in zip(out, data)])
+
+
+def test_batched_tiles():
+    del CALLS[:]
+    data = np.random.rand(8, 8, 8)
+    p = SerialPipeline(
+        tile(shape=(2, 8, 8)),
+        SerialPipeline(scale(factor=2), batch_size=3),
+        join())
+    assert np.allclose(p(data)[0], data * 2)
+    assert CALLS == [3, 1]
+
+
+def test_ndnt_batch():
+    imgs = np.random.rand(6, 8, 8)
+    out = SerialPipeline(ndnt_batch(shape=(3, 3), threshold=0.3),
+                         batch_size=4).run(list(imgs))
+    expected = [ndnt(img, shape=(3, 3), threshold=0.3) for img in imgs]
+    assert all([np.all(o == e) for o, e in zip(out, expected)])
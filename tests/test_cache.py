@@ -0,0 +1,171 @@
+"""Unit tests for caching the results of pipeline operations."""
+
+from functools import partial
+
+import numpy as np
+import pytest
+
+from florin.cache import DiskCache, MemoryCache, operation_key
+from florin.closure import florinate
+from florin.pipelines import MultithreadingPipeline, SerialPipeline
+
+
+CALLS = []
+
+
+@florinate
+def scale(x, factor=1):
+    CALLS.append('scale')
+    return x * factor
+
+
+@florinate
+def offset(x, value=0):
+    CALLS.append('offset')
+    return x + value
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_bytes=200)
+    assert cache.get('a') == (False, None)
+
+    cache.put('a', np.zeros(10))
+    cache.put('b', np.ones(10))
+    hit, result = cache.get('a')
+    assert hit and np.all(result == 0)
+    assert cache.nbytes == 160
+
+    # 'b' is the least recently used, so it is evicted to make room.
+    cache.put('c', np.ones(6))
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.nbytes == 128
+
+    # Results over the budget are never cached.
+    cache.put('d', np.ones(100))
+    assert 'd' not in cache
+
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_disk_cache(tmpdir):
+    cache = DiskCache(str(tmpdir.join('cache')))
+    cache.put('a', np.arange(6).reshape(2, 3))
+    cache.put('b', {'x': [1, 2]})
+
+    hit, result = cache.get('a')
+    assert hit and np.all(result == np.arange(6).reshape(2, 3))
+    assert cache.get('b') == (True, {'x': [1, 2]})
+    assert cache.get('c') == (False, None)
+    assert len(cache) == 2
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_operation_key():
+    assert operation_key(scale(factor=2).operation) == \
+        operation_key(scale(factor=3).operation)
+    assert operation_key(scale().operation) != \
+        operation_key(offset().operation)
+
+
+def add(x, k=1):
+    return x + k
+
+
+def mul(x, k=1):
+    return x * k
+
+
+def make(k):
+    def shift(x):
+        return x + k
+    return shift
+
+
+def test_operation_key_content():
+    # Partial functions are keyed by their function and bound arguments.
+    assert operation_key(partial(add, k=1)) == operation_key(partial(add, k=1))
+    assert len({operation_key(partial(add, k=1)),
+                operation_key(partial(add, k=2)),
+                operation_key(partial(mul, k=1)),
+                operation_key(partial(add, 1))}) == 4
+
+    # Closures and defaults are part of a function's key.
+    assert operation_key(make(2)) == operation_key(make(2))
+    assert operation_key(make(2)) != operation_key(make(3))
+    f = make(2)
+    key = operation_key(f)
+    f.__defaults__ = (1,)
+    assert operation_key(f) != key
+
+    # Operations holding values that cannot be hashed have no key.
+    assert operation_key(partial(add, k=(i for i in range(3)))) is None
+
+
+def test_pipeline_cache_partial():
+    cache = MemoryCache()
+    data = [1, 2, 3]
+    assert SerialPipeline(florinate(partial(add, k=10))(),
+                          cache=cache)(data) == [11, 12, 13]
+    assert SerialPipeline(florinate(partial(mul, k=10))(),
+                          cache=cache)(data) == [10, 20, 30]
+    assert SerialPipeline(florinate(make(3))(), cache=cache)(data) == \
+        [4, 5, 6]
+    assert SerialPipeline(florinate(make(4))(), cache=cache)(data) == \
+        [5, 6, 7]
+
+    # Operations without a key run every time, as do the nodes after them.
+    calls = []
+    ids = (i for i in range(100))
+
+    def numbered(x):
+        calls.append(next(ids))
+        return x
+
+    p = SerialPipeline(florinate(numbered)(), offset(value=1), cache=cache)
+    del CALLS[:]
+    assert p(data) == p(data) == [2, 3, 4]
+    assert len(calls) == 6
+    assert CALLS == ['offset'] * 6
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (SerialPipeline, {}),
+    (MultithreadingPipeline, {'threads': 2}),
+])
+def test_pipeline_cache(pipeline, kwargs):
+    cache = MemoryCache()
+    data = [np.arange(4), np.arange(4, 8)]
+
+    del CALLS[:]
+    out = pipeline(scale(factor=2), offset(value=1), cache=cache,
+                   **kwargs).run(data)
+    assert [np.all(o == d * 2 + 1) for o, d in zip(out, data)] == [True] * 2
+    assert sorted(CALLS) == ['offset'] * 2 + ['scale'] * 2
+
+    # Changing only the last operation reuses the results of the first.
+    del CALLS[:]
+    out = pipeline(scale(factor=2), offset(value=5), cache=cache,
+                   **kwargs).run(data)
+    assert [np.all(o == d * 2 + 5) for o, d in zip(out, data)] == [True] * 2
+    assert CALLS == ['offset'] * 2
+
+    # New data and changed arguments miss the cache.
+    del CALLS[:]
+    pipeline(scale(factor=3), offset(value=5), cache=cache,
+             **kwargs).run(data + [np.arange(2)])
+    assert sorted(CALLS) == ['offset'] * 3 + ['scale'] * 3
+
+
+def test_node_cache_opt_out():
+    cache = MemoryCache()
+    node = offset(value=1)
+    node.cache = False
+    p = SerialPipeline(scale(factor=2), node, cache=cache)
+
+    del CALLS[:]
+    p.run([np.arange(4)])
+    p.run([np.arange(4)])
+    assert CALLS == ['scale', 'offset', 'offset']
@@ -0,0 +1,147 @@
+"""Unit tests for checkpointing pipeline runs."""
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from florin.checkpoint import Checkpoint, digest
+from florin.closure import florinate
+from florin.context import FlorinMetadata
+from florin.pipelines import (MultiprocessingPipeline, MultithreadingPipeline,
+                              SerialPipeline)
+from florin.tiling import join, tile
+
+
+@florinate
+def record(x, path=None, fail=None):
+    """Square a tile, leaving a file behind for every call."""
+    if fail is not None and os.path.exists(fail) and 8 <= x.min() < 12:
+        raise RuntimeError('failed on tile starting at 8')
+    tempfile.mkstemp(dir=path)
+    return x ** 2
+
+
+@florinate
+def scale(x, factor=1):
+    return x * factor
+
+
+def make_data(shape):
+    """Make data whose value starts with its index along the first axis."""
+    data = np.random.rand(*shape) * 0.5
+    return data + np.arange(shape[0]).reshape(-1, 1, 1)
+
+
+def test_checkpoint(tmpdir):
+    ckpt = Checkpoint(str(tmpdir.join('ckpt')))
+    assert len(ckpt) == 0
+
+    data = (np.ones((2, 2)), FlorinMetadata(origin=(2, 4)))
+    key = ckpt.key(data)
+    assert key.startswith('tile_2-4_2-2_')
+    assert key not in ckpt
+
+    # Keys differ with the content of a tile and the operations run on it.
+    assert ckpt.key((np.zeros((2, 2)), data[1])) != key
+    assert ckpt.key(data, namespace='a') != key
+    assert ckpt.key(data, namespace='a') != ckpt.key(data, namespace='b')
+    assert ckpt.key(np.arange(4), namespace='a') != ckpt.key(np.arange(4))
+
+    ckpt.save(key, np.zeros(3))
+    assert key in ckpt
+    assert np.all(ckpt.load(key) == 0)
+    assert ckpt.completed() == set([key])
+
+    # Other data is keyed by content.
+    assert ckpt.key(np.arange(4)) == ckpt.key(np.arange(4))
+    assert ckpt.key(np.arange(4)) != ckpt.key(np.arange(4).astype(np.int8))
+    assert digest([1, 'a']) != digest([1, 'b'])
+
+    ckpt = Checkpoint(str(tmpdir.join('ckpt')), results=False)
+    ckpt.save('foo', np.zeros(3))
+    assert ckpt.load('foo') is None
+    ckpt.clear()
+    assert len(ckpt) == 0
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (SerialPipeline, {}),
+    (MultithreadingPipeline, {'threads': 2}),
+    (MultiprocessingPipeline, {'processes': 2}),
+])
+def test_resume(tmpdir, pipeline, kwargs):
+    calls = tmpdir.mkdir('calls')
+    fail = str(tmpdir.join('fail'))
+    open(fail, 'w').close()
+    ckpt = str(tmpdir.join('ckpt'))
+
+    data = make_data((16, 8, 8))
+    p = SerialPipeline(
+        tile(shape=(4, 8, 8)),
+        pipeline(record(path=str(calls), fail=fail), checkpoint=ckpt,
+                 **kwargs),
+        join())
+
+    # The first run fails partway through, leaving the other tiles done.
+    with pytest.raises(RuntimeError):
+        p(data)
+    assert not any(key.startswith('tile_8-0-0_4-8-8')
+                   for key in Checkpoint(ckpt).completed())
+    done = len(Checkpoint(ckpt))
+    assert done >= 1
+    assert len(calls.listdir()) == done
+
+    # Resuming only runs the unfinished tiles.
+    os.remove(fail)
+    assert np.allclose(p(data)[0], data ** 2)
+    assert len(calls.listdir()) == 4
+    assert len(Checkpoint(ckpt)) == 4
+
+    # Nothing is rerun once every tile is done.
+    ncalls = len(calls.listdir())
+    assert np.allclose(p(data)[0], data ** 2)
+    assert len(calls.listdir()) == ncalls
+
+
+def test_resume_without_results(tmpdir):
+    ckpt = Checkpoint(str(tmpdir.join('ckpt')), results=False)
+    out = str(tmpdir.join('out.zarr'))
+
+    calls = tmpdir.mkdir('calls')
+    data = make_data((8, 8, 8))
+    p = SerialPipeline(
+        tile(shape=(4, 8, 8)),
+        SerialPipeline(record(path=str(calls)), checkpoint=ckpt),
+        join(out=out))
+    assert np.allclose(p(data)[0][...], data ** 2)
+
+    # Completed tiles come back as None and are not joined a second time.
+    assert np.allclose(p(data)[0][...], data ** 2)
+    assert len(calls.listdir()) == 2
+
+
+def test_stale_results(tmpdir):
+    calls = tmpdir.mkdir('calls')
+    ckpt = str(tmpdir.join('ckpt'))
+    data = make_data((8, 8, 8))
+
+    def run(data, factor):
+        p = SerialPipeline(
+            tile(shape=(4, 8, 8)),
+            SerialPipeline(record(path=str(calls)), scale(factor=factor),
+                           checkpoint=ckpt),
+            join())
+        return p(data)[0]
+
+    assert np.allclose(run(data, 1), data ** 2)
+    assert np.allclose(run(data, 1), data ** 2)
+    assert len(calls.listdir()) == 2
+
+    # Changed parameters and changed input data are not read from the
+    # checkpoint.
+    assert np.allclose(run(data, 2), 2 * data ** 2)
+    assert len(calls.listdir()) == 4
+    assert np.allclose(run(data + 1, 2), 2 * (data + 1) ** 2)
+    assert len(calls.listdir()) == 6
@@ -2,7 +2,7 @@ import copy
 
 import pytest
 
-from florin.classification import classify, FlorinClassifier
+from florin.classification import classify, classify_batch, FlorinClassifier
 
 
 class DummyRegionProps(object):
@@ -66,6 +66,15 @@ def test_classify(dummy_targets, classes):
         assert target.class_label is None
 
 
+def test_classify_batch(dummy_targets, classes):
+    targets = copy.deepcopy(dummy_targets)
+    assert classify_batch(*classes)(targets) is not targets
+    assert [t.class_label for t in targets] == list(range(len(targets)))
+
+    classify_batch()(targets)
+    assert all([t.class_label is None for t in targets])
+
+
 class TestFlorinClassifier(object):
     """Test cases for boundary-based classification."""
 
@@ -0,0 +1,237 @@
+"""Unit tests for FLoRIN graphs and execution plans."""
+
+import weakref
+
+import pytest
+
+from florin.closure import florinate
+from florin.graph import (FlorinExecutionPlan, FlorinNode,
+                          FlorinOrderedMultiDiGraph)
+
+
+class Box(object):
+    """Weakref-able wrapper to track when results are released."""
+    def __init__(self, val):
+        self.val = val
+
+
+@florinate
+def identity(x):
+    return x
+
+
+@florinate
+def box(x, refs=None):
+    b = Box(x)
+    if refs is not None:
+        refs.append(weakref.ref(b))
+    return b
+
+
+@florinate
+def add(x, y):
+    return Box(x.val + y.val)
+
+
+@florinate
+def check_released(x, refs=None, expected=None):
+    """Check which boxes are still alive when this node runs."""
+    alive = [r() is not None for r in refs]
+    assert alive == expected
+    return x
+
+
+def make_graph(*nodes):
+    graph = FlorinOrderedMultiDiGraph()
+    for node in nodes:
+        graph.add(node)
+    return graph
+
+
+def test_node():
+    a = identity()
+    b = FlorinNode(len, 1, key=2)
+    assert b.__name__ == 'len' and b.args == (1,) and b.kwargs == {'key': 2}
+    assert b.id > a.id
+    assert hash(a) != hash(b) and hash(a) == hash(a)
+    assert len({a, b, a}) == 2
+
+    # Nodes are slotted to keep them small and fast to create.
+    graph = make_graph(a, b)
+    assert a.graph is graph
+    with pytest.raises(AttributeError):
+        a.other = 1
+
+
+def test_plan():
+    refs = []
+    a = identity()
+    b = box(a, refs=refs)
+    c = box(a, refs=refs)
+    d = add(b, y=c)
+    e = check_released(d, refs=refs, expected=[False, False])
+    graph = make_graph(a, b, c, d, e)
+
+    plan = graph.compile()
+    assert isinstance(plan, FlorinExecutionPlan)
+    assert len(plan) == 5
+    assert graph.compile() is plan
+    assert plan.nodes[plan.root] is a
+
+    nedges = graph.number_of_edges()
+    for i in range(5):
+        del refs[:]
+        result = graph(i)
+        assert isinstance(result, Box)
+        assert result.val == 2 * i
+        assert graph.number_of_edges() == nedges
+
+    # Adding a node invalidates the compiled plan.
+    f = add(e, e)
+    graph.add(f)
+    assert graph.compile() is not plan
+    del refs[:]
+    assert graph(3).val == 12
+
+
+def test_plan_order():
+    """Nodes run after their dependencies regardless of insertion order."""
+    a = identity()
+    c = add(a, a)
+    b = add(c, a)
+    graph = make_graph(a, b, c)
+    graph.last = b
+
+    plan = graph.compile()
+    assert plan.nodes == [a, c, b]
+    assert graph(Box(2)).val == 6
+
+
+def test_plan_exception():
+    refs = []
+    a = identity()
+    b = box(a, refs=refs)
+    c = add(b, 'not a box')
+    graph = make_graph(a, b, c)
+
+    with pytest.raises(AttributeError):
+        graph(1)
+    assert refs[0]() is None
+
+
+def test_plan_refcounts():
+    """Results consumed by several nodes live until the last one runs."""
+    refs = []
+    a = identity()
+    b = box(a, refs=refs)
+    c = identity(b)
+    d = check_released(c, refs=refs, expected=[True])
+    e = add(b, d)
+    f = check_released(e, refs=refs, expected=[False])
+    graph = make_graph(a, b, c, d, e, f)
+
+    plan = graph.compile()
+    assert plan.consumers[plan.nodes.index(b)] == 2
+    assert plan.consumers[plan.nodes.index(c)] == 1
+    assert graph(2).val == 4
+
+    # Results with no consumers are dropped immediately.
+    del refs[:]
+    g = box(a, refs=refs)
+    h = check_released(f, refs=refs, expected=[False, False])
+    graph.add(g)
+    graph.add(h)
+    graph.last = h
+    assert graph(2).val == 4
+
+
+def test_plan_report():
+    import numpy as np
+
+    @florinate
+    def ones(x):
+        return np.ones(x, dtype=np.uint8)
+
+    @florinate
+    def double(x):
+        return np.concatenate([x, x])
+
+    @florinate
+    def total(x):
+        return np.array([x.sum()], dtype=np.uint16)
+
+    a = identity()
+    b = ones(a)
+    c = double(b)
+    d = double(c)
+    e = total(d)
+    graph = make_graph(a, b, c, d, e)
+
+    report = {}
+    assert graph(100, report=report)[0] == 400
+    sizes = [size for _, size in report['nodes']]
+    assert sizes[1:] == [100, 200, 400, 2]
+    assert report['total_bytes'] == sum(sizes)
+    assert report['peak_bytes'] < report['total_bytes']
+    assert report['peak_bytes'] == 200 + 400
+    assert [name for name, _ in report['nodes']] == \
+        [a.__name__, 'ones', 'double', 'double', 'total']
+
+
+def test_plan_concurrent():
+    import random
+    import threading
+    import time
+
+    barrier = threading.Barrier(2, timeout=2)
+
+    @florinate
+    def meet(x, offset):
+        # Only passes if both branches are running at the same time.
+        barrier.wait()
+        return Box(x.val + offset)
+
+    @florinate
+    def jitter(x, offset):
+        time.sleep(random.random() * 0.01)
+        return Box(x.val + offset)
+
+    @florinate
+    def combine(*boxes):
+        return tuple(b.val for b in boxes)
+
+    a = identity()
+    b = meet(a, 1)
+    c = meet(a, 2)
+    d = [jitter(b, i) for i in range(4)]
+    e = [jitter(c, i) for i in range(4)]
+    f = combine(*(d + e))
+    graph = make_graph(a, b, c, *(d + e + [f]))
+    graph.threads = 4
+
+    assert graph.compile().width == 8
+    expected = tuple([i + 1 for i in range(4)] + [i + 2 for i in range(4)])
+    for _ in range(5):
+        report = {}
+        assert graph(Box(0), report=report) == expected
+        assert len(report['nodes']) == 12
+
+    # Chains gain nothing from threads and run one node at a time.
+    graph = make_graph(a, b)
+    graph.threads = 4
+    assert graph.compile().width == 1
+    with pytest.raises(threading.BrokenBarrierError):
+        barrier.reset()
+        graph(Box(0))
+
+
+def test_plan_concurrent_exception():
+    a = identity()
+    b = add(a, 'not a box')
+    c = identity(a)
+    d = add(c, b)
+    graph = make_graph(a, b, c, d)
+    graph.threads = 2
+
+    with pytest.raises(AttributeError):
+        graph(Box(1))
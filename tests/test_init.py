@@ -0,0 +1,47 @@
+"""Unit tests for lazily importing the florin package."""
+
+import subprocess
+import sys
+
+import pytest
+
+import florin
+
+
+def run(code):
+    return subprocess.check_output([sys.executable, '-c', code]).decode()
+
+
+def test_import_time():
+    """A bare ``import florin`` should not import pipelines or libraries."""
+    code = ('import sys, time; start = time.perf_counter(); import florin; '
+            'print(time.perf_counter() - start); '
+            'print(",".join(m for m in ["networkx", "numpy", "asyncio", '
+            '"dill", "mpi4py", "h5py", "cloudvolume", "zarr"] '
+            'if m in sys.modules))')
+    times = []
+    for _ in range(3):
+        seconds, modules = run(code).split('\n')[:2]
+        assert modules == ''
+        times.append(float(seconds))
+    assert min(times) < 0.1
+
+
+def test_lazy_names():
+    from florin.classification import FlorinClassifier
+    from florin.pipelines import SerialPipeline
+    from florin.pipelines.pipeline import PipelineInput
+
+    assert florin.Serial is SerialPipeline
+    assert florin.bounds_classifier is FlorinClassifier
+    assert isinstance(florin.pipeline_input, PipelineInput)
+    assert florin.pipeline_input is florin.pipeline_input
+    assert 'Multiprocess' in dir(florin)
+    assert florin.thresholding.ndnt.__name__ == 'ndnt'
+
+    with pytest.raises(AttributeError):
+        florin.not_a_name
+
+    code = ('import sys, florin; florin.Serial; '
+            'print("florin.pipelines.asynchronous" in sys.modules)')
+    assert run(code).strip() == 'False'
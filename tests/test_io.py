@@ -1,14 +1,30 @@
+import gc
 import glob
+import multiprocessing
+from multiprocessing import Pool
 import os
+import pickle
+import subprocess
+import sys
 
+from cloudvolume import CloudVolume
 import h5py
 import pytest
 import numpy as np
 from skimage.io import imread, imsave
+import tifffile
+import zarr
 
 from florin.io import load, load_image, load_images, load_npy, load_hdf5, \
-                      load_tiff, save, save_image, save_images, save_npy, \
-                      save_hdf5, save_tiff
+                      load_cloudvolume, \
+                      load_tiff, save, save_cloudvolume, save_image, \
+                      save_images, save_npy, save_hdf5, save_tiff, \
+                      TiffStack, TiffStackWriter, IOBackend, find_backend, \
+                      get_backend, register_backend, unregister_backend, \
+                      load_zarr, open_zarr, save_zarr, HDF5Dataset, \
+                      HDF5FilePool
+from florin.io.hdf5 import file_pool
+from florin.io.backends import InvalidCapabilityError, UnknownBackendError
 
 
 @pytest.fixture(scope='module')
@@ -32,6 +48,9 @@ def load_setup(tmpdir_factory):
 
     np.save(os.path.join(str(tmpdir), 'data.npy'), data)
 
+    zarr.save_array(os.path.join(str(tmpdir), 'data.zarr'), data)
+    zarr.save_array(zarr.N5Store(os.path.join(str(tmpdir), 'data.n5')), data)
+
     return data, str(tmpdir)
 
 
@@ -49,12 +68,12 @@ def test_load(load_setup):
     assert np.all(loaded == data)
 
     loaded = load()(os.path.join(tmpdir, 'data.h5'))
-    assert isinstance(loaded, h5py.Dataset)
-    assert np.all(loaded[:] == data)
+    assert isinstance(loaded, np.ndarray)
+    assert np.all(loaded == data)
 
     loaded = load()(os.path.join(tmpdir, 'data.h5'), key='foo')
-    assert isinstance(loaded, h5py.Dataset)
-    assert np.all(loaded[:] == data)
+    assert isinstance(loaded, np.ndarray)
+    assert np.all(loaded == data)
 
     loaded = load()(os.path.join(tmpdir, 'data.tif'))
     assert np.all(loaded == data)
@@ -74,16 +93,204 @@ def test_load(load_setup):
         loaded = load()('/foo/bar.lksd')
 
 
+def test_find_backend(load_setup, tmpdir):
+    data, datadir = load_setup
+    tmpdir = str(tmpdir)
+
+    # Existing files are identified by extension or by their magic bytes.
+    assert find_backend(os.path.join(datadir, 'data.npy')).name == 'npy'
+    assert find_backend(os.path.join(datadir, 'data.h5')).name == 'hdf5'
+    assert find_backend(os.path.join(datadir, 'data.tif')).name == 'tiff'
+    assert find_backend(os.path.join(datadir, 'png')).name == 'images'
+    assert find_backend(os.path.join(datadir, 'png', '000.png')).name == 'image'
+
+    fpath = os.path.join(tmpdir, 'data.dat')
+    with open(fpath, 'wb') as f:
+        np.save(f, data)
+    assert find_backend(fpath).name == 'npy'
+    assert np.all(get_backend('npy').load(fpath) == data)
+
+    # New files are identified by extension, path, or protocol.
+    assert find_backend(os.path.join(tmpdir, 'out.h5'), mode='save').name == 'hdf5'
+    assert find_backend(os.path.join(tmpdir, 'out.TIFF'), mode='save').name == 'tiff'
+    assert find_backend(os.path.join(tmpdir, 'out'), mode='save').name == 'images'
+    assert find_backend('file://' + tmpdir, mode='save').name == 'cloudvolume'
+    assert find_backend(os.path.join(tmpdir, 'out.foo'), mode='save').name == 'image'
+
+    assert 'mmap' in get_backend('tiff').capabilities
+    assert 'parallel-write' in get_backend('cloudvolume').capabilities
+
+
+def test_register_backend(tmpdir):
+    tmpdir = str(tmpdir)
+    data = np.random.randint(0, high=256, size=(10, 20), dtype=np.uint8)
+
+    def load_txt(path, dtype=np.uint8):
+        return np.loadtxt(path, dtype=dtype)
+
+    def save_txt(img, path):
+        np.savetxt(path, img, fmt='%d')
+
+    register_backend(IOBackend('txt', load=load_txt, save=save_txt,
+                               extensions=['.TXT']))
+    try:
+        fpath = os.path.join(tmpdir, 'data.txt')
+        assert find_backend(fpath, mode='save').name == 'txt'
+        get_backend('txt').save(data, fpath)
+        assert find_backend(fpath).name == 'txt'
+        assert np.all(get_backend('txt').load(fpath) == data)
+    finally:
+        unregister_backend('txt')
+
+    # Later registrations take precedence over earlier ones.
+    register_backend(IOBackend('npy-override', load=load_npy,
+                               extensions=['npy']))
+    try:
+        assert find_backend('data.npy').name == 'npy-override'
+        assert find_backend('data.npy', mode='save').name == 'npy'
+    finally:
+        unregister_backend('npy-override')
+    assert find_backend('data.npy').name == 'npy'
+
+    with pytest.raises(UnknownBackendError):
+        get_backend('txt')
+
+    with pytest.raises(UnknownBackendError):
+        unregister_backend('txt')
+
+    with pytest.raises(InvalidCapabilityError):
+        IOBackend('foo', capabilities=['teleport'])
+
+
+def test_lazy_imports():
+    """Importing florin.io should not import any format dependencies."""
+    code = ('import sys; import florin.io; '
+            'print(",".join(m for m in ["h5py", "cloudvolume", "mpi4py", '
+            '"skimage.io", "tifffile"] if m in sys.modules))')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.decode().strip() == ''
+
+
 def test_load_hdf5(load_setup):
     data, tmpdir = load_setup
 
     loaded = load_hdf5(os.path.join(tmpdir, 'data.h5'))
-    assert isinstance(loaded, h5py.Dataset)
-    assert np.all(loaded[:] == data)
+    assert isinstance(loaded, np.ndarray)
+    assert np.all(loaded == data)
 
     loaded = load_hdf5(os.path.join(tmpdir, 'data.h5'), key='foo')
-    assert isinstance(loaded, h5py.Dataset)
-    assert np.all(loaded[:] == data[:])
+    assert isinstance(loaded, np.ndarray)
+    assert np.all(loaded == data)
+
+    loaded = load_hdf5(os.path.join(tmpdir, 'data.h5'), key='foo',
+                       keep_alive=True)
+    assert isinstance(loaded, HDF5Dataset)
+    assert np.all(loaded[:] == data)
+    loaded.close()
+
+
+def _read_hdf5_dataset(args):
+    dset, i = args
+    return dset[i].sum(), len(file_pool())
+
+
+def test_hdf5_dataset(load_setup, tmpdir):
+    data, datadir = load_setup
+    fpath = os.path.join(datadir, 'data.h5')
+    pool = file_pool()
+
+    # Repeated loads of the same file reuse a single handle.
+    pool.close()
+    loaded = load_hdf5(fpath)
+    assert isinstance(loaded, np.ndarray)
+    assert np.all(loaded == data)
+    f = pool.get(fpath)
+    assert np.all(load_hdf5(fpath, key='foo') == data)
+    assert pool.get(fpath) is f
+    assert len(pool) == 1
+
+    with load_hdf5(fpath, keep_alive=True) as dset:
+        assert isinstance(dset, HDF5Dataset)
+        assert dset.file_object is f
+        assert dset.shape == data.shape
+        assert dset.dtype == data.dtype
+        assert np.all(dset[10:20, 5] == data[10:20, 5])
+        assert np.all(np.asarray(dset) == data)
+
+        # Handles survive the pool closing the file out from under them.
+        pool.close(fpath)
+        assert not f.id.valid
+        assert np.all(dset[3] == data[3])
+    assert dset.closed
+    with pytest.raises(ValueError):
+        dset[0]
+
+    # Handles are reopened when unpickled or used after a fork.
+    dset = load_hdf5(fpath, keep_alive=True)
+    copied = pickle.loads(pickle.dumps(dset))
+    assert np.all(copied[5] == data[5])
+    copied.close()
+    del copied
+    gc.collect()
+
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(2) as workers:
+        results = workers.map(_read_hdf5_dataset,
+                              [(dset, i) for i in range(4)])
+    for i, (total, nopen) in enumerate(results):
+        assert total == data[i].sum()
+        assert nopen == 1
+    dset.close()
+
+    # Saving closes the file, releasing its lock for other processes.
+    fpath = os.path.join(str(tmpdir), 'data.h5')
+    save_hdf5(data, fpath)
+    assert fpath not in pool
+    code = ('import h5py, sys; f = h5py.File(sys.argv[1], "r"); '
+            'print(f["stack"].shape)')
+    out = subprocess.check_output([sys.executable, '-c', code, fpath])
+    assert out.decode().strip() == str(data.shape)
+
+    # Writable handles reopen read-only files for writing, and close them
+    # when done.
+    assert pool.get(fpath).mode == 'r'
+    with load_hdf5(fpath, keep_alive=True, mode='r+') as dset:
+        assert dset.file_object.mode == 'r+'
+        dset[0] = 0
+    assert fpath not in pool
+    assert np.all(load_hdf5(fpath)[0] == 0)
+
+
+def test_hdf5_file_pool(save_setup, tmpdir):
+    data = save_setup[:5]
+    tmpdir = str(tmpdir)
+
+    paths = [os.path.join(tmpdir, '{}.h5'.format(i)) for i in range(4)]
+    for path in paths:
+        save_hdf5(data, path)
+    file_pool().close()
+
+    pool = HDF5FilePool(max_open=2)
+    files = [pool.get(path) for path in paths[:2]]
+    assert len(pool) == 2
+
+    # The least recently used file is closed first.
+    pool.get(paths[0])
+    pool.get(paths[2])
+    assert len(pool) == 2
+    assert paths[0] in pool and paths[2] in pool
+    assert not files[1].id.valid
+
+    # Files with outstanding references are kept open over unreferenced ones.
+    pool.acquire(paths[0])
+    pool.get(paths[2])
+    pool.get(paths[3])
+    assert paths[0] in pool and paths[3] in pool
+    pool.release(paths[0])
+
+    pool.close()
+    assert len(pool) == 0
+    assert not files[0].id.valid
 
 
 def test_load_image(load_setup):
@@ -109,6 +316,58 @@ def test_load_npy(load_setup):
     assert np.all(loaded == data)
 
 
+def test_load_zarr(load_setup):
+    data, tmpdir = load_setup
+
+    for ext in ['zarr', 'n5']:
+        fpath = os.path.join(tmpdir, 'data.' + ext)
+        assert find_backend(fpath).name == 'zarr'
+
+        loaded = load_zarr(fpath)
+        assert isinstance(loaded, np.ndarray)
+        assert np.all(loaded == data)
+
+        loaded = load_zarr(fpath, lazy=True)
+        assert isinstance(loaded, zarr.Array)
+        assert np.all(loaded[5:10, 20:] == data[5:10, 20:])
+
+
+def _save_zarr_tile(args):
+    tile, path, origin = args
+    save_zarr(tile, path, origin=origin)
+
+
+def test_save_zarr(save_setup, tmpdir):
+    data = save_setup
+    tmpdir = str(tmpdir)
+
+    for ext in ['zarr', 'n5']:
+        fpath = os.path.join(tmpdir, 'data.' + ext)
+        assert find_backend(fpath, mode='save').name == 'zarr'
+        save_zarr(data, fpath, chunks=(10, 100, 100))
+        saved = open_zarr(fpath)
+        assert saved.chunks == (10, 100, 100)
+        assert np.all(saved[:] == data)
+
+        fpath = os.path.join(tmpdir, 'group.' + ext)
+        save_zarr(data, fpath, key='foo')
+        save_zarr(data[::-1], fpath, key='stack')
+        assert np.all(load_zarr(fpath, key='foo') == data)
+        assert np.all(load_zarr(fpath) == data[::-1])
+
+        # Chunk-aligned tiles may be written by separate processes at once.
+        fpath = os.path.join(tmpdir, 'tiles.' + ext)
+        open_zarr(fpath, mode='w', shape=data.shape, dtype=data.dtype,
+                  chunks=(10, 150, 150))
+        tiles = [(data[i:i + 10, j:j + 150, k:k + 150], fpath, (i, j, k))
+                 for i in range(0, 100, 10)
+                 for j in range(0, 300, 150)
+                 for k in range(0, 300, 150)]
+        with Pool(4) as pool:
+            pool.map(_save_zarr_tile, tiles)
+        assert np.all(load_zarr(fpath) == data)
+
+
 def test_load_tiff(load_setup):
     data, tmpdir = load_setup
 
@@ -118,6 +377,28 @@ def test_load_tiff(load_setup):
     loaded = load_tiff(os.path.join(tmpdir, 'data.tiff'))
     assert np.all(loaded == data)
 
+    # Uncompressed, contiguous stacks are memory-mapped when loaded lazily.
+    with load_tiff(os.path.join(tmpdir, 'data.tif'), lazy=True) as loaded:
+        assert isinstance(loaded, TiffStack)
+        assert loaded.memmapped
+        assert loaded.shape == data.shape
+        assert np.all(loaded[3] == data[3])
+        assert np.all(loaded[10:20:3, 5:50, ::2] == data[10:20:3, 5:50, ::2])
+
+    # Compressed stacks are read page-by-page on access.
+    fpath = os.path.join(tmpdir, 'compressed.tif')
+    tifffile.imwrite(fpath, data, compression='zlib')
+    with load_tiff(fpath, lazy=True) as loaded:
+        assert not loaded.memmapped
+        assert loaded.shape == data.shape
+        assert loaded.dtype == data.dtype
+        assert len(loaded) == data.shape[0]
+        assert np.all(loaded[-1] == data[-1])
+        assert np.all(loaded[7, 5:50] == data[7, 5:50])
+        assert np.all(loaded[10:20:3, 5:50, ::2] == data[10:20:3, 5:50, ::2])
+        assert np.all(loaded[[4, 1], ..., 3] == data[[4, 1], ..., 3])
+        assert np.all(np.asarray(loaded) == data)
+
 
 def test_save(save_setup, tmpdir):
     data = save_setup
@@ -175,6 +456,52 @@ def test_save(save_setup, tmpdir):
         assert np.all(saved == data[i])
 
 
+def test_save_cloudvolume(tmpdir, monkeypatch):
+    tmpdir = str(tmpdir)
+
+    # Image layers are mean pooled at each MIP level.
+    data = np.random.randint(0, high=256, size=(32, 48, 40), dtype=np.uint8)
+    fpath = 'file://' + os.path.join(tmpdir, 'image')
+    save_cloudvolume(data, fpath, mode='image', mip=2, chunk_size=(16, 16, 8))
+    assert os.path.isfile(os.path.join(tmpdir, 'image', 'info'))
+
+    expected = data
+    for m in range(3):
+        cv = CloudVolume(fpath, mip=m, progress=False)
+        saved = np.transpose(cv[:, :, :][..., 0], axes=(2, 1, 0))
+        assert saved.shape == expected.shape
+        assert np.all(saved == expected)
+        z, y, x = expected.shape
+        expected = expected.reshape(z // 2, 2, y // 2, 2, x // 2, 2)
+        expected = np.round(expected.mean(axis=(1, 3, 5))).astype(np.uint8)
+
+    # Segmentation layers are mode pooled, and tiles written at an origin
+    # land in the right place.
+    labels = np.zeros((16, 16, 16), dtype=np.uint32)
+    labels[:8] = 7
+    labels[::2, ::2, ::2] = 3
+    fpath = 'file://' + os.path.join(tmpdir, 'segmentation')
+    save_cloudvolume(labels[:8], fpath, mode='segmentation', mip=1,
+                     volume_size=(16, 16, 16), chunk_size=(8, 8, 8))
+    save_cloudvolume(labels[8:], fpath, mode='segmentation', mip=1,
+                     origin=(8, 0, 0))
+
+    cv = CloudVolume(fpath, mip=0, progress=False)
+    saved = np.transpose(cv[:, :, :][..., 0], axes=(2, 1, 0))
+    assert np.all(saved == labels)
+
+    cv = CloudVolume(fpath, mip=1, progress=False)
+    saved = np.transpose(cv[:, :, :][..., 0], axes=(2, 1, 0))
+    assert np.all(saved[:4] == 7)
+    assert np.all(saved[4:] == 0)
+
+    # Relative paths refer to the same layer when saving and loading.
+    monkeypatch.chdir(tmpdir)
+    save_cloudvolume(data, 'relative', chunk_size=(16, 16, 8))
+    cv = load_cloudvolume('relative')
+    assert cv.cloudpath == 'file://' + os.path.join(tmpdir, 'relative')
+
+
 def test_save_hdf5(save_setup, tmpdir):
     data = save_setup
     tmpdir = str(tmpdir)
@@ -249,3 +576,22 @@ def test_save_tiff(save_setup, tmpdir):
     assert os.path.isfile(fpath)
     saved = imread(fpath)
     assert np.all(saved == data)
+    with tifffile.TiffFile(fpath) as f:
+        assert not f.is_bigtiff
+
+    # Streamed pages are appended one at a time to a BigTIFF stack.
+    fpath = os.path.join(tmpdir, 'streamed.tif')
+    save_tiff((data[i:i + 10] for i in range(0, data.shape[0], 10)), fpath)
+    with tifffile.TiffFile(fpath) as f:
+        assert f.is_bigtiff
+    with load_tiff(fpath, lazy=True) as saved:
+        assert saved.memmapped
+        assert np.all(saved[:] == data)
+
+    fpath = os.path.join(tmpdir, 'appended.tif')
+    with TiffStackWriter(fpath) as writer:
+        for i in range(data.shape[0]):
+            writer.write(data[i])
+        assert writer.pages == data.shape[0]
+    saved = load_tiff(fpath)
+    assert np.all(saved == data)
@@ -0,0 +1,87 @@
+"""Unit tests for FLoRIN logging."""
+
+import logging
+
+import numpy as np
+import pytest
+
+from florin.closure import florinate
+from florin.log_utils import FlorinLogger, logger
+from florin.pipelines import SerialPipeline
+
+
+@florinate
+def double(x):
+    return x * 2
+
+
+@pytest.fixture
+def records():
+    """Capture the records logged to the 'florin' logger."""
+    class Collect(logging.Handler):
+        def __init__(self):
+            super(Collect, self).__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record.getMessage())
+
+    handler = Collect()
+    logger.logger.addHandler(handler)
+    quiet, summary_mode, sample = \
+        logger.quiet, logger.summary_mode, logger.sample
+    yield handler.records
+    logger.logger.removeHandler(handler)
+    logger.quiet, logger.summary_mode, logger.sample = \
+        quiet, summary_mode, sample
+
+
+def test_quiet(records):
+    logger.quiet = False
+    SerialPipeline(double()).run([np.ones(2)])
+    assert any(['Function double: running time' in r for r in records])
+
+    del records[:]
+    logger.quiet = True
+    assert logger.quiet and not logger.enabled
+    SerialPipeline(double()).run([np.ones(2)])
+    assert records == []
+
+    logger.verbose()
+    assert not logger.quiet
+
+
+def test_propagate(records, caplog):
+    # Records still reach handlers set up by the application.
+    logger.quiet = False
+    logger.info('hello %s', 'world')
+    assert 'hello world' in caplog.messages
+
+
+def test_sample(records):
+    logger.quiet = False
+    logger.sample = 3
+    SerialPipeline(double()).run([np.ones(2)] * 7)
+    assert len([r for r in records if 'Function double' in r]) == 3
+
+
+def test_summary(records):
+    logger.quiet = False
+    logger.summary_mode = True
+    SerialPipeline(double()).run([np.ones(2)] * 5)
+    assert records == []
+
+    summary = logger.summary()
+    assert summary['double']['calls'] == 5
+    assert summary['double']['max'] <= summary['double']['total']
+    assert any(['Function double: 5 calls' in r for r in records])
+    assert logger.summary() == {}
+
+
+def test_background_handler(capsys):
+    log = FlorinLogger()
+    log.info('%s %d', 'hello', 1)
+    log.handler.flush()
+    assert 'florin : hello 1' in capsys.readouterr().out
+    log.logger.removeHandler(log.handler)
+    log.handler.close()
@@ -0,0 +1,500 @@
+"""Unit tests for FLoRIN pipelines."""
+
+import inspect
+
+import numpy as np
+import pytest
+
+from florin.closure import florinate
+from florin.pipelines import (AsyncPipeline, BalsamPipeline,
+                              MultiprocessingPipeline, MultithreadingPipeline,
+                              SerialPipeline, WorkQueuePipeline)
+from florin.pipelines.pipeline import bounded_imap
+from florin.tiling import join, tile
+
+
+@florinate
+def square(x):
+    return x ** 2
+
+
+def test_bounded_imap():
+    from concurrent.futures import Future
+
+    submitted = []
+
+    def submit(item):
+        submitted.append(item)
+        future = Future()
+        future.set_result(item * 2)
+        return future
+
+    def items():
+        for i in range(10):
+            # No more than ``window`` items are drawn ahead of the consumer.
+            assert len(submitted) - len(results) <= 3
+            yield i
+
+    results = []
+    for r in bounded_imap(submit, items(), 3):
+        results.append(r)
+    assert results == [2 * i for i in range(10)]
+
+    results = []
+    del submitted[:]
+    for r in bounded_imap(submit, items(), 3, ordered=False):
+        results.append(r)
+    assert sorted(results) == [2 * i for i in range(10)]
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (SerialPipeline, {}),
+    (MultithreadingPipeline, {'threads': 2}),
+    (MultiprocessingPipeline, {'processes': 2}),
+    (AsyncPipeline, {'threads': 2}),
+])
+def test_stream(pipeline, kwargs):
+    p = pipeline(square(), stream=True, window=2, **kwargs)
+    result = p(list(range(10)))
+    assert inspect.isgenerator(result)
+    assert list(result) == [i ** 2 for i in range(10)]
+
+    p = pipeline(square(), **kwargs)
+    assert p(list(range(10))) == [i ** 2 for i in range(10)]
+    assert sorted(p.imap(range(10), ordered=False)) == \
+        [i ** 2 for i in range(10)]
+
+
+def test_stream_window():
+    @florinate
+    def identity(x):
+        return x
+
+    drawn = []
+
+    def items():
+        for i in range(20):
+            drawn.append(i)
+            yield i
+
+    p = MultithreadingPipeline(identity(), threads=4, stream=True, window=3)
+    for i, result in enumerate(p(items())):
+        assert result == i
+        assert len(drawn) <= i + 3
+
+
+def test_stream_join():
+    data = np.random.rand(8, 8, 8)
+    p = SerialPipeline(
+        tile(shape=(4, 4, 4)),
+        MultithreadingPipeline(square(), threads=2, stream=True),
+        join())
+    assert np.allclose(p(data)[0], data ** 2)
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (MultithreadingPipeline, {'threads': 2}),
+    (MultiprocessingPipeline, {'processes': 2}),
+    (AsyncPipeline, {'threads': 2}),
+])
+def test_persistent_pool(pipeline, kwargs):
+    import dill
+
+    with pipeline(square(), **kwargs) as p:
+        assert p(list(range(4))) == [0, 1, 4, 9]
+        pool = p._pool
+        assert pool is not None
+        assert list(p.imap(range(4))) == [0, 1, 4, 9]
+        assert p._pool is pool
+
+        # Pools are not pickled along with the pipeline.
+        copy = dill.loads(dill.dumps(p))
+        assert copy._pool is None
+        assert copy(list(range(3))) == [0, 1, 4]
+        copy.close()
+    assert p._pool is None
+
+    # Closed pipelines start a new pool when run again.
+    assert p(list(range(2))) == [0, 1]
+    assert p._pool is not None
+    p.close()
+
+
+def test_async_limits():
+    import asyncio
+    import threading
+    import time
+
+    lock = threading.Lock()
+    running = {'load': 0, 'compute': 0}
+    peak = {'load': 0, 'compute': 0}
+
+    def enter(name):
+        with lock:
+            running[name] += 1
+            peak[name] = max(peak[name], running[name])
+
+    def leave(name):
+        with lock:
+            running[name] -= 1
+
+    @florinate
+    async def load(x):
+        enter('load')
+        await asyncio.sleep(0.01)
+        leave('load')
+        return np.full(4, x)
+
+    @florinate
+    def compute(x):
+        enter('compute')
+        time.sleep(0.005)
+        leave('compute')
+        return x.sum()
+
+    with AsyncPipeline(load(), compute(), limits={'load': 5, 'compute': 2},
+                       threads=8) as p:
+        assert p.run(list(range(20))) == [4 * i for i in range(20)]
+    assert peak['load'] == 5
+    assert peak['compute'] == 2
+
+
+def test_async_join():
+    data = np.random.rand(8, 8, 8)
+    p = SerialPipeline(
+        tile(shape=(4, 4, 4)),
+        AsyncPipeline(square(), concurrency=2),
+        join())
+    assert np.allclose(p(data)[0], data ** 2)
+    p.close()
+
+
+def test_shared_memory(tmpdir):
+    import os
+
+    from florin.pipelines.sharedmem import SharedArray, share, unshare
+
+    data = np.random.rand(32, 32, 32)
+    shared, created = share((data, {'origin': (0, 0, 0)}),
+                            directory=str(tmpdir))
+    assert isinstance(shared[0], SharedArray)
+    assert shared[1] == {'origin': (0, 0, 0)}
+    assert len(created) == 1
+
+    arr = unshare(shared, unlink=True)[0]
+    assert np.all(arr == data)
+    assert not os.path.exists(created[0].path)
+
+    # Small arrays are pickled as usual.
+    shared, created = share(data, threshold=data.nbytes + 1)
+    assert shared is data
+    assert created == []
+
+    p = SerialPipeline(
+        tile(shape=(16, 16, 16)),
+        MultiprocessingPipeline(square(), processes=2, shared_memory=True,
+                                shared_threshold=0,
+                                scratch_dir=str(tmpdir)),
+        join())
+    assert np.allclose(p(data)[0], data ** 2)
+    assert len(tmpdir.listdir()) == 0
+
+
+MPI_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+
+from collections.abc import Sequence
+
+import numpy as np
+from mpi4py import MPI
+
+import florin
+from florin.closure import florinate
+from florin.pipelines import MPITaskQueuePipeline
+
+florin.logger.quiet = True
+comm = MPI.COMM_WORLD
+
+
+class Tracked(Sequence):
+    # Sequence that records which items each rank reads.
+    def __init__(self, n):
+        self.n = n
+        self.read = []
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        self.read.append(i)
+        return i
+
+
+@florinate
+def square(x):
+    return x ** 2
+
+
+data = Tracked(20)
+for batch_size in [1, 3]:
+    p = MPITaskQueuePipeline(square(), batch_size=batch_size)
+    results = p(data)
+    gathered = comm.gather((list(data.read), results), root=0)
+    if comm.Get_rank() == 0:
+        assert gathered[0] == ([], [])
+        indices = sorted(i for read, _ in gathered for i in read)
+        assert indices == list(range(20)), indices
+        for read, res in gathered:
+            assert res == [i ** 2 for i in read]
+    data.read = []
+
+p = MPITaskQueuePipeline(square(), batch_size=2)
+results = p(i for i in range(10))
+gathered = comm.gather(results, root=0)
+if comm.Get_rank() == 0:
+    assert sorted(r for res in gathered for r in res) == \\
+        [i ** 2 for i in range(10)]
+
+for gather in ['root', 'all']:
+    p = MPITaskQueuePipeline(square(), gather=gather)
+    results = p(list(range(10)))
+    if gather == 'all' or comm.Get_rank() == 0:
+        assert results == [i ** 2 for i in range(10)]
+    else:
+        assert results == []
+
+# Hybrid: every rank, the master included, runs a local thread pool.
+for threads in [2, 'auto']:
+    p = MPITaskQueuePipeline(square(), threads=threads)
+    results = p(list(range(100)))
+    gathered = comm.gather(results, root=0)
+    if comm.Get_rank() == 0:
+        assert sorted(r for res in gathered for r in res) == \\
+            [i ** 2 for i in range(100)]
+    results = MPITaskQueuePipeline(square(), threads=threads, batch_size=2,
+                                   gather='root')(i for i in range(30))
+    if comm.Get_rank() == 0:
+        assert results == [i ** 2 for i in range(30)]
+    p.close()
+
+data = np.arange(16 ** 3, dtype=np.float64).reshape(16, 16, 16)
+for out in [None, {out!r}]:
+    p = florin.Serial(
+        florin.tile(shape=(8, 8, 8)),
+        MPITaskQueuePipeline(square()),
+        florin.mpi_join(out=out, all_ranks=(out is None)))
+    joined = p(data)[0]
+    if out is None or comm.Get_rank() == 0:
+        assert np.all(joined[...] == data ** 2)
+    else:
+        assert joined is None
+
+if comm.Get_rank() == 0:
+    print('ok')
+"""
+
+
+MPI_SPAWN_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+
+from florin.closure import florinate
+from florin.pipelines import MPIPipeline
+
+
+@florinate
+def square(x):
+    return x ** 2
+
+
+if __name__ == '__main__':
+    for threads, kind in [(None, 'thread'), (2, 'thread'), ('auto', 'thread'),
+                          (2, 'process')]:
+        p = MPIPipeline(square(), max_workers=2, threads=threads,
+                        local_pool=kind, batch_size=2)
+        assert p(list(range(11))) == [i ** 2 for i in range(11)]
+        assert sorted(p.imap(iter(range(7)), ordered=False)) == \\
+            [i ** 2 for i in range(7)]
+        p.close()
+    print('ok')
+"""
+
+
+MPI_RUN_SCRIPT = """
+import os
+import sys
+import tempfile
+sys.path.insert(0, {root!r})
+
+from mpi4py import MPI
+import numpy as np
+
+from florin.closure import florinate
+from florin.io import load_zarr
+from florin.pipelines import SerialPipeline
+from florin.run import main
+
+
+@florinate
+def double(x, calls=None):
+    # Record every call, on any rank.
+    os.close(tempfile.mkstemp(dir=calls)[0])
+    return x * 2
+
+
+comm = MPI.COMM_WORLD
+data = np.arange(8 * 8 * 8, dtype=np.float64).reshape(8, 8, 8)
+volume = os.path.join({tmpdir!r}, 'volume.npy')
+pipeline = os.path.join({tmpdir!r}, 'pipeline.json')
+calls = os.path.join({tmpdir!r}, 'calls')
+out = os.path.join({tmpdir!r}, 'out.zarr')
+if comm.Get_rank() == 0:
+    os.mkdir(calls)
+    np.save(volume, data)
+    with open(pipeline, 'w') as f:
+        SerialPipeline(double(calls=calls)).dump(f)
+comm.Barrier()
+
+main([pipeline, volume, '--tile-shape', '4,4,4', '--backend', 'mpi',
+      '--memory', '1M', '--output', out])
+comm.Barrier()
+
+# The tile measured for the memory budget is not run again.
+if comm.Get_rank() == 0:
+    assert len(os.listdir(calls)) == 8, len(os.listdir(calls))
+    assert np.all(load_zarr(out) == data * 2)
+    print('ok')
+"""
+
+
+def test_mpi_task_queue(tmpdir):
+    import os
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = tmpdir.join('task_queue.py')
+    script.write(MPI_SCRIPT.format(root=root,
+                                   out=str(tmpdir.join('out.zarr'))))
+    run_mpi(script, 3)
+
+
+def test_mpi_spawn(tmpdir):
+    import os
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = tmpdir.join('spawn.py')
+    script.write(MPI_SPAWN_SCRIPT.format(root=root))
+    run_mpi(script, 1)
+
+
+def test_mpi_run_memory(tmpdir):
+    import os
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = tmpdir.join('run.py')
+    script.write(MPI_RUN_SCRIPT.format(root=root, tmpdir=str(tmpdir)))
+    run_mpi(script, 3)
+
+
+def run_mpi(script, ranks):
+    """Run a script as an MPI job, checking that it prints 'ok'."""
+    import os
+    import shutil
+    import subprocess
+    import sys
+
+    pytest.importorskip('mpi4py')
+    mpiexec = shutil.which('mpiexec')
+    if mpiexec is None:
+        pytest.skip('mpiexec is not available')
+
+    # Leave out variables set if MPI was initialized in this process, which
+    # would otherwise be picked up by the new MPI job.
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(('OMPI_', 'PMIX_'))}
+    env.update(OMPI_ALLOW_RUN_AS_ROOT='1',
+               OMPI_ALLOW_RUN_AS_ROOT_CONFIRM='1',
+               OMPI_MCA_rmaps_base_oversubscribe='1')
+    out = subprocess.run([mpiexec, '-n', str(ranks), sys.executable,
+                          str(script)],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         env=env, timeout=60)
+    assert out.returncode == 0, out.stdout.decode()
+    assert out.stdout.decode().strip().endswith('ok')
+
+
+@pytest.mark.parametrize('pipeline', [BalsamPipeline, WorkQueuePipeline])
+def test_task_farm(pipeline):
+    with pipeline(square(), workers=2, batch_size=3) as p:
+        assert p(list(range(10))) == [i ** 2 for i in range(10)]
+        assert sorted(p.imap((i for i in range(10)), ordered=False)) == \
+            [i ** 2 for i in range(10)]
+
+        # Abandoned streams do not leak results into later runs.
+        stream = p.imap(range(10))
+        assert next(stream) == 0
+        stream.close()
+        assert p(list(range(4))) == [0, 1, 4, 9]
+
+
+def test_task_farm_retries(tmpdir):
+    import os
+
+    from florin.pipelines.taskfarm import TaskFailedError
+
+    @florinate
+    def flaky(x, path=None, crash=False):
+        # Fail the first time each item is seen.
+        marker = os.path.join(path, str(x))
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            if crash:
+                os._exit(1)
+            raise RuntimeError('failed on {}'.format(x))
+        return x
+
+    p = WorkQueuePipeline(flaky(path=str(tmpdir)), workers=2, retries=1)
+    assert p(list(range(6))) == list(range(6))
+    p.close()
+
+    # Worker processes that die are replaced. One task is blamed for each
+    # crash, which may not be the one that crashed, so allow a retry per
+    # crash.
+    for _ in range(3):
+        tmpdir.remove()
+        tmpdir.mkdir()
+        p = WorkQueuePipeline(flaky(path=str(tmpdir), crash=True), workers=2,
+                              retries=6)
+        assert p(list(range(6))) == list(range(6))
+        p.close()
+
+    # Tasks that always crash a worker fail once out of retries.
+    p = WorkQueuePipeline(florinate(os._exit)(), workers=2, retries=2)
+    with pytest.raises(TaskFailedError, match='BrokenProcessPool'):
+        p([1, 2, 3])
+    p.close()
+
+    tmpdir.remove()
+    tmpdir.mkdir()
+    p = WorkQueuePipeline(flaky(path=str(tmpdir)), workers=2, retries=0)
+    with pytest.raises(TaskFailedError):
+        p(list(range(6)))
+    p.close()
+
+
+def test_task_farm_worker(tmpdir):
+    import dill
+
+    from florin.pipelines.taskfarm import main
+
+    p = SerialPipeline(square())
+    graph, task, result = [str(tmpdir.join(f))
+                           for f in ['graph.pkl', 'task.pkl', 'result.pkl']]
+    with open(graph, 'wb') as f:
+        dill.dump(p.operations, f)
+    with open(task, 'wb') as f:
+        dill.dump([(3, 3), (4, 5)], f)
+
+    main(graph, task, result)
+    with open(result, 'rb') as f:
+        assert dill.load(f) == [(3, 9), (4, 25)]
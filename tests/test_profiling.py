@@ -0,0 +1,97 @@
+"""Unit tests for profiling pipeline runs."""
+
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from florin.closure import florinate
+from florin.pipelines import (MultiprocessingPipeline, MultithreadingPipeline,
+                              SerialPipeline)
+from florin.profiling import active, Profiler
+from florin.tiling import tile
+
+
+@florinate
+def double(x):
+    return x * 2
+
+
+@florinate
+def total(x):
+    return x.sum()
+
+
+def test_profiler_disabled():
+    profiler = Profiler()
+    SerialPipeline(double()).run([np.ones(4)])
+    assert active() is None
+    assert profiler.events == []
+
+    with profiler:
+        assert active() is profiler
+        with Profiler() as inner:
+            assert active() is inner
+        assert active() is profiler
+    assert active() is None
+
+
+@pytest.mark.parametrize('pipeline,kwargs', [
+    (SerialPipeline, {}),
+    (MultithreadingPipeline, {'threads': 2}),
+    (MultiprocessingPipeline, {'processes': 2}),
+    (MultiprocessingPipeline, {'processes': 2, 'shared_memory': True,
+                               'shared_threshold': 0}),
+])
+def test_profile(pipeline, kwargs):
+    data = [np.ones((4, 4)) for _ in range(3)]
+    with pipeline(double(), total(), **kwargs) as p:
+        result, profiler = p.profile(data)
+    assert [float(r) for r in result] == [32.0] * 3
+
+    summary = profiler.summary()
+    assert summary['node']['double']['calls'] == 3
+    assert summary['node']['double']['bytes_in'] == 3 * 128
+    assert summary['node']['double']['bytes_out'] == 3 * 128
+    assert summary['node']['total']['calls'] == 3
+    assert summary['pipeline'][pipeline.__name__]['calls'] == 3
+
+    stats = summary['node']['double']
+    assert 0 <= stats['p50'] <= stats['p90'] <= stats['p99'] <= stats['max']
+    assert stats['total'] == pytest.approx(3 * stats['mean'])
+
+
+def test_profile_subpipeline():
+    p = SerialPipeline(tile(shape=(2, 2)), MultithreadingPipeline(double()))
+    _, profiler = p.profile([np.ones((4, 4))])
+    summary = profiler.summary()
+    assert summary['node']['double']['calls'] == 4
+    assert summary['node']['MultithreadingPipeline']['calls'] == 1
+    assert summary['pipeline']['MultithreadingPipeline']['calls'] == 4
+    assert summary['pipeline']['SerialPipeline']['calls'] == 1
+
+
+def test_profiler_export(tmpdir):
+    _, profiler = SerialPipeline(double(), total()).profile([np.ones(4)] * 2)
+    n = len(profiler.events)
+
+    profiler.to_json(str(tmpdir.join('profile.json')))
+    with open(str(tmpdir.join('profile.json'))) as f:
+        report = json.load(f)
+    assert report['summary']['node']['total']['calls'] == 2
+    assert len(report['events']) == n
+
+    profiler.to_csv(str(tmpdir.join('profile.csv')))
+    with open(str(tmpdir.join('profile.csv'))) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == n and rows[0]['category'] == 'node'
+
+    profiler.to_chrome_trace(str(tmpdir.join('trace.json')))
+    with open(str(tmpdir.join('trace.json'))) as f:
+        trace = json.load(f)['traceEvents']
+    assert len(trace) == n
+    assert all([e['ph'] == 'X' and e['dur'] >= 0 for e in trace])
+
+    profiler.clear()
+    assert profiler.summary() == {}
@@ -0,0 +1,118 @@
+"""Unit tests for running serialized pipelines from the command line."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from florin.closure import florinate
+from florin.io import load_zarr
+from florin.pipelines import SerialPipeline
+from florin.run import main
+
+
+@florinate
+def scale(x, factor=1):
+    return x * factor
+
+
+@florinate
+def touch(path):
+    with open(path + '.done', 'w') as f:
+        f.write(path)
+    return path
+
+
+@pytest.fixture
+def volume(tmpdir):
+    data = np.arange(8 * 8 * 8, dtype=np.float64).reshape(8, 8, 8)
+    path = str(tmpdir.join('volume.npy'))
+    np.save(path, data)
+    return data, path
+
+
+def dump(pipeline, tmpdir):
+    path = str(tmpdir.join('pipeline.json'))
+    with open(path, 'w') as f:
+        pipeline.dump(f)
+    return path
+
+
+@pytest.mark.parametrize('backend', ['serial', 'threads', 'processes'])
+def test_shards(tmpdir, volume, backend):
+    data, path = volume
+    pipeline = dump(SerialPipeline(scale(factor=2)), tmpdir)
+    out = str(tmpdir.join('out.zarr'))
+
+    for shard in ['0/3', '1/3', '2/3']:
+        main([pipeline, path, '--tile-shape', '4,4,4', '--backend', backend,
+              '--workers', '2', '--shard', shard, '--output', out])
+    assert np.all(load_zarr(out) == data * 2)
+
+
+def test_ragged(tmpdir, volume):
+    data, path = volume
+    pipeline = dump(SerialPipeline(scale(factor=2)), tmpdir)
+    out = str(tmpdir.join('out.zarr'))
+
+    # Tiles clipped at the edges are joined, and the last shard, which
+    # holds the smallest tile, still creates chunks of the tile shape.
+    main([pipeline, path, '--tile-shape', '3,3,3', '--shard', '26/27',
+          '--output', out])
+    main([pipeline, path, '--tile-shape', '3,3,3', '--output', out])
+    assert load_zarr(out, lazy=True).chunks == (3, 3, 3)
+    assert np.all(load_zarr(out) == data * 2)
+
+
+def test_options(tmpdir, volume):
+    data, path = volume
+    pipeline = dump(SerialPipeline(scale(factor=3)), tmpdir)
+    out = str(tmpdir.join('out.zarr'))
+    checkpoint = str(tmpdir.join('ckpt'))
+    profile = str(tmpdir.join('profile.json'))
+
+    main([pipeline, path, '--tile-shape', '4,4,4', '--tiles', '2:6',
+          '--backend', 'threads', '--memory', '1M', '--checkpoint',
+          checkpoint, '--profile', profile, '--output', out])
+    assert len(os.listdir(checkpoint)) == 4
+    with open(profile) as f:
+        assert json.load(f)['summary']['node']['scale']['calls'] == 4
+
+    # Only the tiles from the range were written.
+    expected = np.zeros_like(data)
+    expected[:4, 4:] = data[:4, 4:] * 3
+    expected[4:, :4] = data[4:, :4] * 3
+    assert np.all(load_zarr(out) == expected)
+
+
+def test_resume(tmpdir, volume):
+    data, path = volume
+    pipeline = dump(SerialPipeline(scale(factor=2)), tmpdir)
+    out = str(tmpdir.join('out.zarr'))
+    checkpoint = str(tmpdir.join('ckpt'))
+    args = [pipeline, path, '--tile-shape', '4,4,4', '--output', out]
+
+    # Rerunning, with or without the checkpoint, leaves the output as is.
+    main(args + ['--checkpoint', checkpoint])
+    main(args + ['--checkpoint', checkpoint])
+    assert np.all(load_zarr(out) == data * 2)
+    main(args)
+    assert np.all(load_zarr(out) == data * 2)
+
+
+def test_inputs(tmpdir):
+    paths = [str(tmpdir.join('input{}'.format(i))) for i in range(5)]
+    pipeline = dump(SerialPipeline(touch()), tmpdir)
+
+    main([pipeline] + paths + ['--tiles', '1:', '--shard', '1/2'])
+    assert [os.path.exists(p + '.done') for p in paths] == \
+        [False, False, True, False, True]
+
+
+def test_errors(tmpdir):
+    pipeline = dump(SerialPipeline(scale()), tmpdir)
+    for args in [['--output', 'out.zarr'], ['--shard', '2/2'],
+                 ['--tiles', '5:1'], ['--workers', '0']]:
+        with pytest.raises(SystemExit):
+            main([pipeline, 'input'] + args)
@@ -0,0 +1,143 @@
+"""Unit tests for serializing pipelines."""
+
+import io
+import json
+
+import dill
+import numpy as np
+import pytest
+
+import florin
+from florin import serialization
+from florin.cache import MemoryCache
+from florin.classification import FlorinClassifier
+from florin.closure import florinate
+from florin.pipelines import MultithreadingPipeline, SerialPipeline
+from florin.serialization import SerializationError
+
+
+@florinate
+def scale(x, factor=1):
+    return x * factor
+
+
+@florinate
+def add(x, y):
+    return x + y
+
+
+@florinate
+def count_labels(x, classes=()):
+    return x + len(classes)
+
+
+def roundtrip(obj):
+    return serialization.loads(serialization.dumps(obj))
+
+
+def test_roundtrip():
+    p = SerialPipeline(scale(factor=np.float32(2)), add(np.arange(3)),
+                       batch_size=2)
+    spec = json.loads(serialization.dumps(p))
+    assert spec['florin'] == serialization.FORMAT_VERSION
+
+    # Functions are referenced by import path, not pickled.
+    nodes = spec['pipeline']['graph']['nodes']
+    operations = [node['operation'] for node in nodes]
+    assert all('$import' in op for op in operations)
+    assert '$dill' not in serialization.dumps(p)
+
+    copy = roundtrip(p)
+    assert isinstance(copy, SerialPipeline)
+    assert copy.batch_size == 2
+    assert [n.__name__ for n in copy.operations.nodes] == \
+        [n.__name__ for n in p.operations.nodes]
+    assert len(copy.operations.edges) == len(p.operations.edges)
+    for data in [np.ones(3), [np.zeros(3), np.ones(3)]]:
+        expected = p(data)
+        result = copy(data)
+        assert len(result) == len(expected)
+        for r, e in zip(result, expected):
+            assert np.all(r == e)
+
+
+def test_roundtrip_values(tmpdir):
+    classes = [FlorinClassifier('small', area=(0, 10)),
+               FlorinClassifier('large', area=(10, 100))]
+    p = MultithreadingPipeline(
+        count_labels(classes=classes),
+        SerialPipeline(scale(factor=3)),
+        threads=2, checkpoint=str(tmpdir.join('ckpt')),
+        cache=MemoryCache(max_bytes=1000))
+    copy = roundtrip(p)
+
+    assert copy.threads == 2
+    assert copy.operations.checkpoint.directory == \
+        p.operations.checkpoint.directory
+    assert copy.operations.cache.max_bytes == 1000
+    node = list(copy.operations.nodes)[1]
+    assert [c.bounds for c in node.kwargs['classes']] == \
+        [c.bounds for c in classes]
+    assert np.all(copy([np.ones(2)])[0][0] == 9)
+    p.close()
+    copy.close()
+
+
+def test_batched():
+    from florin.batching import batched
+    from florin.thresholding import ndnt_batch
+
+    p = SerialPipeline(ndnt_batch(shape=(3, 3), threshold=0.3),
+                       batched(scale, stack=True)(factor=2), batch_size=2)
+    spec = serialization.dumps(p)
+    assert '$dill' not in spec
+    copy = roundtrip(p)
+    assert [n.batch for n in copy.operations.nodes] == \
+        [n.batch for n in p.operations.nodes] == [None, 'stack', 'stack']
+
+    imgs = list(np.random.rand(3, 8, 8))
+    for r, e in zip(copy.run(imgs), p.run(imgs)):
+        assert np.all(r == e)
+
+
+def test_closures():
+    offset = 5
+
+    @florinate
+    def shift(x):
+        return x + offset
+
+    p = SerialPipeline(shift(), scale(factor=2), florinate(lambda x: -x)())
+    spec = serialization.dumps(p)
+    assert spec.count('$dill') == 2
+    assert roundtrip(p)([1, 2]) == [-12, -14]
+
+
+def test_graph():
+    p = SerialPipeline(scale(factor=2), add(3))
+    graph = roundtrip(p.operations)
+    assert isinstance(graph, florin.graph.FlorinOrderedMultiDiGraph)
+    assert graph(4) == 11
+
+
+def test_dump_load(tmpdir):
+    p = SerialPipeline(scale(factor=2))
+    for mode in ['', 'b']:
+        path = str(tmpdir.join('pipeline{}.json'.format(mode)))
+        with open(path, 'w' + mode) as f:
+            p.dump(f)
+        with open(path, 'r' + mode) as f:
+            assert SerialPipeline.load(f)([1, 2]) == [2, 4]
+
+    # Pipelines pickled by earlier versions still load.
+    legacy = io.BytesIO(dill.dumps(p))
+    assert SerialPipeline.load(legacy)([3]) == [6]
+
+
+def test_version():
+    spec = json.loads(serialization.dumps(SerialPipeline(scale())))
+    spec['florin'] = serialization.FORMAT_VERSION + 1
+    with pytest.raises(SerializationError):
+        serialization.loads(json.dumps(spec))
+    with pytest.raises(SerializationError):
+        serialization.loads('[]')
@@ -1,8 +1,11 @@
 import inspect
+import pickle
 
 import numpy as np
 import pytest
+import zarr
 
+from florin.context import TileMetadata
 from florin.tiling import tile, tile_generator, join_tiles
 
 
@@ -65,6 +68,44 @@ def test_tile_generator(data):
         assert i == int(np.prod(blocked_shape)) - 1
 
 
+def test_tile_generator_select():
+    class Reads(np.ndarray):
+        # Array that records the origin of every tile read from it.
+        reads = []
+
+        def __getitem__(self, key):
+            Reads.reads.append(tuple(k.start for k in key))
+            return super(Reads, self).__getitem__(key)
+
+    img = np.arange(64).reshape(8, 8).view(Reads)
+    origins = [m['origin'] for _, m in tile_generator(img, shape=(2, 2))]
+    Reads.reads = []
+
+    tiles = list(tile_generator(img, shape=(2, 2), select=slice(3, 12, 4)))
+    assert [m['origin'] for _, m in tiles] == origins[3:12:4]
+    assert Reads.reads == origins[3:12:4]
+
+
+def test_tile_metadata():
+    img = np.zeros((4, 6))
+    metadata = [m for _, m in tile_generator(img, shape=(2, 3))]
+    assert all(isinstance(m, TileMetadata) for m in metadata)
+    assert [m['origin'] for m in metadata] == \
+        [(0, 0), (0, 3), (2, 0), (2, 3)]
+    assert all(type(o) is int for m in metadata for o in m.origin)
+
+    m = metadata[1]
+    assert m.original_shape == m['original_shape'] == (4, 6)
+    assert 'origin' in m and 'other' not in m
+    assert m.get('other') is None
+    assert m == {'origin': (0, 3), 'original_shape': (4, 6)}
+    assert pickle.loads(pickle.dumps(m)) == m
+    with pytest.raises(KeyError):
+        m['other']
+    with pytest.raises(AttributeError):
+        m.other = 1
+
+
 def test_join_tiles(data):
     for key, val in data.items():
         # Ensure that tiling over the whole array doesn't alter anything
@@ -75,3 +116,43 @@ def test_join_tiles(data):
         shape = tuple([5 for _ in range(val.ndim)])
         out = join_tiles(tile_generator(val, shape=shape))
         assert np.all(out == val)
+
+
+def test_join_tiles_zarr(data, tmpdir):
+    val = data['3d']
+    shape = (10, 25, 50)
+
+    z = zarr.array(val, chunks=shape)
+    tiles = list(tile_generator(z, shape='chunks'))
+    assert len(tiles) == 10 * 4 * 2
+    for t, history in tiles:
+        assert t.shape == shape
+
+    fpath = str(tmpdir.join('joined.zarr'))
+    out = join_tiles(tiles, out=fpath)
+    assert isinstance(out, zarr.Array)
+    assert out.chunks == shape
+    assert np.all(out[:] == val)
+    assert np.all(zarr.open_array(fpath, mode='r')[:] == val)
+
+
+def test_tile_generator_ragged(data):
+    val = data['2d']
+    z = zarr.array(val, chunks=(64, 64))
+    tiles = list(tile_generator(z, shape='chunks'))
+    assert [m['origin'] for _, m in tiles] == \
+        [(0, 0), (0, 64), (64, 0), (64, 64)]
+    assert [t.shape for t, _ in tiles] == \
+        [(64, 64), (64, 36), (36, 64), (36, 36)]
+    assert np.all(join_tiles(tiles) == val)
+
+
+def test_join_tiles_chunks(data, tmpdir):
+    val = data['2d']
+    tiles = list(tile_generator(val, shape=(64, 64)))[::-1]
+
+    # The first tile joined is clipped at the edge of the array.
+    fpath = str(tmpdir.join('joined.zarr'))
+    out = join_tiles(tiles, out=fpath, chunks=(64, 64))
+    assert out.chunks == (64, 64)
+    assert np.all(out[:] == val)